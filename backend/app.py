@@ -1,9 +1,19 @@
-from flask import Flask, request, jsonify, send_file
-from flask_cors import CORS
-from chatbot import chatbot_service
-from database import DatabaseHandler
-from ticket_generator import generate_ticket_pdf
+from startup import startup_phase, startup_report, log_startup_report
+
+with startup_phase('imports'):
+    from flask import Flask, request, jsonify, send_file, abort, g, Response
+    from flask_cors import CORS
+    from chatbot import chatbot_service
+    from storage import get_storage
+    from ticket_generator import render_ticket_pdf, ticket_filename, TICKETS_DIR
+    from ticket_cache import ticket_cache, ticket_cache_key
+    from faq_index import faq_index, FAQ_RESCAN_SECONDS
+    from idempotency import get_idempotency_store, IdempotencyConflict, IdempotencyKeyReused
+    from metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, TICKET_RENDER_FAILURES, TICKET_RENDER_SECONDS, render_metrics
+import io
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 
@@ -15,7 +25,54 @@ CORS(app)
 logger = logging.getLogger(__name__)
 
 chatbot = chatbot_service
-db = DatabaseHandler()
+db = get_storage()
+idempotency = get_idempotency_store(db)
+
+if os.getenv('MONGODB_ENSURE_INDEXES', 'true').lower() == 'true':
+    # Run in the background so an unreachable Mongo does not hold up startup
+    threading.Thread(target=db.ensure_indexes, name='ensure-indexes', daemon=True).start()
+    threading.Thread(target=chatbot.sessions.ensure_indexes, name='session-indexes', daemon=True).start()
+
+def reindex_museum_info():
+    faq_index.index_museum_info(db.get_museum_info())
+
+with startup_phase('faq index'):
+    faq_index.index_content_dir()
+# museum_info passages join the index once Mongo answers, without holding up startup
+threading.Thread(target=reindex_museum_info, name='faq-museum-info', daemon=True).start()
+if os.getenv('MUSEUM_INFO_WATCH', 'false').lower() == 'true':
+    db.watch_museum_info(reindex_museum_info)
+if FAQ_RESCAN_SECONDS > 0:
+    faq_index.watch_content_dir(FAQ_RESCAN_SECONDS)
+if chatbot.inventory is not None:
+    chatbot.inventory.start_sweeper()
+
+log_startup_report()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # The route template, not the raw path, keeps label cardinality bounded
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    start = g.get('request_start')
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, route, response.status_code)
+    return response
+
+def timed_render(ticket_data):
+    with TICKET_RENDER_SECONDS.time('inline'):
+        try:
+            return render_ticket_pdf(ticket_data)
+        except Exception:
+            TICKET_RENDER_FAILURES.inc('inline')
+            raise
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -26,8 +83,9 @@ def chat():
             
         user_message = data['message']
         current_state = data.get('currentState', 'greeting')
+        session_id = data.get('sessionId')
         
-        response = chatbot.get_response(user_message, current_state)
+        response = chatbot.get_response(user_message, current_state, session_id)
         return jsonify(response)
         
     except Exception as e:
@@ -42,17 +100,28 @@ def generate_ticket():
     try:
         ticket_data = request.get_json()
         
-        # Generate PDF ticket
-        pdf_path = generate_ticket_pdf(ticket_data)
+        # Serve the cached PDF, rendering it in memory on a miss
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            # A retried download replays the first PDF, on this worker or another, but only for the same ticket
+            pdf_bytes = idempotency.run('ticket', idempotency_key,
+                                        lambda: ticket_cache.get_or_render(ticket_data, timed_render),
+                                        ticket_cache_key(ticket_data))
+        else:
+            pdf_bytes = ticket_cache.get_or_render(ticket_data, timed_render)
         
-        # Send the PDF file
+        # Stream the PDF bytes straight back
         return send_file(
-            pdf_path,
+            io.BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f"museum-ticket-{ticket_data['booking_ref']}.pdf"
+            download_name=ticket_filename(ticket_data['booking_ref'])
         )
         
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except IdempotencyKeyReused as e:
+        return jsonify({'error': str(e)}), 422
     except Exception as e:
         logger.error(f"Error generating ticket: {e}")
         return jsonify({
@@ -60,12 +129,63 @@ def generate_ticket():
             'details': str(e)
         }), 500
 
+@app.route('/admin/db-pool')
+def db_pool_stats():
+    return jsonify(db.pool_stats())
+
+@app.route('/admin/startup')
+def startup_stats():
+    return jsonify(startup_report())
+
+@app.route('/admin/faq/reindex', methods=['POST'])
+def reindex_faq():
+    reindex_museum_info()
+    files = faq_index.index_content_dir()
+    return jsonify({'documents': len(faq_index), 'files_reindexed': files})
+
+@app.route('/availability/<visit_date>')
+def get_availability(visit_date):
+    if chatbot.inventory is None:
+        abort(404)
+    try:
+        return jsonify(chatbot.inventory.availability(visit_date, request.args.get('slot')))
+    except ValueError:
+        return jsonify({'error': 'visit_date must be YYYY-MM-DD'}), 400
+
+@app.route('/admin/inventory/<visit_date>', methods=['PUT'])
+def set_capacity(visit_date):
+    if chatbot.inventory is None:
+        abort(404)
+    data = request.get_json() or {}
+    try:
+        capacity = int(data['capacity'])
+        if capacity < 0:
+            return jsonify({'error': 'capacity cannot be negative'}), 422
+        return jsonify(chatbot.inventory.set_capacity(visit_date, capacity, data.get('slot')))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Expected a YYYY-MM-DD date and an integer capacity'}), 400
+
+@app.route('/admin/inventory')
+def inventory_stats():
+    if chatbot.inventory is None:
+        abort(404)
+    return jsonify(chatbot.inventory.stats())
+
+@app.route('/admin/sessions')
+def session_stats():
+    return jsonify(chatbot.sessions.stats())
+
 @app.route('/tickets/<ticket_id>.pdf')
 def get_ticket(ticket_id):
-    pdf_path = f'tickets/{ticket_id}.pdf'
-    return send_file(pdf_path, mimetype='application/pdf')
+    booking_ref = ticket_id[len('museum-ticket-'):] if ticket_id.startswith('museum-ticket-') else ticket_id
+    pdf_bytes = ticket_cache.get_by_ref(booking_ref)
+    if pdf_bytes is not None:
+        return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf')
+
+    pdf_path = os.path.join(TICKETS_DIR, f'{ticket_id}.pdf')
+    if not os.path.isfile(pdf_path):
+        abort(404)
+    return send_file(os.path.abspath(pdf_path), mimetype='application/pdf')
 
 if __name__ == '__main__':
-    if not os.path.exists('tickets'):
-        os.makedirs('tickets')
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,114 @@
+from datetime import datetime
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from file_lock import try_lock
+
+# The generator is built at import, before the apps load .env themselves
+load_dotenv()
+
+# Crockford base32: no I, L, O or U, so refs read back unambiguously over the phone
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+EPOCH = 1735689600  # 2025-01-01T00:00:00Z
+TIME_BITS = 30      # seconds since EPOCH, until 2059
+HOST_BITS = 6       # BOOKING_NODE_ID
+SLOT_BITS = 6       # process slot claimed on the host
+SEQ_BITS = 8        # refs per process per second before the next second is borrowed
+TOTAL_BITS = TIME_BITS + HOST_BITS + SLOT_BITS + SEQ_BITS
+REF_CHARS = -(-TOTAL_BITS // 5)
+
+BOOKING_REF_STATE_DIR = os.getenv('BOOKING_REF_STATE_DIR', 'booking_refs')
+
+
+def _host_id() -> int:
+    """BOOKING_NODE_ID: required, and different on every host or container that issues refs."""
+    configured = os.getenv('BOOKING_NODE_ID')
+    if not configured:
+        raise RuntimeError("BOOKING_NODE_ID is not set; give every host or container that issues "
+                           f"booking refs its own id between 0 and {(1 << HOST_BITS) - 1}")
+    node_id = int(configured)
+    if not 0 <= node_id < (1 << HOST_BITS):
+        raise ValueError(f"BOOKING_NODE_ID must be between 0 and {(1 << HOST_BITS) - 1}, got {node_id}")
+    return node_id
+
+
+def _claim_slot(state_dir: str):
+    """Lock the first free slot file in state_dir; returns (slot, open file, last second it recorded)."""
+    os.makedirs(state_dir, exist_ok=True)
+    for slot in range(1 << SLOT_BITS):
+        fd = os.open(os.path.join(state_dir, f"slot-{slot}"), os.O_RDWR | os.O_CREAT, 0o644)
+        slot_file = os.fdopen(fd, 'r+b')
+        if try_lock(slot_file):
+            slot_file.seek(0)
+            saved = slot_file.read().strip()
+            return slot, slot_file, int(saved) if saved.isdigit() else 0
+        slot_file.close()
+    raise RuntimeError(f"All {1 << SLOT_BITS} booking ref slots in {state_dir} are held by running processes")
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(REF_CHARS):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+class BookingRefGenerator:
+    """Time-ordered booking references that are unique across processes and hosts.
+
+    A ref is MSM + 10 base32 characters that pack the second since 2025,
+    the host id, the process slot and a per-process sequence, e.g.
+    MSM1NZY012G00. Every host sets its own BOOKING_NODE_ID, and every
+    process on a host locks its own slot file in BOOKING_REF_STATE_DIR, so
+    no two live processes share (host, slot). Within a process, (second,
+    sequence) only moves forward: past 2**8 refs in one second, or if the
+    clock steps back, the next second is borrowed instead of wrapping.
+
+    Each slot file records the last second its owner issued refs in. A
+    process that takes the slot over starts after that second, so a
+    restart never reissues refs, even those issued in borrowed seconds.
+    """
+
+    def __init__(self, state_dir: str = None):
+        self._host = _host_id()
+        self.state_dir = state_dir or BOOKING_REF_STATE_DIR
+        self._slot_file = None
+        self._claim()
+        # A forked child shares the parent's slot lock and must claim a slot of its own
+        os.register_at_fork(after_in_child=self._claim)
+
+    def _claim(self):
+        if self._slot_file is not None:
+            # Closing the inherited copy leaves the parent's lock in place
+            self._slot_file.close()
+        self._lock = threading.Lock()
+        slot, self._slot_file, saved = _claim_slot(self.state_dir)
+        self.slot = slot
+        self._node = (self._host << SLOT_BITS) | slot
+        self._saved = max(saved, int(time.time()) - EPOCH)
+        self._last = ((self._saved + 1) << SEQ_BITS) - 1   # (second << SEQ_BITS) | sequence of the last ref
+
+    def _save(self, second: int):
+        # Recorded before any ref in that second is handed out
+        self._slot_file.seek(0)
+        self._slot_file.write(b'%010d' % second)
+        self._slot_file.flush()
+        self._saved = second
+
+    def generate(self, now: datetime = None) -> str:
+        second = int(now.timestamp() if now else time.time()) - EPOCH
+        with self._lock:
+            tick = self._last = max(second << SEQ_BITS, self._last + 1)
+            second = tick >> SEQ_BITS
+            if second >= 1 << TIME_BITS:
+                raise RuntimeError("Booking ref time field exhausted")
+            if second > self._saved:
+                self._save(second)
+        value = (((second << (HOST_BITS + SLOT_BITS)) | self._node) << SEQ_BITS) | (tick & ((1 << SEQ_BITS) - 1))
+        return f"MSM{_encode(value)}"
+
+
+booking_ref_generator = BookingRefGenerator()
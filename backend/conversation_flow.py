@@ -0,0 +1,692 @@
+from typing import Any, Callable, Dict, Mapping, Optional
+from datetime import datetime
+from string import Formatter
+from types import MappingProxyType
+import json
+import os
+import logging
+from validation import normalize_count, normalize_email, normalize_name, normalize_phone
+from metrics import BOOKINGS, DATE_RESERVATIONS
+from sessions import BOOKING_FIELDS, Booking, Session
+from inventory import PastVisitDate
+
+logger = logging.getLogger(__name__)
+
+MAIN_OPTIONS = [
+    {'text': 'Museum Information', 'value': 'info'},
+    {'text': 'Book Tickets', 'value': 'book'}
+]
+START_NEW_OPTIONS = [{'text': 'Start New Chat', 'value': 'start_new'}]
+AFTER_CANCELLATION_OPTIONS = [
+    {'text': 'Start New Chat', 'value': 'start_new'},
+    {'text': 'Edit Booking Info', 'value': 'edit_info'}
+]
+
+# Declarative booking flow. Plain JSON-compatible data, so it can also be loaded
+# from a file (CONVERSATION_FLOW_PATH). Ticket prices are filled in when the flow
+# is compiled; templates marked "dynamic" are also formatted per turn.
+BOOKING_FLOW = {
+    'templates': {
+        'welcome': {
+            'response': "Welcome to the National Museum of India! How may I assist you today?",
+            'state': 'initial_options',
+            'options': MAIN_OPTIONS
+        },
+        'restart': {
+            'response': "Welcome! How can I assist you with museum tickets today?",
+            'state': 'initial_options',
+            'options': MAIN_OPTIONS
+        },
+        'museum_info': {
+            'response': """
+                        Welcome to the National Museum of India!
+                        
+                        About:
+                        The National Museum of India houses over 200,000 works of art spanning 5,000 years of cultural heritage.
+                        
+                        Opening Hours:
+                        Tuesday to Sunday: 10:00 AM - 6:00 PM
+                        Closed on Mondays and National Holidays
+                        
+                        Location:
+                        Janpath, New Delhi, India
+                        
+                        Contact:
+                        Phone: +91-11-23019272
+                        Email: info@nationalmuseum.in
+                        
+                        Would you like to book tickets now?
+                        """,
+            'state': 'after_info',
+            'options': [
+                {'text': 'Book Tickets', 'value': 'book'},
+                {'text': 'No, thanks', 'value': 'end'}
+            ]
+        },
+        'goodbye': {
+            'response': "Thank you for your interest in the National Museum! Have a great day. Feel free to start a new chat if you'd like to book tickets later.",
+            'state': 'ended',
+            'options': START_NEW_OPTIONS
+        },
+        'conversation_over': {
+            'response': "Our conversation has ended. Click 'Start New Chat' to begin a new conversation.",
+            'state': 'ended',
+            'options': START_NEW_OPTIONS
+        },
+        'ask_name': {
+            'response': "Great! Let's start your booking. Please provide your name.",
+            'state': 'asking_name'
+        },
+        'ask_email': {
+            'response': "Thank you! Please provide your email address.",
+            'state': 'asking_email'
+        },
+        'invalid_email': {
+            'response': "Please enter a valid email address (e.g., example@domain.com)",
+            'state': 'asking_email'
+        },
+        'ask_phone': {
+            'response': "Great! Now, please share your phone number.",
+            'state': 'asking_phone'
+        },
+        'invalid_phone': {
+            'response': "Please enter a valid 10-digit Indian phone number (e.g., 9876543210)",
+            'state': 'asking_phone'
+        },
+        'ask_adult_tickets': {
+            'response': "How many adult tickets would you like? (Price: ₹{adult_price} per ticket)",
+            'state': 'asking_adult_tickets'
+        },
+        'edit_tickets': {
+            'response': "Let's start over with the number of tickets. How many adult tickets would you like?",
+            'state': 'asking_adult_tickets'
+        },
+        'invalid_adult_tickets': {
+            'response': "Please enter a valid number for adult tickets.",
+            'state': 'asking_adult_tickets'
+        },
+        'negative_adult_tickets': {
+            'response': "Please enter a valid number (0 or more) for adult tickets.",
+            'state': 'asking_adult_tickets'
+        },
+        'ask_student_tickets': {
+            'response': "How many student tickets would you like? (Price: ₹{student_price} per ticket)",
+            'state': 'asking_student_tickets'
+        },
+        'ask_student_tickets_required': {
+            'response': "How many student tickets would you like? (Price: ₹{student_price} per ticket)\nNote: At least one adult or student ticket is required.",
+            'state': 'asking_student_tickets'
+        },
+        'invalid_student_tickets': {
+            'response': "Please enter a valid number for student tickets.",
+            'state': 'asking_student_tickets'
+        },
+        'negative_student_tickets': {
+            'response': "Please enter a valid number (0 or more) for student tickets.",
+            'state': 'asking_student_tickets'
+        },
+        'no_tickets': {
+            'response': """
+                            You need to book at least one ticket to proceed.
+                            Thank you for your interest! Would you like to start a new booking?
+                            """,
+            'state': 'initial_options',
+            'show_initial_buttons': True,
+            'options': [
+                {'text': 'Start New Booking', 'value': 'book'},
+                {'text': 'Museum Information', 'value': 'info'}
+            ]
+        },
+        'ask_child_tickets': {
+            'response': "How many children's tickets? (Age below 12, Free entry)",
+            'state': 'asking_child_tickets'
+        },
+        'invalid_child_tickets': {
+            'response': "Please enter a valid number for children's tickets.",
+            'state': 'asking_child_tickets'
+        },
+        'ask_date': {
+            'response': "Please select your preferred visit date.",
+            'state': 'asking_date',
+            'show_date_picker': True
+        },
+        'invalid_visit_date': {
+            'response': "Please select a valid visit date.",
+            'state': 'asking_date',
+            'show_date_picker': True
+        },
+        'past_visit_date': {
+            'response': "That date has already passed. Please select today or a later date.",
+            'state': 'asking_date',
+            'show_date_picker': True
+        },
+        'date_sold_out': {
+            'response': "Sorry, {visit_date} is fully booked for {ticket_count} ticket(s). Please select another date.",
+            'state': 'asking_date',
+            'show_date_picker': True,
+            'dynamic': True
+        },
+        'hold_expired': {
+            'response': "Sorry, your reservation for {visit_date} expired and the date is now fully booked. Please select another date.",
+            'state': 'asking_date',
+            'show_date_picker': True,
+            'dynamic': True
+        },
+        'booking_summary': {
+            'response': """
+                    Booking Summary:
+                    Name: {name}
+                    Email: {email}
+                    Phone: {phone}
+                    Adult Tickets: {adult_tickets} x ₹{adult_price}
+                    Student Tickets: {student_tickets} x ₹{student_price}
+                    Child Tickets: {child_tickets} (Free)
+                    Visit Date: {visit_date}
+                    
+                    Total Amount: ₹{total_amount}
+                    
+                    Would you like to confirm this booking?
+                    """,
+            'state': 'confirm_booking',
+            'show_confirmation_buttons': True,
+            'dynamic': True,
+            'with_booking_info': True
+        },
+        'confirm_reprompt': {
+            'response': "Please select either 'confirm' or 'cancel' to proceed.",
+            'state': 'confirm_booking',
+            'show_confirmation_buttons': True
+        },
+        'payment_prompt': {
+            'response': "Great! Your booking is confirmed. Please proceed with the payment.",
+            'state': 'payment',
+            'show_payment': True,
+            'hide_options': True,
+            'with_booking_info': True
+        },
+        'booking_cancelled': {
+            'response': "Booking cancelled. What would you like to do?",
+            'state': 'after_cancellation',
+            'options': AFTER_CANCELLATION_OPTIONS
+        },
+        'after_cancellation_reprompt': {
+            'response': "Please select an option to proceed.",
+            'state': 'after_cancellation',
+            'options': AFTER_CANCELLATION_OPTIONS
+        },
+        'payment_completed': {
+            'response': """
+                        Payment completed successfully!
+                        
+                        Booking Reference: {booking_ref}
+                        Name: {name}
+                        Email: {email}
+                        Phone: {phone}
+                        Visit Date: {visit_date}
+                        
+                        Adult Tickets: {adult_tickets}
+                        Student Tickets: {student_tickets}
+                        Child Tickets: {child_tickets}
+                        Total Amount: ₹{total_amount}
+                        
+                        Thank you for booking with us! You can download your ticket below.
+                        """,
+            'state': 'booking_completed',
+            'show_download': True,
+            'conversation_ended': True,
+            'dynamic': True
+        },
+        'free_text_answer': {
+            'response': "{answer}",
+            'state': 'initial_options',
+            'options': MAIN_OPTIONS,
+            'dynamic': True
+        },
+        'not_sure': {
+            'response': "I apologize, but I'm not sure how to help with that. Would you like to start a new conversation?",
+            'state': 'ended',
+            'options': START_NEW_OPTIONS
+        }
+    },
+    'states': {
+        'confirm_booking': {
+            'handler': 'choice',
+            'gated': False,
+            'choices': {
+                'confirm': {'template': 'payment_prompt'},
+                'cancel': {'template': 'booking_cancelled', 'effect': 'release'}
+            },
+            'otherwise': 'confirm_reprompt'
+        },
+        'after_cancellation': {
+            'handler': 'choice',
+            'gated': False,
+            'choices': {
+                'start_new': {'template': 'restart', 'effect': 'reset'},
+                'edit_info': {'template': 'edit_tickets', 'effect': 'advance'}
+            },
+            'otherwise': 'after_cancellation_reprompt'
+        },
+        'payment': {'handler': 'complete_payment', 'gated': False},
+        'greeting': {'handler': 'reply', 'template': 'welcome'},
+        'initial_options': {
+            'handler': 'choice',
+            'choices': {'info': {'template': 'museum_info'}, 'book': {'template': 'ask_name'}}
+        },
+        'after_info': {
+            'handler': 'choice',
+            'choices': {'end': {'template': 'goodbye', 'effect': 'end'}, 'book': {'template': 'ask_name'}}
+        },
+        'asking_name': {'handler': 'collect', 'field': 'name', 'validator': 'name', 'template': 'ask_email'},
+        'asking_email': {
+            'handler': 'collect', 'field': 'email', 'validator': 'email',
+            'template': 'ask_phone', 'invalid': 'invalid_email'
+        },
+        'asking_phone': {
+            'handler': 'collect', 'field': 'phone', 'validator': 'phone',
+            'template': 'ask_adult_tickets', 'invalid': 'invalid_phone'
+        },
+        'asking_adult_tickets': {'handler': 'adult_tickets'},
+        'asking_student_tickets': {'handler': 'student_tickets'},
+        'asking_child_tickets': {'handler': 'child_tickets'},
+        'asking_date': {'handler': 'visit_date', 'template': 'booking_summary'}
+    },
+    # Applied to gated states once a conversation has ended
+    'ended': {
+        'handler': 'choice',
+        'choices': {'start_new': {'template': 'restart', 'effect': 'reset'}},
+        'otherwise': 'conversation_over'
+    },
+    'fallback': 'not_sure',
+    # Used instead of the fallback when the answer function (FAQ index, then LLM) has an answer
+    'answer': 'free_text_answer'
+}
+
+
+class Template:
+    """Immutable response template; render() returns a fresh, JSON-ready dict."""
+
+    __slots__ = ('name', 'payload', '_fields', '_options', '_parts', 'dynamic', 'with_booking_info')
+
+    def __init__(self, name: str, definition: Dict[str, Any], constants: Dict[str, Any]):
+        fields = {key: value for key, value in definition.items() if key not in ('dynamic', 'with_booking_info')}
+        # Prices are baked in here, leaving only per-booking fields for render()
+        for key, value in constants.items():
+            fields['response'] = fields['response'].replace('{' + key + '}', str(value))
+        self.dynamic = bool(definition.get('dynamic'))
+        # Split once into (literal, field, format_spec) so render() skips re-parsing the text
+        self._parts = tuple(
+            (literal, field, spec or '')
+            for literal, field, spec, _ in Formatter().parse(fields['response'])
+        ) if self.dynamic else ()
+        self._options = tuple(dict(option) for option in fields.pop('options', ()))
+        self._fields = fields
+        self.name = name
+        self.with_booking_info = bool(definition.get('with_booking_info'))
+        self.payload: Mapping[str, Any] = MappingProxyType(
+            dict(fields, options=self._options) if self._options else fields
+        )
+
+    def render(self, booking: Optional[Booking] = None,
+               values: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        response = self._fields.copy()
+        if self._options:
+            response['options'] = [option.copy() for option in self._options]
+        if self.dynamic:
+            response['response'] = ''.join([
+                literal if field is None else literal + format(values[field], spec)
+                for literal, field, spec in self._parts
+            ])
+        if self.with_booking_info:
+            response['booking_info'] = booking.to_dict() if booking is not None else None
+        return response
+
+
+class TurnContext:
+    """One incoming message: `message` is the lowercased command form used to
+    match buttons and keywords, `text` the stripped original for free-text fields.
+    `on_token`, when set, receives partial response text as it is produced."""
+
+    __slots__ = ('service', 'session_id', 'session', 'message', 'text', 'on_token')
+
+    def __init__(self, service, session_id: str, session: Session, message: str,
+                 text: Optional[str] = None, on_token: Optional[Callable[[str], None]] = None):
+        self.service = service
+        self.session_id = session_id
+        self.session = session
+        self.message = message
+        self.text = message if text is None else text
+        self.on_token = on_token
+
+    def reset(self):
+        self.session = self.service.sessions.reset(self.session_id)
+
+    def release_hold(self):
+        booking_ref = self.session.booking.booking_ref
+        if self.service.inventory is not None and booking_ref:
+            self.service.inventory.release(booking_ref)
+
+
+Turn = Callable[[TurnContext], Optional[Dict[str, Any]]]
+
+# Validators and handlers are referenced by name from the flow definition. A
+# validator returns the normalised value, or None to reject the input. A
+# handler is a factory: it resolves its state's spec once, when the flow is
+# compiled, and returns the per-turn callable. Returning None from a turn
+# falls through to the conversation-ended check or the fallback response.
+
+VALIDATORS: Dict[str, Callable[[str], Optional[str]]] = {
+    'name': normalize_name,
+    'email': normalize_email,
+    'phone': normalize_phone
+}
+
+
+def _reply(flow, spec) -> Turn:
+    template = spec['template']
+
+    def turn(ctx):
+        return template.render(ctx.session.booking)
+    return turn
+
+
+def _choice(flow, spec) -> Turn:
+    choices = spec['choices']
+    otherwise = spec.get('otherwise')
+
+    def turn(ctx):
+        choice = choices.get(ctx.message)
+        if choice is None:
+            return otherwise.render(ctx.session.booking) if otherwise else None
+        template, effect = choice
+        if effect == 'reset':
+            ctx.reset()
+        elif effect == 'end':
+            ctx.session.conversation_ended = True
+        elif effect == 'advance':
+            ctx.session.current_step = template.payload['state']
+        elif effect == 'release':
+            ctx.release_hold()
+        return template.render(ctx.session.booking)
+    return turn
+
+
+def _collect(flow, spec) -> Turn:
+    field, template = spec['field'], spec['template']
+    validator, invalid = spec.get('validator'), spec.get('invalid')
+
+    def turn(ctx):
+        booking = ctx.session.booking
+        value = ctx.text if validator is None else validator(ctx.text)
+        if value is None:
+            return invalid.render(booking)
+        setattr(booking, field, value)
+        return template.render(booking)
+    return turn
+
+
+def _rejected_count(message: str, invalid: Template, negative: Optional[Template] = None) -> Dict[str, Any]:
+    # normalize_count refuses any sign, so "-3" gets the "0 or more" reply where the flow has one
+    if negative is not None and message.startswith('-') and normalize_count(message[1:]) is not None:
+        return negative.render()
+    return invalid.render()
+
+
+def _adult_tickets(flow, spec) -> Turn:
+    invalid = flow.templates['invalid_adult_tickets']
+    negative = flow.templates['negative_adult_tickets']
+    ask_student = flow.templates['ask_student_tickets']
+    ask_student_required = flow.templates['ask_student_tickets_required']
+
+    def turn(ctx):
+        adult_tickets = normalize_count(ctx.message)
+        if adult_tickets is None:
+            return _rejected_count(ctx.message, invalid, negative)
+        ctx.session.booking.adult_tickets = adult_tickets
+
+        # If no adult tickets, must have student tickets
+        if adult_tickets == 0:
+            return ask_student_required.render()
+        return ask_student.render()
+    return turn
+
+
+def _student_tickets(flow, spec) -> Turn:
+    invalid = flow.templates['invalid_student_tickets']
+    negative = flow.templates['negative_student_tickets']
+    no_tickets = flow.templates['no_tickets']
+    ask_child = flow.templates['ask_child_tickets']
+    ask_date = flow.templates['ask_date']
+    student_price = flow.prices['student']
+
+    def turn(ctx):
+        booking = ctx.session.booking
+        student_tickets = normalize_count(ctx.message)
+        if student_tickets is None:
+            return _rejected_count(ctx.message, invalid, negative)
+
+        # Check if at least one ticket is booked when no adult tickets
+        if not booking.adult_tickets and student_tickets == 0:
+            return no_tickets.render()
+
+        booking.student_tickets = student_tickets
+
+        # Only student tickets: calculate the total here and skip child tickets
+        if not booking.adult_tickets:
+            booking.total_amount = student_tickets * student_price
+            booking.child_tickets = 0
+            return ask_date.render()
+        return ask_child.render()
+    return turn
+
+
+def _child_tickets(flow, spec) -> Turn:
+    invalid = flow.templates['invalid_child_tickets']
+    ask_date = flow.templates['ask_date']
+    adult_price, student_price = flow.prices['adult'], flow.prices['student']
+
+    def turn(ctx):
+        booking = ctx.session.booking
+        child_tickets = normalize_count(ctx.message)
+        if child_tickets is None:
+            return _rejected_count(ctx.message, invalid)
+        booking.child_tickets = child_tickets
+        booking.total_amount = booking.adult_tickets * adult_price + booking.student_tickets * student_price
+        return ask_date.render()
+    return turn
+
+
+def _ticket_count(booking: Booking) -> int:
+    return (booking.adult_tickets or 0) + (booking.student_tickets or 0) + (booking.child_tickets or 0)
+
+
+def _visit_date(flow, spec) -> Turn:
+    template = spec['template']
+    invalid = flow.templates['invalid_visit_date']
+    # Flow files written before this template existed fall back to the generic reply
+    past = flow.templates.get('past_visit_date', invalid)
+    sold_out = flow.templates['date_sold_out']
+    no_tickets = flow.templates['no_tickets']
+
+    def turn(ctx):
+        booking = ctx.session.booking
+        count = _ticket_count(booking)
+        if count < 1:
+            # Only reachable by jumping to this step; there is nothing to hold seats for
+            DATE_RESERVATIONS.inc('no_tickets')
+            return no_tickets.render()
+        # Keep the ref when the visitor edits tickets and picks a date again
+        if booking.booking_ref is None:
+            booking.booking_ref = ctx.service.generate_booking_ref()
+        inventory = ctx.service.inventory
+        if inventory is not None:
+            try:
+                remaining = inventory.reserve(booking.booking_ref, ctx.text, count, booking.visit_slot)
+            except PastVisitDate:
+                DATE_RESERVATIONS.inc('past_date')
+                return past.render()
+            except ValueError:
+                DATE_RESERVATIONS.inc('invalid_date')
+                return invalid.render()
+            if remaining is None:
+                DATE_RESERVATIONS.inc('sold_out')
+                return sold_out.render(values={'visit_date': ctx.text, 'ticket_count': count})
+            DATE_RESERVATIONS.inc('reserved')
+        booking.visit_date = ctx.text
+        return template.render(booking, booking.to_dict())
+    return turn
+
+
+def _complete_payment(flow, spec) -> Turn:
+    completed = flow.templates['payment_completed']
+    hold_expired = flow.templates['hold_expired']
+
+    def complete(service, booking):
+        booking.status = 'paid'
+        booking.payment_date = datetime.now().isoformat()
+
+        # With write-behind enabled this returns once the booking is journaled
+        if not service.db.save_booking(booking.to_dict(), on_ack=service._booking_persisted):
+            BOOKINGS.inc('save_failed')
+            return None
+        BOOKINGS.inc('completed')
+
+        ticket_data = {
+            'booking_ref': booking.booking_ref,
+            'name': booking.name,
+            'email': booking.email,
+            'phone': booking.phone,
+            'visit_date': booking.visit_date,
+            'adult_tickets': booking.adult_tickets or 0,
+            'student_tickets': booking.student_tickets or 0,
+            'child_tickets': booking.child_tickets or 0,
+            'total_amount': booking.total_amount or 0
+        }
+        response = completed.render(values=ticket_data)
+        response['ticket_data'] = ticket_data
+        return response
+
+    def turn(ctx):
+        if ctx.message != 'payment_completed':
+            return None
+        service = ctx.service
+        booking = ctx.session.booking
+        if booking.booking_ref is None:
+            booking.booking_ref = service.generate_booking_ref()
+        # Seats stay sold if the save below fails; holding a seat too many is
+        # safer than overselling. confirm() is itself safe to repeat.
+        if service.inventory is not None and not service.inventory.confirm(
+                booking.booking_ref, booking.visit_date or '', _ticket_count(booking), booking.visit_slot):
+            BOOKINGS.inc('hold_expired')
+            return hold_expired.render(values={'visit_date': booking.visit_date})
+        if service.idempotency is None:
+            return complete(service, booking)
+        # Retries and double clicks replay the first completion instead of saving again
+        response = service.idempotency.run('payment', booking.booking_ref, lambda: complete(service, booking))
+        return dict(response) if response is not None else None
+    return turn
+
+
+HANDLERS: Dict[str, Callable[[Any, Dict[str, Any]], Turn]] = {
+    'reply': _reply,
+    'choice': _choice,
+    'collect': _collect,
+    'adult_tickets': _adult_tickets,
+    'student_tickets': _student_tickets,
+    'child_tickets': _child_tickets,
+    'visit_date': _visit_date,
+    'complete_payment': _complete_payment
+}
+
+
+class CompiledFlow:
+    """A flow definition with handlers, validators and templates resolved up front.
+
+    Each turn is one dict lookup for the current state plus the handler call;
+    adding states does not add work to other turns.
+    """
+
+    def __init__(self, definition: Dict[str, Any], prices: Dict[str, int],
+                 answer: Optional[Callable[..., Optional[str]]] = None):
+        self.prices = dict(prices)
+        self.answer = answer
+        constants = {f"{ticket_type}_price": price for ticket_type, price in prices.items()}
+        self.templates = {
+            name: Template(name, template, constants)
+            for name, template in definition['templates'].items()
+        }
+        self.fallback = self.templates[definition['fallback']]
+        self.answer_template = self.templates[definition['answer']] if 'answer' in definition else None
+        self.ended = self._compile_state('ended', definition['ended'])
+        # States marked "gated": false are handled before the conversation-ended check
+        self.ungated: Dict[str, Turn] = {}
+        self.gated: Dict[str, Turn] = {}
+        for name, spec in definition['states'].items():
+            table = self.gated if spec.get('gated', True) else self.ungated
+            table[name] = self._compile_state(name, spec)
+        # Every state a turn can start in or move to; anything else a client sends is labelled 'other'
+        self.state_names = frozenset(self.ungated) | frozenset(self.gated) | frozenset(
+            template.payload['state'] for template in self.templates.values())
+
+    def _template(self, state_name: str, name: str) -> Template:
+        if name not in self.templates:
+            raise ValueError(f"State {state_name!r} refers to unknown template {name!r}")
+        return self.templates[name]
+
+    def _compile_state(self, name: str, spec: Dict[str, Any]) -> Turn:
+        if spec['handler'] not in HANDLERS:
+            raise ValueError(f"State {name!r} refers to unknown handler {spec['handler']!r}")
+        compiled = dict(spec)
+        for key in ('template', 'invalid', 'otherwise'):
+            if key in spec:
+                compiled[key] = self._template(name, spec[key])
+        if 'field' in spec and spec['field'] not in BOOKING_FIELDS:
+            raise ValueError(f"State {name!r} collects unknown booking field {spec['field']!r}")
+        if 'validator' in spec:
+            if spec['validator'] not in VALIDATORS:
+                raise ValueError(f"State {name!r} refers to unknown validator {spec['validator']!r}")
+            compiled['validator'] = VALIDATORS[spec['validator']]
+        if 'choices' in spec:
+            compiled['choices'] = {
+                value: (self._template(name, choice['template']), choice.get('effect'))
+                for value, choice in spec['choices'].items()
+            }
+        return HANDLERS[spec['handler']](self, compiled)
+
+    def dispatch(self, ctx: TurnContext) -> Dict[str, Any]:
+        current_step = ctx.session.current_step
+
+        turn = self.ungated.get(current_step)
+        if turn is not None:
+            response = turn(ctx)
+            if response is not None:
+                return response
+
+        # If conversation has ended, only allow starting a new conversation
+        if ctx.session.conversation_ended:
+            return self.ended(ctx)
+
+        logger.info(f"Current step: {current_step}, Message: {ctx.message}")
+
+        turn = self.gated.get(current_step)
+        if turn is not None:
+            response = turn(ctx)
+            if response is not None:
+                return response
+
+        # Free text nothing above matched: let the FAQ index / LLM answer it
+        if self.answer is not None and self.answer_template is not None and ctx.text:
+            answer = self.answer(ctx.text, ctx.on_token)
+            if answer is not None:
+                return self.answer_template.render(values={'answer': answer})
+
+        # Default response (should rarely be reached in production)
+        return self.fallback.render()
+
+
+def load_flow_definition(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or os.getenv('CONVERSATION_FLOW_PATH')
+    if not path:
+        return BOOKING_FLOW
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
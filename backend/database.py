@@ -1,6 +1,15 @@
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional
 from datetime import datetime
+import threading
 import pymongo
+from pymongo import ASCENDING, DESCENDING, monitoring
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from write_behind import get_write_behind_queue, write_behind_enabled
+from inventory import CapacityInventory, get_inventory, inventory_enabled
+from metrics import CallbackGauge, CommandMetricsListener
+from idempotency import IdempotencyStore, get_idempotency_store
+from storage import Storage
 import os
 from dotenv import load_dotenv
 import logging
@@ -8,46 +17,234 @@ import logging
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-class DatabaseHandler:
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events so the pool can be sized per worker."""
+
     def __init__(self):
-        self.client = pymongo.MongoClient(os.getenv('MONGODB_URI'))
-        self.db = self.client['museum']
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.check_out_failed = 0
+
+    def _add(self, field: str, delta: int):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'created': self.created,
+                'open': self.created - self.closed,
+                'checked_out': self.checked_out,
+                'waiting': self.waiting,
+                'check_out_failed': self.check_out_failed
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add('created', 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add('closed', 1)
+
+    def connection_check_out_started(self, event):
+        self._add('waiting', 1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.check_out_failed += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+
+_client = None
+_client_lock = threading.Lock()
+_pool_stats = PoolStatsListener()
+CallbackGauge('mongo_pool_connections', 'Mongo connection pool counters for this process.', ('state',),
+              lambda: {(state,): value for state, value in _pool_stats.snapshot().items()})
+
+
+def get_mongo_client() -> pymongo.MongoClient:
+    """Return the process-wide MongoClient, creating it on first use.
+
+    The client is built with connect=False, so no socket or monitor thread
+    is opened until the first operation.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    os.getenv('MONGODB_URI'),
+                    maxPoolSize=int(os.getenv('MONGODB_MAX_POOL_SIZE', 50)),
+                    minPoolSize=int(os.getenv('MONGODB_MIN_POOL_SIZE', 0)),
+                    maxIdleTimeMS=int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 300000)),
+                    waitQueueTimeoutMS=int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+                    serverSelectionTimeoutMS=int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+                    connectTimeoutMS=int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000)),
+                    socketTimeoutMS=int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', 10000)),
+                    connect=False,
+                    event_listeners=[_pool_stats, CommandMetricsListener()]
+                )
+    return _client
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    stats = _pool_stats.snapshot()
+    stats['max_pool_size'] = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+    stats['client_initialized'] = _client is not None
+    return stats
+
+
+def _projection(fields: Optional[List[str]]) -> Dict[str, int]:
+    # Lookups never return _id unless asked for; it is an ObjectId and not JSON serialisable
+    projection = {'_id': 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+        if '_id' in fields:
+            projection['_id'] = 1
+    return projection
+
+
+class DatabaseHandler(Storage):
+    backend = 'mongo'
+
+    def __init__(self, client: Optional[pymongo.MongoClient] = None, db_name: Optional[str] = None):
+        self.client = client or get_mongo_client()
+        self.db = self.client[db_name or os.getenv('MONGODB_DB', 'museum')]
         self.bookings = self.db['bookings']
         self.museum_info = self.db['museum_info']
+        self.tickets = self.db['tickets']
+        self.transactions = self.db['transactions']
+        # Optional batched persistence; enqueued writes are journaled to disk before returning
+        self.write_behind = get_write_behind_queue(self.db) if write_behind_enabled() else None
+
+    def ensure_indexes(self) -> bool:
+        """Create the indexes the lookup paths rely on; safe to call on every startup."""
+        try:
+            self.bookings.create_index([('booking_ref', ASCENDING)], unique=True, name='booking_ref_unique')
+            self.bookings.create_index([('email', ASCENDING)], name='email')
+            self.bookings.create_index([('phone', ASCENDING)], name='phone')
+            self.bookings.create_index([('created_at', DESCENDING)], name='created_at')
+            self.tickets.create_index([('booking_ref', ASCENDING)], name='booking_ref')
+            self.tickets.create_index([('created_at', DESCENDING)], name='created_at')
+            self.transactions.create_index([('booking_ref', ASCENDING)], name='booking_ref')
+            self.transactions.create_index([('created_at', DESCENDING)], name='created_at')
+            if inventory_enabled():
+                get_inventory(self).ensure_indexes()
+            get_idempotency_store(self).ensure_indexes()
+            return True
+        except Exception as e:
+            logger.error(f"Error creating indexes: {e}")
+            return False
+
+    def _insert(self, collection, document: Dict[str, Any], on_ack: Optional[Callable] = None) -> str:
+        if self.write_behind is not None:
+            return str(self.write_behind.enqueue(collection.name, document, on_ack))
+        result = collection.insert_one(document)
+        if on_ack is not None:
+            on_ack(document)
+        return str(result.inserted_id)
 
-    def save_booking(self, booking_data: Dict[str, Any]) -> bool:
+    def save_booking(self, booking_data: Dict[str, Any], on_ack: Optional[Callable] = None) -> bool:
         try:
             booking_data['created_at'] = datetime.now().isoformat()
-            result = self.bookings.insert_one(booking_data)
-            booking_data['_id'] = str(result.inserted_id)
-            return bool(result.inserted_id)
+            booking_data['_id'] = self._insert(self.bookings, booking_data, on_ack)
+            return bool(booking_data['_id'])
+        except DuplicateKeyError:
+            logger.error(f"Booking {booking_data.get('booking_ref')} already exists")
+            return False
         except Exception as e:
             logger.error(f"Error saving booking: {e}")
             return False
 
-    def get_booking(self, booking_ref: str) -> Dict[str, Any]:
+    def get_booking(self, booking_ref: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         try:
-            return self.bookings.find_one({'booking_ref': booking_ref})
+            return self.bookings.find_one({'booking_ref': booking_ref}, _projection(fields))
         except Exception as e:
             logger.error(f"Error fetching booking: {e}")
             return None
 
+    def get_bookings(self, booking_refs: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        try:
+            return list(self.bookings.find({'booking_ref': {'$in': booking_refs}}, _projection(fields)))
+        except Exception as e:
+            logger.error(f"Error fetching bookings: {e}")
+            return []
+
     def get_museum_info(self) -> Dict[str, Any]:
         try:
-            return self.museum_info.find_one({})
+            return self.museum_info.find_one({}, {'_id': 0})
         except Exception as e:
             logger.error(f"Error fetching museum info: {e}")
             return None
 
-    def save_ticket(self, ticket_data: dict) -> str:
+    def set_museum_info(self, museum_info: Dict[str, Any]):
+        self.museum_info.replace_one({}, museum_info, upsert=True)
+
+    def watch_museum_info(self, on_change: Callable[[], None]) -> threading.Thread:
+        """Call on_change whenever the museum_info collection changes.
+
+        Change streams need a replica set; on a standalone mongod the watcher
+        logs the error and exits, leaving TTL expiry as the only invalidation.
+        """
+        def watch():
+            try:
+                with self.museum_info.watch() as stream:
+                    for _ in stream:
+                        on_change()
+            except Exception as e:
+                logger.error(f"Museum info change stream stopped: {e}")
+
+        thread = threading.Thread(target=watch, name='museum-info-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def save_ticket(self, ticket_data: dict, on_ack: Optional[Callable] = None) -> str:
         ticket_data['created_at'] = datetime.utcnow()
-        result = self.db.tickets.insert_one(ticket_data)
-        return str(result.inserted_id)
+        return self._insert(self.tickets, ticket_data, on_ack)
     
-    def get_ticket(self, ticket_id: str) -> dict:
-        return self.db.tickets.find_one({'_id': ticket_id})
+    def get_ticket(self, ticket_id: str, fields: Optional[List[str]] = None) -> dict:
+        # save_ticket hands out str(ObjectId), so convert back before matching _id
+        ticket_key = ObjectId(ticket_id) if ObjectId.is_valid(ticket_id) else ticket_id
+        return self.tickets.find_one({'_id': ticket_key}, _projection(fields))
     
-    def save_transaction(self, transaction_data: dict) -> str:
+    def save_transaction(self, transaction_data: dict, on_ack: Optional[Callable] = None) -> str:
         transaction_data['created_at'] = datetime.utcnow()
-        result = self.db.transactions.insert_one(transaction_data)
-        return str(result.inserted_id)
+        return self._insert(self.transactions, transaction_data, on_ack)
+
+    def create_inventory(self) -> CapacityInventory:
+        return CapacityInventory(self.db)
+
+    def create_idempotency_store(self) -> IdempotencyStore:
+        return IdempotencyStore(self.db['idempotency_keys'])
+
+    def pool_stats(self) -> Dict[str, Any]:
+        stats = dict(get_pool_stats(), backend=self.backend)
+        if self.write_behind is not None:
+            stats['write_behind'] = self.write_behind.stats()
+        return stats
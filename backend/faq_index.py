@@ -0,0 +1,230 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+from functools import lru_cache
+import glob
+import math
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_DIR = os.getenv('MUSEUM_CONTENT_DIR', os.path.join(os.path.dirname(__file__), 'content'))
+# Best-match BM25 score below which a question is left to the LLM / fallback reply
+FAQ_MIN_SCORE = float(os.getenv('FAQ_MIN_SCORE', 2.0))
+FAQ_RESCAN_SECONDS = float(os.getenv('FAQ_RESCAN_SECONDS', 60))
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+HEADING_PATTERN = re.compile(r'^#{1,6}\s+(.*)$', re.MULTILINE)
+STOP_WORDS = frozenset(
+    'a about an and any are at be by can could do does for from have how i in is it me museum my '
+    'of on or please tell that the them there this to us was we what when which will with '
+    'you your'.split()
+)
+# (suffix, replacement) tried in order; a crude stemmer, but it only has to
+# agree with itself on both the passages and the questions
+SUFFIXES = (('ies', 'y'), ('ing', ''), ('ion', ''), ('ed', ''), ('s', ''), ('y', ''))
+# Stemmed visitor wording -> the stem the museum content uses for it
+SYNONYMS = {
+    'time': 'hour', 'timing': 'hour', 'close': 'open', 'clo': 'open', 'shut': 'open',
+    'where': 'locat', 'address': 'locat', 'direct': 'locat', 'reach': 'locat',
+    'photo': 'photograph', 'picture': 'photograph', 'camera': 'photograph', 'pic': 'photograph',
+    'cost': 'price', 'fee': 'price', 'much': 'price', 'entry': 'ticket', 'admission': 'ticket',
+    'galler': 'collect', 'exhibit': 'collect', 'art': 'collect',
+    'phone': 'contact', 'call': 'contact', 'email': 'contact', 'number': 'contact',
+    'eat': 'food', 'drink': 'food', 'snack': 'food', 'beverage': 'food',
+}
+# Title terms count this many times, a cheap stand-in for BM25F field weights
+TITLE_WEIGHT = 3
+
+
+@lru_cache(maxsize=4096)
+def _stem(word: str) -> str:
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix, replacement in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith('ss'):
+                word = word[:-len(suffix)] + replacement
+                stripped = True
+                break
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        word = _stem(word)
+        tokens.append(SYNONYMS.get(word, word))
+    return tokens
+
+
+class FaqIndex:
+    """In-memory BM25 index over short museum passages.
+
+    Postings map each term to {doc_id: term frequency}, so a query only
+    touches the documents that share a term with it. upsert() and remove()
+    adjust postings and length totals in place, so re-indexing a changed
+    document costs as much as indexing it once, whatever the index size.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._docs: Dict[str, Tuple[str, str, int, Tuple[str, ...]]] = {}  # doc_id -> (title, text, length, terms)
+        self._total_length = 0
+        self._sources: Dict[str, Tuple[float, List[str]]] = {}  # path -> (mtime, doc_ids)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def upsert(self, doc_id: str, title: str, text: str):
+        terms = Counter(tokenize(text))
+        for term in tokenize(title):
+            terms[term] += TITLE_WEIGHT
+        length = sum(terms.values())
+        with self._lock:
+            self._remove(doc_id)
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            self._docs[doc_id] = (title, text, length, tuple(terms))
+            self._total_length += length
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc[2]
+        for term in doc[3]:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, limit: int = 3) -> List[Tuple[float, str, str, str]]:
+        """Return up to `limit` (score, doc_id, title, text) matches, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._docs)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                # A term in most passages barely moves the ranking but costs a full scan
+                if not postings or (len(postings) > count // 2 and count > 10):
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._docs[doc_id][2] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [(score, doc_id, self._docs[doc_id][0], self._docs[doc_id][1]) for doc_id, score in best]
+
+    def answer(self, question: str, min_score: Optional[float] = None) -> Optional[str]:
+        matches = self.search(question, limit=1)
+        if not matches or matches[0][0] < (FAQ_MIN_SCORE if min_score is None else min_score):
+            return None
+        _, _, title, text = matches[0]
+        return f"{title}:\n{text}"
+
+    def index_museum_info(self, museum_info: Optional[Dict[str, Any]]):
+        """(Re)index the museum_info document, one passage per field.
+
+        None (the lookup failed) keeps the passages already indexed.
+        """
+        if museum_info is None:
+            return
+        fields = {}
+        for field, value in museum_info.items():
+            if field == '_id' or value in (None, '', {}):
+                continue
+            if isinstance(value, dict):
+                value = '\n'.join(f"{key.replace('_', ' ').capitalize()}: {item}" for key, item in value.items())
+            fields[f"museum_info:{field}"] = (field.replace('_', ' ').capitalize(), str(value))
+        with self._lock:
+            for doc_id in [doc_id for doc_id in self._docs if doc_id.startswith('museum_info:')]:
+                if doc_id not in fields:
+                    self._remove(doc_id)
+            for doc_id, (title, text) in fields.items():
+                self.upsert(doc_id, title, text)
+
+    def index_content_dir(self, content_dir: Optional[str] = None) -> int:
+        """Index new or modified .md/.txt files and drop deleted ones.
+
+        Files whose mtime has not changed since the last call are skipped,
+        so calling this periodically is cheap. Markdown files are split into
+        one passage per heading. Returns the number of files (re)indexed.
+        """
+        content_dir = content_dir or CONTENT_DIR
+        paths = sorted(glob.glob(os.path.join(content_dir, '**', '*.md'), recursive=True) +
+                       glob.glob(os.path.join(content_dir, '**', '*.txt'), recursive=True))
+        indexed = 0
+        with self._lock:
+            for path in set(self._sources) - set(paths):
+                if path.startswith(os.path.join(content_dir, '')):
+                    for doc_id in self._sources.pop(path)[1]:
+                        self._remove(doc_id)
+            for path in paths:
+                try:
+                    mtime = os.path.getmtime(path)
+                    if path in self._sources and self._sources[path][0] == mtime:
+                        continue
+                    with open(path, encoding='utf-8') as f:
+                        sections = list(split_sections(f.read(), os.path.splitext(os.path.basename(path))[0]))
+                except OSError as e:
+                    logger.error(f"Could not index {path}: {e}")
+                    continue
+                for doc_id in self._sources.get(path, (0, []))[1]:
+                    self._remove(doc_id)
+                doc_ids = []
+                for number, (title, text) in enumerate(sections):
+                    doc_id = f"{path}#{number}"
+                    self.upsert(doc_id, title, text)
+                    doc_ids.append(doc_id)
+                self._sources[path] = (mtime, doc_ids)
+                indexed += 1
+        return indexed
+
+    def watch_content_dir(self, interval: float, content_dir: Optional[str] = None) -> threading.Thread:
+        """Re-run index_content_dir every `interval` seconds in a daemon thread."""
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    indexed = self.index_content_dir(content_dir)
+                    if indexed:
+                        logger.info(f"Re-indexed {indexed} FAQ content file(s)")
+                except Exception as e:
+                    logger.error(f"FAQ content re-index failed: {e}")
+
+        thread = threading.Thread(target=watch, name='faq-content-watch', daemon=True)
+        thread.start()
+        return thread
+
+
+def split_sections(content: str, default_title: str) -> Iterable[Tuple[str, str]]:
+    headings = list(HEADING_PATTERN.finditer(content))
+    if not headings:
+        if content.strip():
+            yield default_title.replace('-', ' ').replace('_', ' ').capitalize(), content.strip()
+        return
+    for i, heading in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(content)
+        text = content[heading.end():end].strip()
+        if text:
+            yield heading.group(1).strip(), text
+
+
+faq_index = FaqIndex()
@@ -0,0 +1,21 @@
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows has no flock; a byte-range lock on the first byte does the same job
+    fcntl = None
+    import msvcrt
+
+
+def try_lock(f) -> bool:
+    """Take a non-blocking exclusive lock on an open file; False when another process holds it.
+    The lock lasts until the file is closed."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,254 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+import os
+import threading
+import time
+import uuid
+import logging
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 86400
+DEFAULT_WAIT_SECONDS = 30
+DEFAULT_LEASE_SECONDS = 120
+POLL_SECONDS = 0.05
+
+
+class IdempotencyConflict(Exception):
+    """The key is still being processed elsewhere after waiting wait_seconds."""
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was first used for a different request (its fingerprint differs)."""
+
+
+def idempotency_persisted() -> bool:
+    return os.getenv('IDEMPOTENCY_STORE', 'mongo').lower() == 'mongo'
+
+
+class IdempotencyStore:
+    """Runs an operation at most once per (scope, key) and replays its result.
+
+    Results are kept in an in-process TTL cache and, with a collection, in
+    Mongo (`idempotency_keys`, expired by a TTL index). A retry that lands
+    on another worker also gets the first result. Concurrent calls in one
+    process share a single execution. Across processes, the first insert of
+    a pending record claims the key, and the others poll until it is done.
+    A claim lasts IDEMPOTENCY_LEASE_SECONDS and is renewed while its
+    operation runs, however long that takes; a claim whose owner died is
+    taken over once its lease runs out.
+
+    A fingerprint of the request (e.g. a hash of its body) is stored with
+    the result; reusing the key with a different fingerprint raises
+    IdempotencyKeyReused instead of replaying someone else's result.
+
+    A None result or an exception is not stored; the claim is dropped so a
+    retry can run the operation again. If Mongo is unreachable, the
+    operation still runs, deduplicated in-process only.
+    """
+
+    def __init__(self, collection=None, ttl_seconds: Optional[float] = None, wait_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None, lease_seconds: Optional[float] = None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds or float(os.getenv('IDEMPOTENCY_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+        # How long a caller waits for someone else's claim
+        self.wait_seconds = wait_seconds or float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', DEFAULT_WAIT_SECONDS))
+        # How long a claim survives without renewal; renewed every third of it while the operation runs
+        self.lease_seconds = lease_seconds or float(os.getenv('IDEMPOTENCY_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+        self.cache = TTLCache(ttl_seconds=self.ttl_seconds,
+                              max_entries=max_entries or int(os.getenv('IDEMPOTENCY_CACHE_MAX_ENTRIES', 1024)))
+        self._inflight: Dict[str, Tuple[Optional[str], Future]] = {}
+        self._leases: Dict[str, str] = {}  # record_id -> owner, for claims this process is running
+        self._renewer = None
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'replayed': 0, 'coalesced': 0, 'conflicts': 0, 'key_reused': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._inflight), cached=len(self.cache))
+
+    def ensure_indexes(self):
+        if self.collection is not None:
+            self.collection.create_index([('created_at', ASCENDING)], name='created_at_ttl',
+                                         expireAfterSeconds=int(self.ttl_seconds))
+
+    def _check_fingerprint(self, record_id: str, stored: Optional[str], fingerprint: Optional[str]):
+        if stored != fingerprint:
+            self._count('key_reused')
+            raise IdempotencyKeyReused(f"{record_id} was already used for a different request")
+
+    def run(self, scope: str, key: str, func: Callable[[], Any], fingerprint: Optional[str] = None) -> Any:
+        record_id = f"{scope}:{key}"
+        cached = self.cache.get(record_id)
+        if cached is not None:
+            self._check_fingerprint(record_id, cached[0], fingerprint)
+            self._count('replayed')
+            return cached[1]
+
+        with self._lock:
+            inflight = self._inflight.get(record_id)
+            leader = inflight is None
+            if leader:
+                future = Future()
+                self._inflight[record_id] = (fingerprint, future)
+            else:
+                inflight_fingerprint, future = inflight
+        if not leader:
+            self._check_fingerprint(record_id, inflight_fingerprint, fingerprint)
+            self._count('coalesced')
+            try:
+                return future.result(timeout=self.wait_seconds)
+            except FutureTimeout:
+                self._count('conflicts')
+                raise IdempotencyConflict(f"{record_id} is still in progress")
+
+        try:
+            result = self._run_once(record_id, func, fingerprint)
+            if result is not None:
+                self.cache.set(record_id, (fingerprint, result))
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(record_id, None)
+
+    def _run_once(self, record_id: str, func: Callable[[], Any], fingerprint: Optional[str]) -> Any:
+        owner = uuid.uuid4().hex
+        claimed = self._claim(record_id, fingerprint, owner)
+        if claimed is not True:
+            return claimed
+        self._start_lease(record_id, owner)
+        try:
+            result = func()
+        except BaseException:
+            self._end_lease(record_id)
+            self._release(record_id, owner)
+            raise
+        self._end_lease(record_id)
+        self._count('executed')
+        if result is None:
+            self._release(record_id, owner)
+        else:
+            self._complete(record_id, result, fingerprint)
+        return result
+
+    def _start_lease(self, record_id: str, owner: str):
+        if self.collection is None:
+            return
+        with self._lock:
+            self._leases[record_id] = owner
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases, name='idempotency-lease', daemon=True)
+                self._renewer.start()
+
+    def _end_lease(self, record_id: str):
+        with self._lock:
+            self._leases.pop(record_id, None)
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                leases = list(self._leases.items())
+            for record_id, owner in leases:
+                try:
+                    renewed = self.collection.update_one(
+                        {'_id': record_id, 'status': 'pending', 'owner': owner},
+                        {'$set': {'lease_until': datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                    ).matched_count
+                    with self._lock:
+                        still_running = self._leases.get(record_id) == owner
+                    if not renewed and still_running:
+                        logger.warning(f"Idempotency claim on {record_id} was lost while it was running")
+                except Exception as e:
+                    logger.error(f"Error renewing idempotency claim {record_id}: {e}")
+
+    def _claim(self, record_id: str, fingerprint: Optional[str], owner: str) -> Any:
+        """True when this caller should run the operation, else the stored result."""
+        if self.collection is None:
+            return True
+        deadline = time.monotonic() + self.wait_seconds
+        try:
+            while True:
+                now = datetime.utcnow()
+                try:
+                    self.collection.insert_one({
+                        '_id': record_id,
+                        'status': 'pending',
+                        'owner': owner,
+                        'fingerprint': fingerprint,
+                        'created_at': now,
+                        'lease_until': now + timedelta(seconds=self.lease_seconds)
+                    })
+                    return True
+                except DuplicateKeyError:
+                    pass
+                record = self.collection.find_one({'_id': record_id})
+                if record is not None:
+                    self._check_fingerprint(record_id, record.get('fingerprint'), fingerprint)
+                if record is not None and record['status'] == 'done':
+                    self._count('replayed')
+                    return record['result']
+                # Take over a claim whose owner died before finishing it
+                if record is not None and self.collection.find_one_and_update(
+                        {'_id': record_id, 'status': 'pending', 'lease_until': {'$lte': now}},
+                        {'$set': {'owner': owner, 'lease_until': now + timedelta(seconds=self.lease_seconds)}}) is not None:
+                    return True
+                if time.monotonic() >= deadline:
+                    self._count('conflicts')
+                    raise IdempotencyConflict(f"{record_id} is still in progress")
+                time.sleep(POLL_SECONDS)
+        except (IdempotencyConflict, IdempotencyKeyReused):
+            raise
+        except Exception as e:
+            logger.error(f"Idempotency store unavailable, running {record_id} unchecked: {e}")
+            return True
+
+    def _complete(self, record_id: str, result: Any, fingerprint: Optional[str]):
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {'_id': record_id},
+                {'$set': {'status': 'done', 'result': result, 'fingerprint': fingerprint,
+                          'created_at': datetime.utcnow()},
+                 '$unset': {'lease_until': '', 'owner': ''}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error storing idempotent result for {record_id}: {e}")
+
+    def _release(self, record_id: str, owner: str):
+        if self.collection is None:
+            return
+        try:
+            # Only our own claim; one taken over meanwhile belongs to its new owner
+            self.collection.delete_one({'_id': record_id, 'status': 'pending', 'owner': owner})
+        except Exception as e:
+            logger.error(f"Error releasing idempotency claim {record_id}: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store(storage=None) -> IdempotencyStore:
+    """Return the process-wide store, persisted by the storage backend unless IDEMPOTENCY_STORE=memory."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                persisted = storage is not None and idempotency_persisted()
+                _store = storage.create_idempotency_store() if persisted else IdempotencyStore()
+    return _store
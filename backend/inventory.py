@@ -0,0 +1,445 @@
+from typing import Any, Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
+import os
+import threading
+import time
+import logging
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAILY_CAPACITY = 2000
+DEFAULT_SLOT_CAPACITY = 250
+DEFAULT_HOLD_SECONDS = 900
+
+
+class PastVisitDate(ValueError):
+    """Seats were asked for on a date that has already gone by."""
+
+
+def inventory_enabled() -> bool:
+    return os.getenv('INVENTORY_ENABLED', 'true').lower() == 'true'
+
+
+def inventory_key(visit_date: str, slot: Optional[str] = None) -> str:
+    """'YYYY-MM-DD', or 'YYYY-MM-DDT<slot>' for a time slot. Raises ValueError for anything else."""
+    day = date.fromisoformat(visit_date.strip()).isoformat()
+    return f"{day}T{slot}" if slot else day
+
+
+class BaseInventory:
+    """Reservation logic shared by every storage backend.
+
+    Subclasses supply the atomic primitives: _create, _take, _add_remaining,
+    _read, _get_hold, _swap_hold, _mark_confirmed, _is_confirmed, _pop_hold,
+    _pop_expired and _change_capacity. Each must be atomic against
+    concurrent callers of the same backend; the logic here relies on that.
+
+    Remaining counts seen in storage are cached for
+    INVENTORY_CACHE_TTL_SECONDS. This lets a date known to be sold out be
+    refused without a round trip. The cache is never used to grant seats.
+    """
+
+    def __init__(self, daily_capacity: Optional[int] = None, slot_capacity: Optional[int] = None,
+                 hold_seconds: Optional[float] = None, cache_ttl: Optional[float] = None):
+        self.daily_capacity = daily_capacity or int(os.getenv('INVENTORY_DAILY_CAPACITY', DEFAULT_DAILY_CAPACITY))
+        self.slot_capacity = slot_capacity or int(os.getenv('INVENTORY_SLOT_CAPACITY', DEFAULT_SLOT_CAPACITY))
+        self.hold_seconds = hold_seconds or float(os.getenv('INVENTORY_HOLD_SECONDS', DEFAULT_HOLD_SECONDS))
+        self._remaining = TTLCache(ttl_seconds=cache_ttl or float(os.getenv('INVENTORY_CACHE_TTL_SECONDS', 2)),
+                                   max_entries=4096)
+        self._known = set()
+        self._lock = threading.Lock()
+        self._stats = {'reserved': 0, 'sold_out': 0, 'cache_rejections': 0, 'released': 0, 'expired': 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, cached_dates=len(self._remaining))
+
+    def ensure_indexes(self):
+        pass
+
+    def _create(self, key: str, capacity: int):
+        """Create the date/slot with `capacity` seats unless it already exists."""
+        raise NotImplementedError
+
+    def _take(self, key: str, count: int) -> Optional[int]:
+        """Subtract count if at least that many remain; the new remaining, else None."""
+        raise NotImplementedError
+
+    def _add_remaining(self, key: str, count: int):
+        raise NotImplementedError
+
+    def _read(self, key: str) -> Optional[Dict[str, int]]:
+        """{'capacity': ..., 'remaining': ...} or None."""
+        raise NotImplementedError
+
+    def _get_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        """A booking's hold ({'key': ..., 'count': ...}) or None."""
+        raise NotImplementedError
+
+    def _swap_hold(self, booking_ref: str, key: str, count: int, expires_at: datetime,
+                   expected: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Replace the booking's hold, if any, with a new held one in one step; returns
+        (True, the previous hold or None). With `expected`, only a hold that still has
+        its key and count is replaced; (False, None) when it has changed meanwhile."""
+        raise NotImplementedError
+
+    def _mark_confirmed(self, booking_ref: str) -> bool:
+        """held -> confirmed; False when there is no held hold for the booking."""
+        raise NotImplementedError
+
+    def _is_confirmed(self, booking_ref: str) -> bool:
+        raise NotImplementedError
+
+    def _pop_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        """Delete and return a booking's hold ({'key': ..., 'count': ...}), whatever its status."""
+        raise NotImplementedError
+
+    def _pop_expired(self, key: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        """Delete and return one held hold expired at `now`, for one date/slot or any."""
+        raise NotImplementedError
+
+    def _change_capacity(self, key: str, capacity: int):
+        """Set capacity, moving remaining by the same amount so held and sold seats are kept."""
+        raise NotImplementedError
+
+    def _ensure(self, key: str, slot: Optional[str]):
+        if key in self._known:
+            return
+        self._create(key, self.slot_capacity if slot else self.daily_capacity)
+        self._known.add(key)
+
+    def _restore(self, key: str, count: int):
+        self._add_remaining(key, count)
+        self._remaining.invalidate(key)
+
+    def availability(self, visit_date: str, slot: Optional[str] = None) -> Dict[str, Any]:
+        key = inventory_key(visit_date, slot)
+        self._ensure(key, slot)
+        doc = self._read(key)
+        self._remaining.set(key, doc['remaining'])
+        return {'visit_date': key[:10], 'slot': slot, 'capacity': doc['capacity'], 'remaining': doc['remaining']}
+
+    def _take_seats(self, key: str, slot: Optional[str], count: int) -> Optional[int]:
+        cached = self._remaining.get(key)
+        if cached is not None and cached < count:
+            self._count('cache_rejections')
+            return None
+
+        self._ensure(key, slot)
+        remaining = self._take(key, count)
+        # Seats may be sitting in expired holds the sweeper has not reached yet
+        if remaining is None and self.release_expired(key):
+            remaining = self._take(key, count)
+        if remaining is None:
+            doc = self._read(key)
+            if doc is not None:
+                self._remaining.set(key, doc['remaining'])
+            return None
+        self._remaining.set(key, remaining)
+        return remaining
+
+    def reserve(self, booking_ref: str, visit_date: str, count: int, slot: Optional[str] = None) -> Optional[int]:
+        """Hold `count` seats for a booking; returns the seats left, or None when sold out.
+
+        An earlier hold for the same booking_ref is moved, not added to: the new
+        seats are taken first, the hold is swapped in one step, and only then are
+        the old seats given back, so there is no moment when neither is held.
+        When the date is full the earlier hold is kept. Raises ValueError for a
+        bad date or a count below 1, and PastVisitDate for a date gone by.
+        """
+        key = inventory_key(visit_date, slot)
+        # A negative take would add seats to the date
+        if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+            raise ValueError(f"Cannot reserve {count!r} seats")
+        if date.fromisoformat(key[:10]) < date.today():
+            raise PastVisitDate(f"{key[:10]} is in the past")
+        expires_at = datetime.utcnow() + timedelta(seconds=self.hold_seconds)
+
+        remaining = self._take_seats(key, slot, count)
+        if remaining is not None:
+            try:
+                _, previous = self._swap_hold(booking_ref, key, count, expires_at)
+            except Exception:
+                self._restore(key, count)
+                raise
+            if previous is not None:
+                self._restore(previous['key'], previous['count'])
+                remaining += previous['count'] if previous['key'] == key else 0
+            self._count('reserved')
+            return remaining
+
+        # A booking changing its ticket count on the same date only needs the difference
+        held = self._get_hold(booking_ref)
+        if held is None or held['key'] != key:
+            self._count('sold_out')
+            return None
+        extra = count - held['count']
+        if extra > 0 and self._take_seats(key, slot, extra) is None:
+            self._count('sold_out')
+            return None
+        swapped, _ = self._swap_hold(booking_ref, key, count, expires_at, expected=held)
+        if not swapped:
+            # Another turn moved the hold first; its seats are its own
+            if extra > 0:
+                self._restore(key, extra)
+            self._count('sold_out')
+            return None
+        if extra < 0:
+            self._restore(key, -extra)
+        self._count('reserved')
+        return self._read(key)['remaining']
+
+    def confirm(self, booking_ref: str, visit_date: str, count: int, slot: Optional[str] = None) -> bool:
+        """Turn a booking's hold into a sale. If the hold already expired, try to
+        reserve again; False means the date filled up in the meantime."""
+        if self._mark_confirmed(booking_ref) or self._is_confirmed(booking_ref):
+            return True
+        if self.reserve(booking_ref, visit_date, count, slot) is None:
+            return False
+        return self.confirm(booking_ref, visit_date, count, slot)
+
+    def release(self, booking_ref: str) -> int:
+        """Give a booking's seats back, whether held or confirmed; returns how many."""
+        hold = self._pop_hold(booking_ref)
+        if hold is None:
+            return 0
+        self._restore(hold['key'], hold['count'])
+        self._count('released', hold['count'])
+        return hold['count']
+
+    def release_expired(self, key: Optional[str] = None) -> int:
+        """Release unpaid holds past their expiry, for one date/slot or all; returns seats freed."""
+        now = datetime.utcnow()
+        freed = 0
+        while True:
+            hold = self._pop_expired(key, now)
+            if hold is None:
+                break
+            self._restore(hold['key'], hold['count'])
+            freed += hold['count']
+        if freed:
+            self._count('expired', freed)
+        return freed
+
+    def set_capacity(self, visit_date: str, capacity: int, slot: Optional[str] = None) -> Dict[str, Any]:
+        """Change a date's capacity, keeping seats already held or sold. Raises ValueError below 0."""
+        if capacity < 0:
+            raise ValueError(f"Capacity cannot be negative, got {capacity}")
+        key = inventory_key(visit_date, slot)
+        self._ensure(key, slot)
+        self._change_capacity(key, capacity)
+        self._remaining.invalidate(key)
+        return self.availability(visit_date, slot)
+
+    def start_sweeper(self, interval: Optional[float] = None) -> threading.Thread:
+        interval = interval or float(os.getenv('INVENTORY_SWEEP_SECONDS', 60))
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    freed = self.release_expired()
+                    if freed:
+                        logger.info(f"Released {freed} seat(s) from expired holds")
+                except Exception as e:
+                    logger.error(f"Capacity hold sweep failed: {e}")
+
+        thread = threading.Thread(target=sweep, name='capacity-hold-sweep', daemon=True)
+        thread.start()
+        return thread
+
+
+class CapacityInventory(BaseInventory):
+    """Per-date (and optionally per-slot) visitor capacity in Mongo.
+
+    Each date or slot is a `capacity` document holding `remaining`. A
+    reservation is one conditional find_one_and_update ({remaining >= n} →
+    $inc -n), so concurrent bookings for the same date can never take it
+    below zero, on one process or many. The seats taken are recorded as a
+    hold keyed by booking_ref in `capacity_holds`. Unpaid holds expire after
+    INVENTORY_HOLD_SECONDS, and the sweeper hands their seats back. Every
+    release is a find_one_and_delete on the hold, so a seat is never
+    returned twice.
+    """
+
+    def __init__(self, db, daily_capacity: Optional[int] = None, slot_capacity: Optional[int] = None,
+                 hold_seconds: Optional[float] = None, cache_ttl: Optional[float] = None):
+        super().__init__(daily_capacity, slot_capacity, hold_seconds, cache_ttl)
+        self.capacity = db['capacity']
+        self.holds = db['capacity_holds']
+
+    def ensure_indexes(self):
+        self.holds.create_index([('status', ASCENDING), ('expires_at', ASCENDING)], name='status_expires_at')
+        self.holds.create_index([('key', ASCENDING)], name='key')
+
+    def _create(self, key: str, capacity: int):
+        try:
+            self.capacity.update_one(
+                {'_id': key},
+                {'$setOnInsert': {'capacity': capacity, 'remaining': capacity}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # another process created it first
+
+    def _take(self, key: str, count: int) -> Optional[int]:
+        doc = self.capacity.find_one_and_update(
+            {'_id': key, 'remaining': {'$gte': count}},
+            {'$inc': {'remaining': -count}},
+            projection={'remaining': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return None if doc is None else doc['remaining']
+
+    def _add_remaining(self, key: str, count: int):
+        self.capacity.update_one({'_id': key}, {'$inc': {'remaining': count}})
+
+    def _read(self, key: str) -> Optional[Dict[str, int]]:
+        return self.capacity.find_one({'_id': key}, {'_id': 0, 'capacity': 1, 'remaining': 1})
+
+    def _get_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        return self.holds.find_one({'_id': booking_ref}, {'_id': 0, 'key': 1, 'count': 1})
+
+    def _swap_hold(self, booking_ref: str, key: str, count: int, expires_at: datetime,
+                   expected: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        query = {'_id': booking_ref}
+        if expected is not None:
+            query.update(key=expected['key'], count=expected['count'])
+        previous = self.holds.find_one_and_replace(
+            query,
+            {'key': key, 'count': count, 'status': 'held', 'expires_at': expires_at},
+            projection={'_id': 0, 'key': 1, 'count': 1},
+            upsert=expected is None,
+            return_document=ReturnDocument.BEFORE
+        )
+        if expected is not None:
+            return previous is not None, previous
+        return True, previous
+
+    def _mark_confirmed(self, booking_ref: str) -> bool:
+        return self.holds.find_one_and_update(
+            {'_id': booking_ref, 'status': 'held'},
+            {'$set': {'status': 'confirmed'}, '$unset': {'expires_at': ''}}
+        ) is not None
+
+    def _is_confirmed(self, booking_ref: str) -> bool:
+        return bool(self.holds.count_documents({'_id': booking_ref, 'status': 'confirmed'}, limit=1))
+
+    def _pop_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        return self.holds.find_one_and_delete({'_id': booking_ref})
+
+    def _pop_expired(self, key: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        query = {'status': 'held', 'expires_at': {'$lte': now}}
+        if key is not None:
+            query['key'] = key
+        return self.holds.find_one_and_delete(query)
+
+    def _change_capacity(self, key: str, capacity: int):
+        while True:
+            doc = self.capacity.find_one({'_id': key})
+            # Compare-and-set on the old capacity so concurrent changes are not lost
+            result = self.capacity.update_one(
+                {'_id': key, 'capacity': doc['capacity']},
+                {'$set': {'capacity': capacity}, '$inc': {'remaining': capacity - doc['capacity']}}
+            )
+            if result.modified_count or doc['capacity'] == capacity:
+                return
+
+
+class MemoryInventory(BaseInventory):
+    """Capacity and holds in dicts behind one lock; for a single process only."""
+
+    def __init__(self, daily_capacity: Optional[int] = None, slot_capacity: Optional[int] = None,
+                 hold_seconds: Optional[float] = None, cache_ttl: Optional[float] = None):
+        super().__init__(daily_capacity, slot_capacity, hold_seconds, cache_ttl)
+        self._capacity: Dict[str, Dict[str, int]] = {}
+        self._holds: Dict[str, Dict[str, Any]] = {}
+        self._data_lock = threading.Lock()
+
+    def _create(self, key: str, capacity: int):
+        with self._data_lock:
+            self._capacity.setdefault(key, {'capacity': capacity, 'remaining': capacity})
+
+    def _take(self, key: str, count: int) -> Optional[int]:
+        with self._data_lock:
+            doc = self._capacity[key]
+            if doc['remaining'] < count:
+                return None
+            doc['remaining'] -= count
+            return doc['remaining']
+
+    def _add_remaining(self, key: str, count: int):
+        with self._data_lock:
+            self._capacity[key]['remaining'] += count
+
+    def _read(self, key: str) -> Optional[Dict[str, int]]:
+        with self._data_lock:
+            doc = self._capacity.get(key)
+            return None if doc is None else dict(doc)
+
+    def _get_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        with self._data_lock:
+            hold = self._holds.get(booking_ref)
+            return None if hold is None else {'key': hold['key'], 'count': hold['count']}
+
+    def _swap_hold(self, booking_ref: str, key: str, count: int, expires_at: datetime,
+                   expected: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with self._data_lock:
+            previous = self._holds.get(booking_ref)
+            if expected is not None and (previous is None or (previous['key'], previous['count']) !=
+                                         (expected['key'], expected['count'])):
+                return False, None
+            self._holds[booking_ref] = {'key': key, 'count': count, 'status': 'held', 'expires_at': expires_at}
+            return True, previous
+
+    def _mark_confirmed(self, booking_ref: str) -> bool:
+        with self._data_lock:
+            hold = self._holds.get(booking_ref)
+            if hold is None or hold['status'] != 'held':
+                return False
+            hold['status'] = 'confirmed'
+            hold['expires_at'] = None
+            return True
+
+    def _is_confirmed(self, booking_ref: str) -> bool:
+        with self._data_lock:
+            hold = self._holds.get(booking_ref)
+            return hold is not None and hold['status'] == 'confirmed'
+
+    def _pop_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        with self._data_lock:
+            return self._holds.pop(booking_ref, None)
+
+    def _pop_expired(self, key: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        with self._data_lock:
+            for booking_ref, hold in self._holds.items():
+                if hold['status'] == 'held' and hold['expires_at'] <= now and key in (None, hold['key']):
+                    return self._holds.pop(booking_ref)
+        return None
+
+    def _change_capacity(self, key: str, capacity: int):
+        with self._data_lock:
+            doc = self._capacity[key]
+            doc['remaining'] += capacity - doc['capacity']
+            doc['capacity'] = capacity
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_inventory(storage) -> BaseInventory:
+    """Return the process-wide inventory for the configured storage backend."""
+    global _inventory
+    if _inventory is None:
+        with _inventory_lock:
+            if _inventory is None:
+                _inventory = storage.create_inventory()
+    return _inventory
@@ -0,0 +1,249 @@
+from typing import Callable, Dict, Iterable, Iterator, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import re
+import threading
+import time
+import logging
+from cache import TTLCache
+from startup import startup_phase
+
+logger = logging.getLogger(__name__)
+
+# Optional LLM support. The ollama client is imported on first use only, so
+# processes without LLM_MODEL set never load it.
+DEFAULT_MODEL = "deepseek-r1:1.5b"
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT_SECONDS', 20))
+
+SYSTEM_PROMPT = """You are the visitor assistant of the National Museum of India, Janpath, New Delhi.
+Answer questions about the museum in at most three short sentences. Facts you can rely on:
+- Open Tuesday to Sunday, 10:00 AM - 6:00 PM; closed on Mondays and National Holidays
+- Tickets: adults Rs. 500, students Rs. 250, children under 12 free; book them in this chat
+- Over 200,000 works of art spanning 5,000 years of cultural heritage
+- Phone +91-11-23019272, email info@nationalmuseum.in
+If a question is not about the museum or a visit, say that you can only help with museum queries."""
+
+# Words that do not change what a visitor is asking; dropped from cache keys.
+# "museum" is implied in every question this assistant gets.
+STOP_WORDS = frozenset(
+    'a an and any are at be can could do does for have i is it me museum my of on please '
+    'tell the them there to us we what you your'.split()
+)
+NON_WORDS = re.compile(r'[^a-z0-9 ]+')
+THINK_BLOCK = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+TokenCallback = Callable[[str], None]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def llm_enabled() -> bool:
+    return bool(os.getenv('LLM_MODEL'))
+
+
+def llm_model() -> str:
+    return os.getenv('LLM_MODEL', DEFAULT_MODEL)
+
+
+def get_ollama_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                with startup_phase('ollama import'):
+                    import ollama
+                _client = ollama.Client(host=os.getenv('OLLAMA_HOST'), timeout=LLM_TIMEOUT)
+                logger.info(f"Loaded ollama client for model {llm_model()}")
+    return _client
+
+
+def visible_tokens(chunks: Iterable[str]) -> Iterator[str]:
+    """Pass streamed text through, holding back a leading <think>...</think> block."""
+    buffer = ''
+    thinking = None  # undecided until the stream either opens a think block or cannot
+    for chunk in chunks:
+        if thinking is False:
+            if chunk:
+                yield chunk
+            continue
+        buffer += chunk
+        if thinking is None:
+            head = buffer.lstrip()
+            if head.startswith('<think>'):
+                thinking = True
+            elif '<think>'.startswith(head):
+                continue
+            else:
+                thinking = False
+                yield buffer
+                continue
+        end = buffer.find('</think>')
+        if end != -1:
+            thinking = False
+            rest = buffer[end + len('</think>'):].lstrip()
+            if rest:
+                yield rest
+    if thinking is None and buffer:
+        yield buffer
+
+
+def _fold_plural(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+
+def normalize_question(question: str) -> str:
+    """Cache key for a free-text question: case, punctuation, filler words,
+    plurals and word order are ignored, so "What time does the museum open?"
+    and "museum open time" share one cached answer."""
+    words = NON_WORDS.sub(' ', question.lower()).split()
+    return ' '.join(sorted({_fold_plural(word) for word in words if word not in STOP_WORDS}))
+
+
+class LLMFallback:
+    """Answers free-text questions the booking flow cannot match.
+
+    Answers are cached by normalised question for LLM_CACHE_TTL_SECONDS.
+    Concurrent identical questions are coalesced onto one model call
+    (single flight). At most LLM_MAX_CONCURRENCY calls reach the model,
+    each on this fallback's own threads. A caller waits at most
+    LLM_TIMEOUT_SECONDS in total, for a slot, the model and a streamed
+    reply together; one that runs out of time gets None, and the flow falls
+    back to its canned reply. A call that outlives its caller stops at the
+    same deadline. Failures are not cached.
+    """
+
+    def __init__(self, ask: Optional[Callable[[str, Optional[TokenCallback], float], str]] = None,
+                 timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 cache_ttl: Optional[float] = None, cache_size: Optional[int] = None):
+        self.timeout = timeout or LLM_TIMEOUT
+        self.cache = TTLCache(
+            ttl_seconds=cache_ttl or int(os.getenv('LLM_CACHE_TTL_SECONDS', 3600)),
+            max_entries=cache_size or int(os.getenv('LLM_CACHE_MAX_ENTRIES', 2048))
+        )
+        self._ask = ask or self._ask_ollama
+        max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Model calls run here, so a caller can stop waiting at its deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {'cache_hits': 0, 'coalesced': 0, 'model_calls': 0, 'timeouts': 0, 'rejected': 0, 'errors': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._inflight), cached=len(self.cache))
+
+    def _ask_ollama(self, question: str, on_token: Optional[TokenCallback], deadline: float) -> str:
+        messages = [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': question}
+        ]
+        if on_token is None:
+            # Nothing arrives until the answer is complete, so the client's read timeout bounds the call
+            return get_ollama_client().chat(model=llm_model(), messages=messages)['message']['content']
+
+        # The client's timeout applies per read, so a steady stream is cut off here instead
+        parts = []
+        chunks = get_ollama_client().chat(model=llm_model(), messages=messages, stream=True)
+        for text in visible_tokens(chunk['message']['content'] for chunk in chunks):
+            if time.monotonic() > deadline:
+                chunks.close()
+                raise TimeoutError(f"streamed answer still running after {self.timeout:.1f}s")
+            parts.append(text)
+            on_token(text)
+        return ''.join(parts)
+
+    def _call_model(self, question: str, key: str, future: Future, on_token: Optional[TokenCallback],
+                    deadline: float) -> Optional[str]:
+        # Runs on the executor with a slot already taken; settles the single-flight future either way
+        answer = None
+        try:
+            self._count('model_calls')
+            answer = THINK_BLOCK.sub('', self._ask(question, on_token, deadline)).strip() or None
+            if answer is not None:
+                self.cache.set(key, answer)
+            return answer
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                # The caller has already given up and will not see this
+                logger.warning(f"Abandoned LLM call failed: {e}")
+            raise
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(answer)
+
+    def _failed(self, e: Exception, start: float):
+        self._count('timeouts' if 'timeout' in type(e).__name__.lower() else 'errors')
+        logger.error(f"LLM fallback failed after {time.monotonic() - start:.1f}s: {e}")
+
+    def answer(self, question: str, on_token: Optional[TokenCallback] = None) -> Optional[str]:
+        """Answer a question, or None. With on_token, a caller whose question
+        goes to the model receives the answer text as it is generated; cached
+        and coalesced answers arrive only as the return value."""
+        key = normalize_question(question)
+        if not key:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count('cache_hits')
+            return cached
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._count('coalesced')
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self._count('timeouts')
+                return None
+
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('rejected')
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(None)
+            return None
+        try:
+            call = self._executor.submit(self._call_model, question, key, future, on_token, deadline)
+        except Exception as e:
+            self._slots.release()
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(None)
+            self._failed(e, start)
+            return None
+        try:
+            return call.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # The call carries on and caches its answer for the next asker, if it makes it in time
+            self._count('timeouts')
+            logger.error(f"LLM fallback gave up after {time.monotonic() - start:.1f}s")
+            return None
+        except Exception as e:
+            self._failed(e, start)
+            return None
+
+
+_llm_fallback = None
+
+
+def get_llm_fallback() -> LLMFallback:
+    global _llm_fallback
+    if _llm_fallback is None:
+        with _client_lock:
+            if _llm_fallback is None:
+                _llm_fallback = LLMFallback()
+    return _llm_fallback
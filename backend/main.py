@@ -1,12 +1,28 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from database import DatabaseHandler
-from chatbot import chatbot_service
-from ticket_generator import generate_ticket_pdf
-from fastapi.responses import FileResponse
+from startup import startup_phase, startup_report, log_startup_report
+
+with startup_phase('imports'):
+    from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+    from fastapi.middleware.cors import CORSMiddleware
+    from storage import AsyncStorage
+    from chatbot import chatbot_service
+    from ticket_service import ticket_render_service, TicketQueueFull
+    from ticket_generator import ticket_filename, ticket_data_from_booking, build_ticket_zip, TICKET_FIELDS
+    from ticket_cache import ticket_cache, ticket_cache_key
+    from cache import TTLCache, make_etag, etag_matches
+    from validation import validate_batch
+    from faq_index import faq_index, FAQ_RESCAN_SECONDS
+    from idempotency import get_idempotency_store, IdempotencyConflict, IdempotencyKeyReused
+    from metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, render_metrics
+    from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import functools
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import logging
+from typing import Optional
 
 load_dotenv()
 
@@ -22,15 +38,153 @@ app.add_middleware(
 )
 
 logger = logging.getLogger(__name__)
-db = DatabaseHandler()
+db = AsyncStorage()
+idempotency = get_idempotency_store(db.sync)
+# Chat turns can wait on the LLM fallback for up to LLM_TIMEOUT_SECONDS, so they run
+# on their own threads and never hold the storage executor that other routes need
+chat_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CHAT_EXECUTOR_WORKERS', 32)),
+                                   thread_name_prefix='chat')
+
+TICKET_BATCH_MAX = int(os.getenv('TICKET_BATCH_MAX', 1000))
+
+MUSEUM_INFO_TTL = int(os.getenv('MUSEUM_INFO_CACHE_TTL', 3600))
+museum_info_cache = TTLCache(ttl_seconds=MUSEUM_INFO_TTL, max_entries=1)
+museum_info_lock = asyncio.Lock()
+
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template, not the raw path, keeps label cardinality bounded
+        route = request.scope.get('route')
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                     route.path if route is not None else 'unmatched', status)
+
+@app.on_event("startup")
+async def startup():
+    if os.getenv('MONGODB_ENSURE_INDEXES', 'true').lower() == 'true':
+        # Run in the background so an unreachable Mongo does not hold up startup
+        asyncio.create_task(db.ensure_indexes())
+        asyncio.create_task(db.run(chatbot_service.sessions.ensure_indexes))
+    with startup_phase('faq index'):
+        faq_index.index_content_dir()
+    # museum_info passages join the index once Mongo answers, without holding up startup
+    asyncio.create_task(db.run(reindex_museum_info))
+    if os.getenv('MUSEUM_INFO_WATCH', 'false').lower() == 'true':
+        db.watch_museum_info(on_museum_info_change)
+    if FAQ_RESCAN_SECONDS > 0:
+        faq_index.watch_content_dir(FAQ_RESCAN_SECONDS)
+    if chatbot_service.inventory is not None:
+        chatbot_service.inventory.start_sweeper()
+    log_startup_report()
+
+def reindex_museum_info():
+    faq_index.index_museum_info(db.sync.get_museum_info())
+
+def on_museum_info_change():
+    museum_info_cache.invalidate()
+    reindex_museum_info()
+
+@app.on_event("shutdown")
+def shutdown():
+    chat_executor.shutdown(wait=False)
+    db.close()
+    ticket_render_service.shutdown()
+
+async def run_chat_turn(*args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chat_executor, functools.partial(chatbot_service.get_response, *args))
+
+async def load_museum_info():
+    cached = museum_info_cache.get('museum_info')
+    if cached is not None:
+        return cached
+    async with museum_info_lock:
+        cached = museum_info_cache.get('museum_info')
+        if cached is None:
+            museum_info = await db.get_museum_info()
+            if not museum_info:
+                return None
+            cached = (museum_info, make_etag(museum_info))
+            museum_info_cache.set('museum_info', cached)
+        return cached
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/admin/db-pool")
+async def db_pool_stats():
+    return db.sync.pool_stats()
+
+@app.get("/admin/startup")
+async def startup_stats():
+    return startup_report()
+
+@app.post("/admin/museum-info/invalidate")
+async def invalidate_museum_info():
+    museum_info_cache.invalidate()
+    return {'invalidated': True}
+
+@app.post("/admin/faq/reindex")
+async def reindex_faq():
+    await db.run(reindex_museum_info)
+    files = await db.run(faq_index.index_content_dir)
+    return {'documents': len(faq_index), 'files_reindexed': files}
+
+def require_inventory():
+    if chatbot_service.inventory is None:
+        raise HTTPException(status_code=404, detail="Capacity inventory is disabled")
+    return chatbot_service.inventory
+
+@app.get("/availability/{visit_date}")
+async def get_availability(visit_date: str, slot: str = None):
+    inventory = require_inventory()
+    try:
+        return await db.run(inventory.availability, visit_date, slot)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="visit_date must be YYYY-MM-DD")
+
+@app.put("/admin/inventory/{visit_date}")
+async def set_capacity(visit_date: str, request: dict):
+    inventory = require_inventory()
+    try:
+        capacity = int(request['capacity'])
+        if capacity < 0:
+            raise HTTPException(status_code=422, detail="capacity cannot be negative")
+        return await db.run(inventory.set_capacity, visit_date, capacity, request.get('slot'))
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Expected a YYYY-MM-DD date and an integer capacity")
+
+@app.get("/admin/inventory")
+async def inventory_stats():
+    return require_inventory().stats()
+
+@app.get("/admin/sessions")
+async def session_stats():
+    return chatbot_service.sessions.stats()
 
 @app.get("/museum-info")
-async def get_museum_info():
+async def get_museum_info(request: Request):
     try:
-        museum_info = db.get_museum_info()
-        if not museum_info:
+        cached = await load_museum_info()
+        if not cached:
             raise HTTPException(status_code=404, detail="Museum information not found")
-        return museum_info
+        museum_info, etag = cached
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={MUSEUM_INFO_TTL}'
+        }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=museum_info, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching museum info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -43,27 +197,193 @@ async def chat(request: dict):
             
         user_message = request['message']
         current_state = request.get('currentState', 'greeting')
+        session_id = request.get('sessionId')
         
-        response = chatbot_service.get_response(user_message, current_state)
+        # get_response may hit Mongo (payment step) or the LLM, so keep it off the event loop
+        response = await run_chat_turn(user_message, current_state, session_id)
         return response
         
     except Exception as e:
         logger.error(f"Server Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def chat_events(request: dict):
+    """Run one chat turn, yielding ('delta', text) events while the reply is
+    produced (LLM answers stream token by token) and then ('done', response)."""
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+
+    def on_token(text):
+        loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+    turn = asyncio.ensure_future(run_chat_turn(
+        request['message'], request.get('currentState', 'greeting'), request.get('sessionId'), on_token
+    ))
+    # Queued after any tokens the turn produced, so it marks the end of the stream
+    turn.add_done_callback(lambda _: tokens.put_nowait(None))
+    while (text := await tokens.get()) is not None:
+        yield 'delta', text
+    yield 'done', turn.result()
+
+@app.post("/chat/stream")
+async def chat_stream(request: dict):
+    if 'message' not in request:
+        raise HTTPException(status_code=400, detail="No message provided")
+
+    async def events():
+        try:
+            async for event, data in chat_events(request):
+                payload = {'text': data} if event == 'delta' else data
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            logger.error(f"Server Error: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    # One connection per visitor for the whole conversation; frames carry the request id
+    await websocket.accept()
+    try:
+        while True:
+            request = await websocket.receive_json()
+            request_id = request.get('id')
+            if 'message' not in request:
+                await websocket.send_json({'id': request_id, 'type': 'error', 'detail': "No message provided"})
+                continue
+            try:
+                async for event, data in chat_events(request):
+                    if event == 'delta':
+                        await websocket.send_json({'id': request_id, 'type': 'delta', 'text': data})
+                    else:
+                        await websocket.send_json({'id': request_id, 'type': 'done', 'response': data})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.error(f"Server Error: {str(e)}")
+                await websocket.send_json({'id': request_id, 'type': 'error', 'detail': str(e)})
+    except WebSocketDisconnect:
+        pass
+
+def pdf_response(pdf_bytes: bytes, filename: str) -> Response:
+    return Response(
+        content=pdf_bytes,
+        media_type='application/pdf',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def queue_full_error(e: TicketQueueFull) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '2'})
+
 @app.post("/generate-ticket")
-async def generate_ticket(ticket_data: dict):
+async def generate_ticket(ticket_data: dict, idempotency_key: Optional[str] = Header(None)):
     try:
-        pdf_path = generate_ticket_pdf(ticket_data)
-        return FileResponse(
-            pdf_path,
-            media_type='application/pdf',
-            filename=f"museum-ticket-{ticket_data['booking_ref']}.pdf"
-        )
+        if idempotency_key:
+            # A retried download replays the first PDF, on this worker or another, but only for the same ticket
+            pdf_bytes = await db.run(idempotency.run, 'ticket', idempotency_key, lambda: ticket_cache.get_or_render(
+                ticket_data, ticket_render_service.render_sync), ticket_cache_key(ticket_data))
+        else:
+            pdf_bytes = ticket_cache.get(ticket_data)
+            if pdf_bytes is None:
+                pdf_bytes = await ticket_render_service.render(ticket_data)
+                ticket_cache.put(ticket_data, pdf_bytes)
+        return pdf_response(pdf_bytes, ticket_filename(ticket_data['booking_ref']))
+    except TicketQueueFull as e:
+        raise queue_full_error(e)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating ticket: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def resolve_batch_tickets(request: dict):
+    if request.get('booking_refs'):
+        booking_refs = [str(ref) for ref in request['booking_refs']]
+        bookings = {
+            booking['booking_ref']: booking
+            for booking in await db.get_bookings(booking_refs, list(TICKET_FIELDS))
+        }
+        missing = [ref for ref in booking_refs if ref not in bookings]
+        if missing:
+            raise HTTPException(status_code=404, detail={'missing_booking_refs': missing})
+        return [ticket_data_from_booking(bookings[ref]) for ref in booking_refs]
+
+    tickets, errors = validate_batch(request.get('tickets') or [], required=TICKET_FIELDS)
+    if errors:
+        raise HTTPException(status_code=400, detail={
+            'invalid_tickets': sorted(errors),
+            'errors': {str(index): fields for index, fields in errors.items()}
+        })
+    return tickets
+
+@app.post("/generate-tickets")
+async def generate_tickets(request: dict):
+    output_format = request.get('format', 'pdf')
+    if output_format not in ('pdf', 'zip'):
+        raise HTTPException(status_code=400, detail="format must be 'pdf' or 'zip'")
+
+    tickets = await resolve_batch_tickets(request)
+    if not tickets:
+        raise HTTPException(status_code=400, detail="No booking_refs or tickets provided")
+    if len(tickets) > TICKET_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {TICKET_BATCH_MAX} tickets per batch")
+
+    try:
+        if output_format == 'pdf':
+            pdf_bytes = await ticket_render_service.render_combined(tickets)
+            return pdf_response(pdf_bytes, f"museum-tickets-{len(tickets)}.pdf")
+
+        pdfs = [ticket_cache.get(ticket) for ticket in tickets]
+        pending = [ticket for ticket, pdf_bytes in zip(tickets, pdfs) if pdf_bytes is None]
+        if pending:
+            rendered = iter(await ticket_render_service.render_batch(pending))
+            for i, pdf_bytes in enumerate(pdfs):
+                if pdf_bytes is None:
+                    pdfs[i] = next(rendered)
+                    ticket_cache.put(tickets[i], pdfs[i])
+        return Response(
+            content=build_ticket_zip(tickets, pdfs),
+            media_type='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="museum-tickets-{len(tickets)}.zip"'}
+        )
+    except TicketQueueFull as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logger.error(f"Error generating ticket batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ticket-jobs", status_code=202)
+async def submit_ticket_job(ticket_data: dict):
+    if 'booking_ref' not in ticket_data:
+        raise HTTPException(status_code=400, detail="No booking_ref provided")
+    try:
+        job_id = ticket_render_service.submit(ticket_data)
+    except TicketQueueFull as e:
+        raise queue_full_error(e)
+    return {'job_id': job_id, 'status': 'pending', 'status_url': f"/ticket-jobs/{job_id}"}
+
+@app.get("/ticket-jobs/{job_id}")
+async def get_ticket_job(job_id: str):
+    status = ticket_render_service.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ticket job not found")
+    return status
+
+@app.get("/ticket-jobs/{job_id}/pdf")
+async def get_ticket_job_pdf(job_id: str):
+    status = ticket_render_service.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ticket job not found")
+    if status['status'] == 'pending':
+        raise HTTPException(status_code=409, detail="Ticket is still rendering")
+    if status['status'] == 'failed':
+        raise HTTPException(status_code=500, detail=status['error'])
+    pdf_bytes = ticket_render_service.get_job(job_id).result()
+    return pdf_response(pdf_bytes, f"museum-ticket-{job_id}.pdf")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5000) 
\ No newline at end of file
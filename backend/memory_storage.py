@@ -0,0 +1,90 @@
+from typing import Dict, Any, Callable, List, Optional
+from datetime import datetime
+import copy
+import itertools
+import threading
+import logging
+from inventory import MemoryInventory
+from idempotency import IdempotencyStore
+from storage import Storage, project
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage(Storage):
+    """Everything in dicts in this process: no service to run and no I/O.
+
+    Meant for benchmarks, local development and single-process demos; all
+    data is lost on restart and is not shared between workers.
+    """
+
+    backend = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.bookings: Dict[str, Dict[str, Any]] = {}
+        self.tickets: Dict[str, Dict[str, Any]] = {}
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self.museum_info: Optional[Dict[str, Any]] = None
+        self._museum_info_listeners: List[Callable[[], None]] = []
+
+    def _insert(self, collection: Dict[str, Dict[str, Any]], document: Dict[str, Any], key: Optional[str] = None,
+                on_ack: Optional[Callable] = None) -> str:
+        document_id = str(next(self._ids))
+        document['_id'] = document_id
+        with self._lock:
+            collection[key or document_id] = copy.deepcopy(document)
+        if on_ack is not None:
+            on_ack(document)
+        return document_id
+
+    def save_booking(self, booking_data: Dict[str, Any], on_ack: Optional[Callable] = None) -> bool:
+        booking_ref = booking_data.get('booking_ref')
+        with self._lock:
+            if booking_ref in self.bookings:
+                logger.error(f"Booking {booking_ref} already exists")
+                return False
+            # Claim the ref before the copy so a concurrent save of the same ref is refused
+            self.bookings[booking_ref] = {}
+        booking_data['created_at'] = datetime.now().isoformat()
+        return bool(self._insert(self.bookings, booking_data, booking_ref, on_ack))
+
+    def get_booking(self, booking_ref: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        return project(self.bookings.get(booking_ref) or None, fields)
+
+    def get_bookings(self, booking_refs: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return [project(self.bookings[ref], fields) for ref in dict.fromkeys(booking_refs) if self.bookings.get(ref)]
+
+    def get_museum_info(self) -> Dict[str, Any]:
+        return project(self.museum_info)
+
+    def set_museum_info(self, museum_info: Dict[str, Any]):
+        self.museum_info = copy.deepcopy(museum_info)
+        for on_change in list(self._museum_info_listeners):
+            on_change()
+
+    def watch_museum_info(self, on_change: Callable[[], None]) -> Optional[threading.Thread]:
+        self._museum_info_listeners.append(on_change)
+        return None
+
+    def save_ticket(self, ticket_data: dict, on_ack: Optional[Callable] = None) -> str:
+        ticket_data['created_at'] = datetime.utcnow()
+        return self._insert(self.tickets, ticket_data, on_ack=on_ack)
+
+    def get_ticket(self, ticket_id: str, fields: Optional[List[str]] = None) -> dict:
+        return project(self.tickets.get(ticket_id), fields)
+
+    def save_transaction(self, transaction_data: dict, on_ack: Optional[Callable] = None) -> str:
+        transaction_data['created_at'] = datetime.utcnow()
+        return self._insert(self.transactions, transaction_data, on_ack=on_ack)
+
+    def create_inventory(self) -> MemoryInventory:
+        return MemoryInventory()
+
+    def create_idempotency_store(self) -> IdempotencyStore:
+        return IdempotencyStore()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {'backend': self.backend, 'bookings': len(self.bookings), 'tickets': len(self.tickets),
+                'transactions': len(self.transactions)}
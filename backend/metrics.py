@@ -0,0 +1,192 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+from pymongo import monitoring
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List['Metric'] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels) -> Optional[Tuple[List[int], float, int]]:
+        with self._lock:
+            series = self._series.get(labels)
+            return None if series is None else (list(series[0]), series[1], series[2])
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class CallbackGauge(Metric):
+    """A gauge read at scrape time from a callback returning {label values tuple: value}."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 callback: Callable[[], Dict[Tuple, float]]):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.callback().items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template and status.',
+    ('method', 'route', 'status')
+)
+CHAT_TURN_SECONDS = Histogram(
+    'chat_turn_duration_seconds', 'Conversation flow time per turn, by state transition.',
+    ('from_state', 'to_state')
+)
+CHAT_ERRORS = Counter('chat_errors_total', 'Chat turns that raised and reset the session.')
+MONGO_COMMAND_SECONDS = Histogram(
+    'mongo_command_duration_seconds', 'Mongo command round-trip time as reported by the driver.',
+    ('command',)
+)
+MONGO_COMMAND_FAILURES = Counter('mongo_command_failures_total', 'Mongo commands that failed.', ('command',))
+TICKET_RENDER_SECONDS = Histogram(
+    'ticket_render_duration_seconds',
+    'Ticket PDF render time; mode="pool" includes time queued for a render worker.',
+    ('mode',)
+)
+TICKET_RENDER_FAILURES = Counter('ticket_render_failures_total', 'Ticket renders that raised.', ('mode',))
+BOOKINGS = Counter(
+    'bookings_total', 'Payment completions by result (completed, save_failed, hold_expired); replays are not counted.',
+    ('result',)
+)
+DATE_RESERVATIONS = Counter('date_reservations_total', 'Visit-date reservations by result.', ('result',))
+WRITE_BEHIND_DEAD_LETTERS = Counter(
+    'write_behind_dead_letters_total', 'Journaled documents moved to the write-behind dead-letter file.',
+    ('collection',)
+)
+SESSION_LOADS = Counter(
+    'session_loads_total', 'Shared session reads by source (cache, store, new).', ('source',)
+)
+SESSION_SAVE_CONFLICTS = Counter(
+    'session_save_conflicts_total', 'Session saves refused because another worker had written a newer version.'
+)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Feeds pymongo command timings into mongo_command_duration_seconds."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_COMMAND_FAILURES.inc(event.command_name)
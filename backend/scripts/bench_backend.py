@@ -0,0 +1,347 @@
+"""End-to-end backend benchmark: full booking conversations over HTTP.
+
+Starts the FastAPI app (uvicorn) and/or the Flask app (threaded werkzeug)
+in a child process on the --storage backend: memory (default), sqlite (a
+scratch file), or mongomock (the Mongo code paths without a server). No
+database service is needed and the numbers measure the backend itself.
+--concurrency virtual visitors then each run complete bookings:
+
+    greeting -> book -> name -> email -> phone -> adult / student / child
+    tickets -> visit date -> confirm -> payment_completed -> /generate-ticket
+
+--workers N runs the FastAPI app under N uvicorn worker processes. This
+needs --storage sqlite, so the workers share bookings, capacity and (via
+SESSION_STORE=sqlite) conversation state, and any worker can serve any turn.
+
+Reports conversations/s, requests/s, and p50/p95/p99 latency per step and
+overall. It also reports the server's resident memory, idle and peak,
+summed over its worker processes (Linux /proc). --save-baseline writes the results as JSON. --compare
+reads such a file and exits 1 when throughput drops, or p95/p99 rises, by
+more than --tolerance.
+
+Usage (from the backend directory; --storage mongomock requires mongomock):
+    python scripts/bench_backend.py --app both --conversations 500 --concurrency 32
+    python scripts/bench_backend.py --storage sqlite
+    python scripts/bench_backend.py --app fastapi --storage sqlite --workers 4 --concurrency 64
+    python scripts/bench_backend.py --save-baseline benchmarks/baseline.json
+    python scripts/bench_backend.py --compare benchmarks/baseline.json
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+BENCH_ENV = {
+    'FAQ_RESCAN_SECONDS': '0',
+    'MUSEUM_INFO_WATCH': 'false',
+    'INVENTORY_DAILY_CAPACITY': str(10 ** 9),
+    'IDEMPOTENCY_STORE': 'mongo',
+    'LLM_MODEL': '',
+    'BOOKING_NODE_ID': '0',
+}
+FIRST_VISIT_DATE = date(2031, 1, 1)
+
+
+def serve(app_name: str, port: int, storage: str, workers: int):
+    os.environ.update(BENCH_ENV)
+    if storage == 'mongomock':
+        import mongomock
+        import database
+        # The storage, the inventory and the idempotency store all share this client
+        database._client = mongomock.MongoClient()
+        storage = 'mongo'
+    elif storage == 'sqlite':
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-backend-'), 'museum.sqlite3')
+    os.environ['STORAGE_BACKEND'] = storage
+    if workers > 1:
+        os.environ['SESSION_STORE'] = 'sqlite'
+
+    if app_name == 'fastapi':
+        import uvicorn
+        if workers > 1:
+            # uvicorn hands fd 0 to its workers, and this spawned child has it closed
+            os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+            sys.stdin = os.fdopen(0)
+            uvicorn.run('main:app', host='127.0.0.1', port=port, log_level='warning', workers=workers)
+        else:
+            import main
+            uvicorn.run(main.app, host='127.0.0.1', port=port, log_level='warning')
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        import app
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+def conversation(index: int):
+    visit_date = (FIRST_VISIT_DATE + timedelta(days=index % 365)).isoformat()
+    return [
+        ('greeting', 'hello'),
+        ('book', 'book'),
+        ('name', f"Visitor {index}"),
+        ('email', f"visitor{index}@example.com"),
+        ('phone', f"98{index % 10 ** 8:08d}"),
+        ('adult_tickets', '2'),
+        ('student_tickets', '1'),
+        ('child_tickets', '1'),
+        ('visit_date', visit_date),
+        ('confirm', 'confirm'),
+        ('payment', 'payment_completed'),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def process_tree(pid: int):
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            for child in f.read().split():
+                pids.extend(process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def memory_kb(pid: int):
+    """(VmRSS, VmHWM) of a process and its children in kB, or (None, None) off Linux."""
+    rss = peak = 0
+    try:
+        for process in process_tree(pid):
+            with open(f"/proc/{process}/status") as f:
+                fields = dict(line.split(':', 1) for line in f)
+            rss += int(fields['VmRSS'].split()[0])
+            peak += int(fields['VmHWM'].split()[0])
+    except (OSError, KeyError):
+        return None, None
+    return rss, peak
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection; stdlib http.client adds far less
+    per-request overhead than an async client, so latencies are the server's."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, method: str, path: str, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status}: {data[:200]!r}")
+        return data
+
+
+def wait_until_ready(port: int):
+    for _ in range(300):
+        try:
+            Client(port).request('GET', '/admin/startup')
+            return
+        except (ConnectionError, OSError):
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def drive(port: int, conversations: int, concurrency: int, first_index: int = 0):
+    latencies = {}
+    errors = []
+    remaining = iter(range(first_index, first_index + conversations))
+    lock = threading.Lock()
+
+    def visitor():
+        client = Client(port)
+        samples = {}
+
+        def timed(step, method, path, payload):
+            start = time.perf_counter()
+            data = client.request(method, path, payload)
+            samples.setdefault(step, []).append(time.perf_counter() - start)
+            return data
+
+        while True:
+            with lock:
+                index = next(remaining, None)
+            if index is None:
+                break
+            state, session_id = 'greeting', None
+            try:
+                for step, message in conversation(index):
+                    reply = json.loads(timed(step, 'POST', '/chat', {
+                        'message': message, 'currentState': state, 'sessionId': session_id
+                    }))
+                    state, session_id = reply['state'], reply['session_id']
+                if state != 'booking_completed':
+                    raise RuntimeError(f"conversation {index} ended in state {state!r}")
+                pdf = timed('generate_ticket', 'POST', '/generate-ticket', reply['ticket_data'])
+                if not pdf.startswith(b'%PDF'):
+                    raise RuntimeError(f"conversation {index} got a non-PDF ticket")
+            except Exception as e:
+                client = Client(port)
+                with lock:
+                    errors.append(str(e))
+        with lock:
+            for step, values in samples.items():
+                latencies.setdefault(step, []).extend(values)
+
+    threads = [threading.Thread(target=visitor) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(samples):
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def run(app_name: str, port: int, args):
+    # Werkzeug's development server has no worker processes
+    workers = args.workers if app_name == 'fastapi' else 1
+    with socket.socket() as probe:
+        # A leftover server on the port would answer instead of ours and be measured silently
+        if probe.connect_ex(('127.0.0.1', port)) == 0:
+            raise RuntimeError(f"Port {port} is already in use; pass --port")
+    server = multiprocessing.get_context('spawn').Process(target=serve, args=(app_name, port, args.storage, workers))
+    server.start()
+    try:
+        wait_until_ready(port)
+        # Warm-up pass: imports, first renders, caches, connection setup
+        drive(port, args.warmup, args.concurrency, first_index=10 ** 6)
+        idle_rss, _ = memory_kb(server.pid)
+        latencies, errors, elapsed = drive(port, args.conversations, args.concurrency)
+        rss, peak_rss = memory_kb(server.pid)
+    finally:
+        server.terminate()
+        server.join()
+
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    return {
+        'storage': args.storage,
+        'workers': workers,
+        'conversations': args.conversations,
+        'concurrency': args.concurrency,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(elapsed, 3),
+        'conversations_per_s': round(args.conversations / elapsed, 1),
+        'requests_per_s': round(len(all_samples) / elapsed, 1),
+        'overall': summarize(all_samples),
+        'steps': {step: summarize(samples) for step, samples in latencies.items()},
+        'rss_idle_mb': round(idle_rss / 1024, 1) if idle_rss else None,
+        'rss_mb': round(rss / 1024, 1) if rss else None,
+        'rss_peak_mb': round(peak_rss / 1024, 1) if peak_rss else None,
+    }
+
+
+def print_report(app_name: str, result):
+    print(f"\n{app_name} ({result['storage']} storage, {result['workers']} worker(s)): "
+          f"{result['conversations']} conversations x "
+          f"{result['concurrency']} concurrent in "
+          f"{result['seconds']}s -> {result['conversations_per_s']} conv/s, {result['requests_per_s']} req/s, "
+          f"{result['errors']} errors")
+    if result['first_error']:
+        print(f"  first error: {result['first_error']}")
+    print(f"  memory: idle {result['rss_idle_mb']} MB, after {result['rss_mb']} MB, peak {result['rss_peak_mb']} MB")
+    print(f"  {'step':<18} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for step, stats in list(result['steps'].items()) + [('overall', result['overall'])]:
+        print(f"  {step:<18} {stats['requests']:>9} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+
+def compare(results, baseline, tolerance: float) -> bool:
+    ok = True
+    for app_name, result in results.items():
+        before = baseline.get('apps', {}).get(app_name)
+        if before is None:
+            print(f"\n{app_name}: no baseline to compare with")
+            continue
+        checks = [
+            ('conversations_per_s', before['conversations_per_s'], result['conversations_per_s'], True),
+            ('overall p95_ms', before['overall']['p95_ms'], result['overall']['p95_ms'], False),
+            ('overall p99_ms', before['overall']['p99_ms'], result['overall']['p99_ms'], False),
+        ]
+        print(f"\n{app_name} vs baseline ({baseline.get('saved_at')}):")
+        setup = (before.get('storage', 'mongomock'), before.get('workers', 1))
+        if setup != (result['storage'], result['workers']):
+            print(f"  note: baseline used {setup[0]} storage with {setup[1]} worker(s), "
+                  f"this run {result['storage']} with {result['workers']}")
+        for name, old, new, higher_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            ok = ok and not regressed
+            print(f"  {name:<20} {old:>10} -> {new:>10} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=('fastapi', 'flask', 'both'), default='both')
+    parser.add_argument('--storage', choices=('memory', 'sqlite', 'mongomock'), default='memory')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (FastAPI only)')
+    parser.add_argument('--conversations', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+    if args.workers > 1 and args.storage != 'sqlite':
+        parser.error("--workers > 1 needs --storage sqlite, the only backend the workers can share here")
+
+    apps = ('fastapi', 'flask') if args.app == 'both' else (args.app,)
+    results = {}
+    for offset, app_name in enumerate(apps):
+        results[app_name] = run(app_name, args.port + offset, args)
+        print_report(app_name, results[app_name])
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'apps': results
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    failed = any(result['errors'] for result in results.values())
+    if args.compare:
+        with open(args.compare) as f:
+            failed = not compare(results, json.load(f), args.tolerance) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Booking lookup latency benchmark against a local mongod.
+
+Seeds a scratch database (default museum_bench, dropped first) with
+bookings in stages up to --bookings, creates the production indexes with
+DatabaseHandler.ensure_indexes() and, after each stage, times
+get_booking() by booking_ref plus an email lookup. With the indexes in
+place the latency should stay flat from thousands to a million bookings.
+Pass --no-indexes to see the collection-scan numbers for comparison.
+
+Usage (from the backend directory, mongod on MONGODB_URI or localhost):
+    python scripts/bench_booking_lookup.py --bookings 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseHandler, get_mongo_client  # noqa: E402
+
+
+def make_booking(i: int, base: datetime):
+    return {
+        'booking_ref': f"MSMBENCH{i:010d}",
+        'name': f"Visitor {i}",
+        'email': f"visitor{i}@example.com",
+        'phone': f"9{i:09d}"[-10:],
+        'visit_date': (base + timedelta(days=i % 90)).strftime('%Y-%m-%d'),
+        'adult_tickets': i % 4,
+        'student_tickets': i % 3,
+        'child_tickets': i % 2,
+        'total_amount': (i % 4) * 500 + (i % 3) * 250,
+        'status': 'paid',
+        'created_at': (base + timedelta(seconds=i)).isoformat()
+    }
+
+
+def seed(handler: DatabaseHandler, start: int, stop: int, batch_size: int = 10000):
+    base = datetime(2025, 1, 1)
+    for offset in range(start, stop, batch_size):
+        batch = [make_booking(i, base) for i in range(offset, min(offset + batch_size, stop))]
+        handler.bookings.insert_many(batch, ordered=False)
+
+
+def time_lookups(func, keys, samples: int):
+    latencies = []
+    for key in random.sample(keys, min(samples, len(keys))):
+        start = time.perf_counter()
+        func(key)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--db', default='museum_bench')
+    parser.add_argument('--no-indexes', action='store_true')
+    args = parser.parse_args()
+
+    get_mongo_client().drop_database(args.db)
+    handler = DatabaseHandler(db_name=args.db)
+    if not args.no_indexes:
+        handler.ensure_indexes()
+
+    stages = [n for n in (10000, 100000, 1000000, 10000000) if n < args.bookings] + [args.bookings]
+    seeded = 0
+    print(f"{'bookings':>10} {'ref p50':>9} {'ref p99':>9} {'email p50':>10} {'email p99':>10}  (ms)")
+    for stage in stages:
+        seed(handler, seeded, stage)
+        seeded = stage
+        indices = random.sample(range(seeded), min(args.samples, seeded))
+        refs = [f"MSMBENCH{i:010d}" for i in indices]
+        emails = [f"visitor{i}@example.com" for i in indices]
+
+        ref_p50, ref_p99 = time_lookups(handler.get_booking, refs, args.samples)
+        email_p50, email_p99 = time_lookups(
+            lambda email: handler.bookings.find_one({'email': email}, {'_id': 0, 'booking_ref': 1}),
+            emails, args.samples
+        )
+        print(f"{seeded:>10} {ref_p50:>9.3f} {ref_p99:>9.3f} {email_p50:>10.3f} {email_p99:>10.3f}")
+
+    get_mongo_client().drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
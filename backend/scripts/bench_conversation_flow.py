@@ -0,0 +1,77 @@
+"""Conversation flow dispatch benchmark.
+
+Drives complete booking conversations (greeting to payment) through the
+compiled flow in isolation: no database, no sessions, refs from a counter.
+Reports turns per second and the per-turn latency, which should not grow
+as states are added to the flow definition.
+
+Usage (from the backend directory):
+    python scripts/bench_conversation_flow.py --conversations 20000
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from conversation_flow import CompiledFlow, TurnContext, load_flow_definition  # noqa: E402
+from sessions import Session  # noqa: E402
+from validation import normalize_command  # noqa: E402
+
+PRICES = {'adult': 500, 'student': 250, 'child': 0}
+
+CONVERSATION = [
+    'hello', 'book', 'Asha Rao', 'asha@example.com', '9876543210',
+    '2', '1', '1', '2025-06-01', 'confirm', 'payment_completed'
+]
+
+
+class BenchService:
+    def __init__(self):
+        self._refs = itertools.count()
+        self.db = self
+        self.inventory = None
+        self.idempotency = None
+
+    def generate_booking_ref(self):
+        return f"MSMBENCH{next(self._refs):010d}"
+
+    def save_booking(self, booking, on_ack=None):
+        return True
+
+    def _booking_persisted(self, booking):
+        pass
+
+
+def run_conversation(flow, service):
+    session = Session()
+    for message in CONVERSATION:
+        response = flow.dispatch(TurnContext(service, 'bench', session, normalize_command(message), message.strip()))
+        session.current_step = response['state']
+    assert session.current_step == 'booking_completed', session.current_step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=20000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    flow = CompiledFlow(load_flow_definition(), PRICES)
+    compile_ms = (time.perf_counter() - start) * 1000
+    service = BenchService()
+
+    start = time.perf_counter()
+    for _ in range(args.conversations):
+        run_conversation(flow, service)
+    elapsed = time.perf_counter() - start
+
+    turns = args.conversations * len(CONVERSATION)
+    print(f"compile: {compile_ms:.2f} ms")
+    print(f"{turns} turns in {elapsed:.2f}s: {turns / elapsed:,.0f} turns/s, {elapsed / turns * 1e6:.1f} us/turn")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""FAQ index benchmark.
+
+Indexes the content directory plus --extra synthetic passages, then times
+question lookups (p50/p99 per query) and incremental re-indexing of single
+passages, and prints which passage answers a set of sample questions.
+
+Usage (from the backend directory):
+    python scripts/bench_faq_index.py --extra 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from faq_index import FaqIndex  # noqa: E402
+
+QUESTIONS = [
+    'What are the opening hours?', 'Are you open on Monday?', 'Where is the museum located?',
+    'How much is a student ticket?', 'Can I take photos inside?', 'Can I bring food?',
+    'What galleries do you have?', 'What is your phone number?', 'Who won the cricket match?'
+]
+WORDS = ('bronze sculpture textile coin manuscript painting armour jewellery mural pottery '
+         'dynasty temple harappan mughal buddhist tribal gallery conservation wing floor').split()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--extra', type=int, default=1000, help='synthetic passages added to the index')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--content-dir', default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = FaqIndex()
+    start = time.perf_counter()
+    index.index_content_dir(args.content_dir)
+    for i in range(args.extra):
+        index.upsert(f"extra:{i}", f"Gallery {i}", ' '.join(rng.choice(WORDS) for _ in range(40)))
+    print(f"Indexed {len(index)} passages in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    for question in QUESTIONS:
+        matches = index.search(question, limit=1)
+        answer = index.answer(question)
+        best = f"{matches[0][2]} ({matches[0][0]:.2f})" if matches else '-'
+        print(f"  {question:<32} -> {best}{'' if answer else '  [below threshold]'}")
+
+    samples = []
+    for i in range(args.queries):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        index.answer(question)
+        samples.append(time.perf_counter() - start)
+    print(f"Query: p50 {percentile(samples, 0.5) * 1e6:.1f}us  p99 {percentile(samples, 0.99) * 1e6:.1f}us")
+
+    samples = []
+    for i in range(min(args.extra, 1000)):
+        start = time.perf_counter()
+        index.upsert(f"extra:{i}", f"Gallery {i}", ' '.join(rng.choice(WORDS) for _ in range(40)))
+        samples.append(time.perf_counter() - start)
+    if samples:
+        print(f"Re-index one passage: p50 {percentile(samples, 0.5) * 1e6:.1f}us  "
+              f"p99 {percentile(samples, 0.99) * 1e6:.1f}us")
+
+
+if __name__ == '__main__':
+    main()
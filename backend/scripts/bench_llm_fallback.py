@@ -0,0 +1,93 @@
+"""LLM fallback throughput against a fake local Ollama server.
+
+Starts the fake server from tests/fake_ollama.py, which speaks enough of
+Ollama's /api/chat to satisfy the ollama client, sleeping --model-latency
+seconds per call the way a small local model would. Then drives
+--requests free-text questions from --concurrency threads through
+LLMFallback, drawing from a small set of FAQs with varied wording. It reports the throughput, the calls that
+actually reached the model, and the cache, coalescing and timeout
+counters. Set --model-latency above --timeout to exercise timeouts. With
+--stream the fake model streams NDJSON chunks (think block first), and
+the time to first visible token is reported as well.
+
+Usage (from the backend directory):
+    python scripts/bench_llm_fallback.py --requests 2000 --concurrency 64
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.fake_ollama import FakeOllamaServer  # noqa: E402
+
+FAQS = [
+    ('What time does the museum open?', 'museum open time?', 'When does the museum open'),
+    ('Is the museum open on Monday?', 'is it open on mondays', 'Monday: is the museum open?'),
+    ('Can I take photos inside?', 'are photos allowed inside', 'Photos inside - can I take them?'),
+    ('Where is the museum located?', 'museum located where', 'Where is the museum located'),
+    ('How much is a student ticket?', 'student ticket - how much', 'how much is a student ticket?'),
+    ('Is there parking near the museum?', 'parking near the museum?', 'Is there parking near museum'),
+    ('Do you have wheelchair access?', 'wheelchair access?', 'do you have wheelchair access'),
+    ('Can I bring food?', 'can i bring food', 'Bring food - can I?'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--model-latency', type=float, default=0.5)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--max-model-concurrency', type=int, default=4)
+    parser.add_argument('--stream', action='store_true', help="stream tokens and report time to first token")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(latency=args.model_latency).start()
+    os.environ['OLLAMA_HOST'] = server.url
+    os.environ.setdefault('LLM_MODEL', 'fake-model')
+    os.environ['LLM_TIMEOUT_SECONDS'] = str(args.timeout)
+
+    from llm import LLMFallback  # noqa: E402  (reads the environment set above)
+
+    fallback = LLMFallback(timeout=args.timeout, max_concurrency=args.max_model_concurrency)
+    questions = [random.choice(random.choice(FAQS)) for _ in range(args.requests)]
+    latencies = []
+    first_tokens = []
+
+    def ask(question):
+        start = time.perf_counter()
+        first = []
+
+        def on_token(text):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        answer = fallback.answer(question, on_token if args.stream else None)
+        latencies.append(time.perf_counter() - start)
+        first_tokens.extend(first)
+        return answer
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        answers = list(pool.map(ask, questions))
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    latencies.sort()
+    answered = sum(answer is not None for answer in answers)
+    print(f"{args.requests} questions in {elapsed:.2f}s ({args.requests / elapsed:,.0f}/s), {answered} answered")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+    if first_tokens:
+        first_tokens.sort()
+        print(f"streamed answers: {len(first_tokens)}, first token p50 "
+              f"{first_tokens[len(first_tokens) // 2] * 1000:.1f}ms vs model latency {args.model_latency * 1000:.0f}ms")
+    print(f"model server calls: {server.calls}, unique FAQs: {len(FAQS)}")
+    print(f"fallback stats: {fallback.stats()}")
+
+
+if __name__ == '__main__':
+    main()
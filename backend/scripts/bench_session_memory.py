@@ -0,0 +1,109 @@
+"""Idle session memory benchmark.
+
+Builds --sessions conversations spread over every step of the booking flow
+and measures, with tracemalloc, what holding them costs in three layouts:
+  dicts    - the nested current_step/booking_info dicts sessions used to be
+  slots    - sessions.Session / sessions.Booking records, as the local
+             store keeps them
+  encoded  - encode_session() bytes, as shared stores and their caches keep them
+Also reports the encode and decode cost per session.
+
+Usage (from the backend directory):
+    python scripts/bench_session_memory.py --sessions 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sessions import Booking, Session, decode_session, encode_session  # noqa: E402
+
+# (current_step, booking fields collected by then), in conversation order
+STEPS = [
+    ('greeting', 0), ('initial_options', 0), ('asking_name', 0), ('asking_email', 1), ('asking_phone', 2),
+    ('asking_adult_tickets', 3), ('asking_student_tickets', 4), ('asking_child_tickets', 5),
+    ('asking_date', 7), ('confirming_booking', 9), ('payment_pending', 9), ('booking_completed', 11)
+]
+
+
+def booking_fields(i: int, collected: int) -> dict:
+    # Fresh strings per session, as decoding a stored session would produce
+    values = {
+        'name': f"Visitor {i}",
+        'email': f"visitor{i}@example.com",
+        'phone': f"+9198765{i % 100000:05d}",
+        'adult_tickets': 2,
+        'student_tickets': 1,
+        'child_tickets': 1,
+        'total_amount': 1250,
+        'visit_date': f"2031-02-{i % 28 + 1:02d}",
+        'booking_ref': f"MSM20310202{i:014d}",
+        'status': 'paid',
+        'payment_date': f"2031-01-15T10:{i % 60:02d}:00"
+    }
+    return dict(list(values.items())[:collected])
+
+
+def build_dicts(plan):
+    return [{'current_step': step, 'booking_info': booking_fields(i, collected), 'conversation_ended': False}
+            for i, (step, collected) in enumerate(plan)]
+
+
+def build_slots(plan):
+    return [Session(step, Booking(**booking_fields(i, collected))) for i, (step, collected) in enumerate(plan)]
+
+
+def build_encoded(plan):
+    return [encode_session(session) for session in build_slots(plan)]
+
+
+def measure(build, plan):
+    tracemalloc.start()
+    sessions = build(plan)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sessions, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    plan = [rng.choice(STEPS) for _ in range(args.sessions)]
+
+    results = {}
+    for name, build in (('dicts', build_dicts), ('slots', build_slots), ('encoded', build_encoded)):
+        results[name] = measure(build, plan)
+
+    baseline = results['dicts'][1]
+    print(f"{args.sessions} idle sessions")
+    print(f"  {'layout':10} {'MB':>8} {'bytes/session':>14} {'vs dicts':>9}")
+    for name, (_, size) in results.items():
+        print(f"  {name:10} {size / 2 ** 20:8.1f} {size / args.sessions:14.0f} {size / baseline:8.2f}x")
+
+    dicts, slots, encoded = (results[name][0] for name in ('dicts', 'slots', 'encoded'))
+    dict_json = sum(len(json.dumps(state, separators=(',', ':'))) for state in dicts) / len(dicts)
+    print(f"  stored size: {sum(map(len, encoded)) / len(encoded):.0f} bytes/session "
+          f"(JSON of the dicts: {dict_json:.0f})")
+
+    start = time.perf_counter()
+    for session in slots:
+        encode_session(session)
+    encode_us = (time.perf_counter() - start) / len(slots) * 1e6
+    start = time.perf_counter()
+    for data in encoded:
+        decode_session(data)
+    decode_us = (time.perf_counter() - start) / len(encoded) * 1e6
+    print(f"  encode {encode_us:.2f} us/session, decode {decode_us:.2f} us/session")
+
+
+if __name__ == '__main__':
+    main()
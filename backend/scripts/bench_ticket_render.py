@@ -0,0 +1,211 @@
+"""Ticket rendering benchmark: the baseline renderer against the current one.
+
+  baseline  - the original generate_ticket_pdf drawing code, unchanged except
+              that it writes into memory instead of tickets/, so only drawing
+              is compared. It registers the rupee font on every call.
+  single    - ticket_generator.render_ticket_pdf, one PDF per ticket (the
+              path /generate-ticket and render_ticket_batch use)
+  multipage - ticket_generator.render_tickets_pdf, --pages tickets per PDF,
+              against --pages baseline PDFs
+
+Each mode runs --rounds times, interleaved, and the best round is reported.
+
+Usage (from the backend directory):
+    python scripts/bench_ticket_render.py --tickets 500
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reportlab.lib import colors  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.lib.units import inch  # noqa: E402
+from reportlab.pdfbase import pdfmetrics  # noqa: E402
+from reportlab.pdfbase.ttfonts import TTFont  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+import ticket_generator  # noqa: E402
+
+SAMPLE_TICKET = {
+    'booking_ref': 'MSM20250101ABCDEFGH',
+    'visit_date': '2025-01-01',
+    'name': 'Benchmark Visitor',
+    'email': 'visitor@example.com',
+    'phone': '9876543210',
+    'adult_tickets': 2,
+    'student_tickets': 1,
+    'child_tickets': 1
+}
+
+
+def baseline_render(ticket_data):
+    # The baseline generate_ticket_pdf, rendering into a buffer
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    primary_color = colors.Color(0.29, 0.22, 0.16)
+    secondary_color = colors.Color(0.77, 0.64, 0.52)
+
+    try:
+        font_path = os.path.join(os.path.dirname(ticket_generator.__file__), 'fonts', 'NotoSans-Regular.ttf')
+        pdfmetrics.registerFont(TTFont('NotoSans', font_path))
+        use_rupee_symbol = True
+    except Exception:
+        use_rupee_symbol = False
+
+    rupee = "₹" if use_rupee_symbol else "Rs."
+
+    c.setFillColor(primary_color)
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(width/2, height-1.5*inch, "NATIONAL MUSEUM OF INDIA")
+
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(width/2, height-2*inch, "ENTRY TICKET")
+
+    c.setStrokeColor(secondary_color)
+    c.setLineWidth(2)
+    c.line(2*inch, height-2.5*inch, width-2*inch, height-2.5*inch)
+
+    y = height-3*inch
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(1*inch, y, "BOOKING DETAILS")
+    y -= 0.5*inch
+
+    c.setFont("Helvetica", 12)
+    details = [
+        f"Booking Reference: {ticket_data['booking_ref']}",
+        f"Visit Date: {ticket_data['visit_date']}",
+        f"Name: {ticket_data['name']}",
+        f"Email: {ticket_data['email']}",
+        f"Phone: {ticket_data['phone']}"
+    ]
+
+    ticket_counts = []
+    price_breakdown = []
+    total_amount = 0
+
+    if ticket_data['adult_tickets'] > 0:
+        adult_amount = ticket_data['adult_tickets'] * 500
+        ticket_counts.append(f"Adult Tickets: {ticket_data['adult_tickets']}")
+        price_breakdown.append(f"Adult: {ticket_data['adult_tickets']} x {rupee}500 = {rupee}{adult_amount}")
+        total_amount += adult_amount
+
+    if ticket_data['student_tickets'] > 0:
+        student_amount = ticket_data['student_tickets'] * 250
+        ticket_counts.append(f"Student Tickets: {ticket_data['student_tickets']}")
+        price_breakdown.append(f"Student: {ticket_data['student_tickets']} x {rupee}250 = {rupee}{student_amount}")
+        total_amount += student_amount
+
+    if ticket_data.get('child_tickets', 0) > 0 and ticket_data['adult_tickets'] > 0:
+        ticket_counts.append(f"Child Tickets: {ticket_data['child_tickets']} (Free)")
+
+    for line in details:
+        c.drawString(1*inch, y, line)
+        y -= 0.3*inch
+
+    y -= 0.2*inch
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, y, "TICKET DETAILS")
+    y -= 0.3*inch
+
+    c.setFont("Helvetica", 12)
+    for count in ticket_counts:
+        c.drawString(1*inch, y, count)
+        y -= 0.3*inch
+
+    y -= 0.2*inch
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, y, "PRICE BREAKDOWN")
+    y -= 0.3*inch
+
+    c.setFont("NotoSans" if use_rupee_symbol else "Helvetica", 12)
+    for price in price_breakdown:
+        c.drawString(1*inch, y, price)
+        y -= 0.3*inch
+
+    y -= 0.2*inch
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, y, f"Total Amount: {rupee}{total_amount}")
+
+    y -= 0.6*inch
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(1*inch, y, "IMPORTANT INSTRUCTIONS")
+    y -= 0.4*inch
+
+    c.setFont("Helvetica", 11)
+    for instruction in ticket_generator.INSTRUCTIONS:
+        c.drawString(1*inch, y, instruction)
+        y -= 0.3*inch
+
+    c.setFont("Helvetica", 10)
+    c.drawCentredString(width/2, 0.5*inch, "Thank you for visiting National Museum of India")
+
+    c.save()
+    return buffer.getvalue()
+
+
+def tickets(count: int):
+    return [dict(SAMPLE_TICKET, booking_ref=f"MSM{i:08d}") for i in range(count)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run_baseline(batch):
+    return [baseline_render(ticket_data) for ticket_data in batch]
+
+
+def run_single(batch):
+    return [ticket_generator.render_ticket_pdf(ticket_data, persist=False) for ticket_data in batch]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=500)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    batch, pages = tickets(args.tickets), tickets(args.pages)
+    # Warm up imports and ReportLab's own module-level caches
+    run_baseline(batch[:20])
+    run_single(batch[:20])
+
+    best = {}
+    sizes = {}
+    modes = (
+        ('baseline', run_baseline, batch),
+        ('single', run_single, batch),
+        ('baseline pages', run_baseline, pages),
+        ('multipage', ticket_generator.render_tickets_pdf, pages),
+    )
+    for _ in range(args.rounds):
+        for name, func, items in modes:
+            seconds, result = timed(func, items)
+            best[name] = min(best.get(name, seconds), seconds)
+            sizes[name] = len(result) if isinstance(result, bytes) else sum(map(len, result))
+
+    base = args.tickets / best['baseline']
+    single = args.tickets / best['single']
+    print(f"single tickets ({args.tickets}, best of {args.rounds}):")
+    print(f"  baseline  {base:8.1f} tickets/s  {sizes['baseline'] / args.tickets:7.0f} bytes/ticket")
+    print(f"  current   {single:8.1f} tickets/s  {sizes['single'] / args.tickets:7.0f} bytes/ticket  "
+          f"({single / base:.2f}x)")
+
+    base = args.pages / best['baseline pages']
+    multi = args.pages / best['multipage']
+    print(f"{args.pages} tickets in one document:")
+    print(f"  baseline  {base:8.1f} pages/s    {sizes['baseline pages']:9d} bytes ({args.pages} PDFs)")
+    print(f"  current   {multi:8.1f} pages/s    {sizes['multipage']:9d} bytes  ({multi / base:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Validation and normalisation microbenchmarks.
+
+Times the validation module against the inline checks it replaced
+(re.match with a pattern string, filter(str.isdigit, ...)) per call, and
+validate_batch() over a bulk import of ticket records.
+
+Usage (from the backend directory):
+    python scripts/bench_validation.py --records 100000
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from validation import normalize_command, normalize_email, normalize_phone, validate_batch  # noqa: E402
+from ticket_generator import TICKET_FIELDS  # noqa: E402
+
+EMAILS = ['asha.rao@example.com', 'Visitor+museum@Mail.Example.IN', 'not-an-email', 'a@b']
+PHONES = ['9876543210', '+91 98765 43210', '098765-43210', '12345', '+44 20 7946 0958']
+MESSAGES = ['  Book ', 'payment_completed', 'Asha Rao', 'CONFIRM']
+
+
+def inline_email(email):
+    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return bool(re.match(email_pattern, email))
+
+
+def inline_phone(phone):
+    digits = ''.join(filter(str.isdigit, phone))
+    return len(digits) == 10
+
+
+def per_call(func, values, number):
+    return timeit.timeit(lambda: [func(value) for value in values], number=number) / (number * len(values)) * 1e9
+
+
+def make_records(count):
+    return [{
+        'booking_ref': f"MSMBENCH{i:010d}",
+        'name': f"  Visitor   {i} ",
+        'email': f"visitor{i}@Example.com" if i % 50 else 'broken',
+        'phone': f"+91 9{i:09d}"[:15],
+        'visit_date': '2025-06-01',
+        'adult_tickets': i % 4,
+        'student_tickets': str(i % 3),
+        'child_tickets': i % 2
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=50000)
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = [
+        ('email (inline re.match)', inline_email, EMAILS),
+        ('email (normalize_email)', normalize_email, EMAILS),
+        ('phone (inline filter)', inline_phone, PHONES),
+        ('phone (normalize_phone)', normalize_phone, PHONES),
+        ('command (normalize_command)', normalize_command, MESSAGES),
+    ]
+    for label, func, values in rows:
+        print(f"{label:<30} {per_call(func, values, args.number):8.0f} ns/call")
+
+    records = make_records(args.records)
+    seconds = timeit.timeit(lambda: validate_batch(records, required=TICKET_FIELDS), number=1)
+    _, errors = validate_batch(records, required=TICKET_FIELDS)
+    print(f"validate_batch: {args.records} records in {seconds:.2f}s "
+          f"({args.records / seconds:,.0f} records/s, {len(errors)} invalid)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Local load test for the FastAPI /chat endpoint under slow Mongo.
+
+For every injected delay the script starts the app with uvicorn in a child
+process, where DatabaseHandler.save_booking is wrapped with a sleep, so no
+database is needed. A share of the simulated visitors complete a payment
+(which writes to Mongo) while the rest send ordinary chat turns; the report
+shows p50/p99 latency of the ordinary turns. Requests arrive at a fixed
+rate (open loop), so a blocked event loop shows up as queueing delay. With
+the async DatabaseHandler the p99 stays flat as the delay grows instead of
+tracking it.
+
+Usage (from the backend directory, requires httpx):
+    python scripts/load_test_chat.py --requests 1000 --rate 100
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx  # noqa: E402
+
+
+def serve(port: int, delay: float):
+    os.environ.setdefault('BOOKING_NODE_ID', '0')
+    import uvicorn
+    import main
+    from chatbot import chatbot_service
+
+    def slow_save_booking(booking_data, on_ack=None):
+        time.sleep(delay)
+        return True
+    chatbot_service.db.save_booking = slow_save_booking
+
+    uvicorn.run(main.app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_until_ready(base_url: str):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            try:
+                await client.post('/chat', json={'message': 'book', 'currentState': 'initial_options'})
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+async def drive(base_url: str, total: int, rate: float, payment_share: float):
+    latencies = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one(i: int):
+            await asyncio.sleep(i / rate)
+            is_payment = (i * 37 % 100) < payment_share * 100
+            payload = (
+                {'message': 'payment_completed', 'currentState': 'payment'}
+                if is_payment else
+                {'message': 'book', 'currentState': 'initial_options'}
+            )
+            start = time.perf_counter()
+            response = await client.post('/chat', json=payload)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            if not is_payment:
+                latencies.append(elapsed)
+
+        await asyncio.gather(*(one(i) for i in range(total)))
+
+    return latencies
+
+
+def run(port: int, delay: float, args) -> list:
+    server = multiprocessing.Process(target=serve, args=(port, delay), daemon=True)
+    server.start()
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        return asyncio.run(drive(base_url, args.requests, args.rate, args.payment_share))
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100, help='requests per second')
+    parser.add_argument('--payment-share', type=float, default=0.1)
+    parser.add_argument('--delays-ms', default='0,20,100,250')
+    parser.add_argument('--port', type=int, default=5077)
+    args = parser.parse_args()
+
+    print(f"{'mongo delay':>12} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for delay_ms in (int(d) for d in args.delays_ms.split(',')):
+        latencies = run(args.port, delay_ms / 1000, args)
+        print(f"{delay_ms:>10}ms "
+              f"{statistics.median(latencies) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f} "
+              f"{max(latencies) * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,119 @@
+"""Concurrency stress test for visit-date capacity against a local mongod.
+
+Forks --processes workers, each running --threads threads that book 1-4
+seats at a time on the same date until --bookings attempts are made. About
+half of the successful holds are confirmed, a quarter cancelled, and the
+rest left to expire. The expired holds are then swept. Afterwards it
+checks that remaining never went negative and that every seat is
+accounted for: capacity - remaining == seats in holds.
+
+Uses a throwaway database (--db, dropped first).
+
+Usage (from the backend directory, with mongod running):
+    python scripts/stress_inventory.py --bookings 5000 --capacity 1000 --processes 4 --threads 32
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pymongo  # noqa: E402
+from inventory import CapacityInventory  # noqa: E402
+
+VISIT_DATE = '2031-01-26'
+
+
+def open_inventory(args):
+    client = pymongo.MongoClient(args.uri, maxPoolSize=args.threads * 2)
+    return CapacityInventory(client[args.db], daily_capacity=args.capacity, hold_seconds=args.hold_seconds)
+
+
+def worker(job):
+    args, process_index = job
+    inventory = open_inventory(args)
+    rng = random.Random(process_index)
+    attempts = iter(range(args.bookings // args.processes))
+    lock = threading.Lock()
+    totals = {'granted': 0, 'refused': 0, 'confirmed': 0, 'cancelled': 0, 'left_to_expire': 0}
+
+    def run():
+        while True:
+            with lock:
+                attempt = next(attempts, None)
+                seats = rng.randint(1, 4)
+                fate = rng.random()
+            if attempt is None:
+                return
+            ref = f"STRESS-{process_index}-{attempt}"
+            if inventory.reserve(ref, VISIT_DATE, seats) is None:
+                with lock:
+                    totals['refused'] += 1
+                continue
+            if fate < 0.5:
+                assert inventory.confirm(ref, VISIT_DATE, seats)
+                outcome = 'confirmed'
+            elif fate < 0.75:
+                inventory.release(ref)
+                outcome = 'cancelled'
+            else:
+                outcome = 'left_to_expire'
+            with lock:
+                totals['granted'] += 1
+                totals[outcome] += 1
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='museum_inventory_stress')
+    parser.add_argument('--bookings', type=int, default=5000)
+    parser.add_argument('--capacity', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--hold-seconds', type=float, default=2)
+    args = parser.parse_args()
+
+    pymongo.MongoClient(args.uri).drop_database(args.db)
+    inventory = open_inventory(args)
+    inventory.ensure_indexes()
+
+    start = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(args.processes) as pool:
+        results = pool.map(worker, [(args, i) for i in range(args.processes)])
+    elapsed = time.perf_counter() - start
+    totals = {name: sum(result[name] for result in results) for name in results[0]}
+    attempts = totals['granted'] + totals['refused']
+    print(f"{attempts} reservation attempts in {elapsed:.2f}s ({attempts / elapsed:,.0f}/s): {totals}")
+
+    def check(label):
+        doc = inventory.capacity.find_one({'_id': VISIT_DATE})
+        held = sum(hold['count'] for hold in inventory.holds.find({'key': VISIT_DATE}))
+        ok = doc['remaining'] >= 0 and doc['capacity'] - doc['remaining'] == held
+        print(f"{label}: capacity {doc['capacity']}, remaining {doc['remaining']}, seats in holds {held} "
+              f"-> {'OK' if ok else 'MISMATCH'}")
+        return ok
+
+    ok = check('After booking')
+    time.sleep(args.hold_seconds)
+    print(f"Swept {inventory.release_expired()} seat(s) from expired holds")
+    ok = check('After sweep') and ok
+    if inventory.holds.count_documents({'status': 'held'}):
+        print("Unexpired holds left after the sweep")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timedelta
+import json
+import os
+import secrets
+import threading
+import time
+import logging
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from cache import TTLCache
+from metrics import SESSION_LOADS, SESSION_SAVE_CONFLICTS
+from startup import startup_phase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 50000
+DEFAULT_SESSION_TTL_SECONDS = 1800
+SESSION_STORES = ('local', 'memory', 'mongo', 'redis', 'sqlite')
+
+# (version, encoded session) as kept by a shared backend
+StoredSession = Tuple[int, bytes]
+
+
+@dataclass(slots=True)
+class Booking:
+    """What the visitor has entered so far; None marks a field not collected yet.
+
+    Fields are encoded by position, so new ones go at the end.
+    """
+
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    adult_tickets: Optional[int] = None
+    student_tickets: Optional[int] = None
+    child_tickets: Optional[int] = None
+    total_amount: Optional[int] = None
+    visit_date: Optional[str] = None
+    booking_ref: Optional[str] = None
+    visit_slot: Optional[str] = None
+    status: Optional[str] = None
+    payment_date: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The collected fields as the booking_info dict clients and storage expect."""
+        return {name: value for name in BOOKING_FIELDS if (value := getattr(self, name)) is not None}
+
+
+BOOKING_FIELDS = tuple(booking_field.name for booking_field in fields(Booking))
+
+
+@dataclass(slots=True)
+class Session:
+    """One visitor's conversation; `version` is the stored version it was read at."""
+
+    current_step: str = 'greeting'
+    booking: Booking = field(default_factory=Booking)
+    conversation_ended: bool = False
+    version: int = 0
+
+
+def encode_session(session: Session) -> bytes:
+    """[step, ended, [booking fields by position]] as JSON, trailing unset fields dropped."""
+    booking = [getattr(session.booking, name) for name in BOOKING_FIELDS]
+    while booking and booking[-1] is None:
+        booking.pop()
+    return json.dumps([session.current_step, int(session.conversation_ended), booking],
+                      separators=(',', ':')).encode('utf-8')
+
+
+def decode_session(data: bytes, version: int = 0) -> Session:
+    current_step, conversation_ended, booking = json.loads(data)
+    return Session(current_step, Booking(*booking), bool(conversation_ended), version)
+
+
+class SessionStore:
+    """Bounded, in-process conversation store keyed by session id.
+
+    Entries are kept in least-recently-used order, so both the TTL sweep
+    and the size cap only ever look at the front of the OrderedDict.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX', DEFAULT_MAX_SESSIONS))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('SESSION_TTL_SECONDS', DEFAULT_SESSION_TTL_SECONDS))
+        self._sessions: "OrderedDict[str, Tuple[float, Session]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def ensure_indexes(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {'store': 'local', 'sessions': len(self)}
+
+    def get(self, session_id: Optional[str], refresh: bool = False) -> Tuple[str, Session]:
+        """Return (session_id, session), creating a fresh session when the id is unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id) if session_id else None
+            if entry is None:
+                session_id = secrets.token_urlsafe(16)
+                session = Session()
+            else:
+                session = entry[1]
+                self._sessions.move_to_end(session_id)
+            self._sessions[session_id] = (now + self.ttl_seconds, session)
+            return session_id, session
+
+    def save(self, session_id: str, session: Session) -> bool:
+        # Sessions are updated in place, so there is nothing to write back
+        return True
+
+    def reset(self, session_id: str) -> Session:
+        session = Session()
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, session)
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self, now: float) -> None:
+        # Every entry gets the same TTL on access, so expiry order matches LRU order
+        sessions = self._sessions
+        while sessions:
+            expires_at, _ = next(iter(sessions.values()))
+            if expires_at > now and len(sessions) < self.max_sessions:
+                break
+            sessions.popitem(last=False)
+
+
+class SharedSessionStore:
+    """Conversation state kept in a store every worker can reach.
+
+    Any worker or pod can then serve a visitor's next message. Sessions are
+    encoded with encode_session() and written back after every turn. Each write
+    is a compare-and-set on the version the turn read, so a turn computed
+    from stale state is refused (save() returns False) and rerun by the
+    caller, rather than overwriting a newer turn.
+
+    Reads go through a local cache for SESSION_CACHE_TTL_SECONDS (0 turns it
+    off). The cache only saves a round trip for bursts of turns on one
+    worker; a stale hit is caught by the versioned write.
+    """
+
+    def __init__(self, backend, ttl_seconds: Optional[int] = None, cache_ttl: Optional[float] = None,
+                 max_cached: Optional[int] = None):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds or int(os.getenv('SESSION_TTL_SECONDS', DEFAULT_SESSION_TTL_SECONDS))
+        cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv('SESSION_CACHE_TTL_SECONDS', 1))
+        self.cache = TTLCache(ttl_seconds=cache_ttl,
+                              max_entries=max_cached or int(os.getenv('SESSION_CACHE_MAX_ENTRIES', 10000))
+                              ) if cache_ttl > 0 else None
+
+    def __len__(self) -> int:
+        return len(self.cache) if self.cache is not None else 0
+
+    def ensure_indexes(self):
+        if hasattr(self.backend, 'ensure_indexes'):
+            self.backend.ensure_indexes()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'store': self.backend.name,
+            'cached': len(self),
+            'loads': {source: SESSION_LOADS.value(source) for source in ('cache', 'store', 'new')},
+            'save_conflicts': SESSION_SAVE_CONFLICTS.value()
+        }
+
+    def get(self, session_id: Optional[str], refresh: bool = False) -> Tuple[str, Session]:
+        """Return (session_id, session) as in SessionStore; refresh=True skips the local cache."""
+        stored = None
+        if session_id and self.cache is not None and not refresh:
+            stored = self.cache.get(session_id)
+            if stored is not None:
+                SESSION_LOADS.inc('cache')
+        if stored is None and session_id:
+            stored = self.backend.load(session_id)
+            if stored is not None:
+                SESSION_LOADS.inc('store')
+                self._remember(session_id, stored)
+        if stored is None:
+            SESSION_LOADS.inc('new')
+            return secrets.token_urlsafe(16), Session()
+        return session_id, decode_session(stored[1], stored[0])
+
+    def save(self, session_id: str, session: Session) -> bool:
+        data = encode_session(session)
+        version = self.backend.save(session_id, data, session.version, self.ttl_seconds)
+        if version is None:
+            SESSION_SAVE_CONFLICTS.inc()
+            if self.cache is not None:
+                self.cache.invalidate(session_id)
+            return False
+        session.version = version
+        self._remember(session_id, (version, data))
+        return True
+
+    def reset(self, session_id: str) -> Session:
+        """Start the conversation over; written at once, whatever version is stored."""
+        session = Session()
+        data = encode_session(session)
+        session.version = self.backend.save(session_id, data, None, self.ttl_seconds)
+        self._remember(session_id, (session.version, data))
+        return session
+
+    def discard(self, session_id: str) -> None:
+        self.backend.delete(session_id)
+        if self.cache is not None:
+            self.cache.invalidate(session_id)
+
+    def _remember(self, session_id: str, stored: StoredSession):
+        if self.cache is not None:
+            self.cache.set(session_id, stored)
+
+
+# Shared backends: load() returns (version, data) or None for a missing or
+# expired session. save() writes data when the stored version equals
+# expected_version (0 = must not exist, None = unconditionally) and returns
+# the new version, or None when that condition failed.
+
+
+class MemorySessionBackend:
+    """In-process stand-in with the same contract as the Redis backend; for
+    tests, benchmarks and single-process runs."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Tuple[int, bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[StoredSession]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] <= time.monotonic():
+                return None
+            return entry[0], entry[1]
+
+    def save(self, session_id: str, data: bytes, expected_version: Optional[int], ttl: float) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            current = entry[0] if entry is not None and entry[2] > now else 0
+            if expected_version is not None and expected_version != current:
+                return None
+            version = current + 1
+            self._sessions[session_id] = (version, data, now + ttl)
+            self._sessions.move_to_end(session_id)
+            # One TTL for every session, so the oldest write is always at the front
+            while self._sessions and next(iter(self._sessions.values()))[2] <= now:
+                self._sessions.popitem(last=False)
+            return version
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class MongoSessionBackend:
+    """Sessions as {_id, v, d, expires_at} documents; a TTL index on
+    expires_at removes abandoned conversations."""
+
+    name = 'mongo'
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0)
+
+    def load(self, session_id: str) -> Optional[StoredSession]:
+        # The TTL monitor only runs once a minute, so expiry is checked here too
+        doc = self.collection.find_one({'_id': session_id, 'expires_at': {'$gt': datetime.utcnow()}},
+                                       {'v': 1, 'd': 1})
+        return None if doc is None else (doc['v'], bytes(doc['d']))
+
+    def save(self, session_id: str, data: bytes, expected_version: Optional[int], ttl: float) -> Optional[int]:
+        now = datetime.utcnow()
+        fields = {'d': data, 'expires_at': now + timedelta(seconds=ttl)}
+        if expected_version is None:
+            doc = self.collection.find_one_and_update(
+                {'_id': session_id}, {'$inc': {'v': 1}, '$set': fields},
+                projection={'v': 1}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            return doc['v']
+        if expected_version == 0:
+            try:
+                self.collection.insert_one(dict(fields, _id=session_id, v=1))
+                return 1
+            except DuplicateKeyError:
+                # Only an expired session the TTL monitor has not removed yet may be replaced
+                result = self.collection.update_one({'_id': session_id, 'expires_at': {'$lte': now}},
+                                                    {'$set': dict(fields, v=1)})
+                return 1 if result.modified_count else None
+        result = self.collection.update_one({'_id': session_id, 'v': expected_version},
+                                            {'$inc': {'v': 1}, '$set': fields})
+        return expected_version + 1 if result.modified_count else None
+
+    def delete(self, session_id: str):
+        self.collection.delete_one({'_id': session_id})
+
+
+class RedisSessionBackend:
+    """Sessions as Redis hashes {v, d} with a key expiry; the compare-and-set
+    is a WATCH/MULTI transaction, so any Redis-compatible server works."""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix: Optional[str] = None):
+        from redis.exceptions import WatchError
+        self.client = client
+        self.prefix = prefix or os.getenv('REDIS_SESSION_PREFIX', 'museum:session:')
+        self._watch_error = WatchError
+
+    def load(self, session_id: str) -> Optional[StoredSession]:
+        version, data = self.client.hmget(self.prefix + session_id, 'v', 'd')
+        return None if version is None else (int(version), data)
+
+    def save(self, session_id: str, data: bytes, expected_version: Optional[int], ttl: float) -> Optional[int]:
+        key = self.prefix + session_id
+        with self.client.pipeline() as pipe:
+            try:
+                if expected_version is not None:
+                    pipe.watch(key)
+                    if int(pipe.hget(key, 'v') or 0) != expected_version:
+                        return None
+                pipe.multi()
+                pipe.hincrby(key, 'v', 1)
+                pipe.hset(key, 'd', data)
+                pipe.pexpire(key, int(ttl * 1000))
+                return int(pipe.execute()[0])
+            except self._watch_error:
+                return None
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+
+def session_store_kind() -> str:
+    return os.getenv('SESSION_STORE', 'local').lower()
+
+
+def create_session_store():
+    """SESSION_STORE=local keeps sessions in this process (one worker only);
+    memory, mongo, redis and sqlite use a SharedSessionStore."""
+    kind = session_store_kind()
+    if kind == 'local':
+        return SessionStore()
+    if kind == 'memory':
+        backend = MemorySessionBackend()
+    elif kind == 'mongo':
+        from database import get_mongo_client
+        backend = MongoSessionBackend(get_mongo_client()[os.getenv('MONGODB_DB', 'museum')]['sessions'])
+    elif kind == 'redis':
+        with startup_phase('redis import'):
+            import redis
+        backend = RedisSessionBackend(redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')))
+    elif kind == 'sqlite':
+        from storage import get_storage, storage_backend
+        from sqlite_storage import SqliteSessionBackend, SqliteStorage
+        backend = SqliteSessionBackend(get_storage() if storage_backend() == 'sqlite' else SqliteStorage())
+    else:
+        raise ValueError(f"Unknown SESSION_STORE {kind!r}; expected one of {', '.join(SESSION_STORES)}")
+    logger.info(f"Keeping sessions in {backend.name}")
+    return SharedSessionStore(backend)
@@ -0,0 +1,450 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import date, datetime
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from inventory import BaseInventory
+from idempotency import IdempotencyStore
+from storage import Storage, project
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    booking_ref TEXT UNIQUE,
+    email TEXT,
+    phone TEXT,
+    created_at TEXT,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_email ON bookings (email);
+CREATE INDEX IF NOT EXISTS bookings_phone ON bookings (phone);
+CREATE INDEX IF NOT EXISTS bookings_created_at ON bookings (created_at DESC);
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    booking_ref TEXT,
+    created_at TEXT,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tickets_booking_ref ON tickets (booking_ref);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    booking_ref TEXT,
+    created_at TEXT,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_booking_ref ON transactions (booking_ref);
+CREATE TABLE IF NOT EXISTS museum_info (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS capacity (
+    key TEXT PRIMARY KEY,
+    capacity INTEGER NOT NULL,
+    remaining INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS capacity_holds (
+    booking_ref TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    expires_at TEXT
+);
+CREATE INDEX IF NOT EXISTS capacity_holds_status_expires_at ON capacity_holds (status, expires_at);
+CREATE INDEX IF NOT EXISTS capacity_holds_key ON capacity_holds (key);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+"""
+
+# Expired sessions are deleted once every this many new sessions
+SESSION_SWEEP_EVERY = 1000
+
+# SQLite caps the number of ? parameters in one statement
+IN_BATCH_SIZE = 500
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+
+
+def _timestamp(value: datetime) -> str:
+    # Fixed-width so expiry times compare correctly as text
+    return value.isoformat(timespec='microseconds')
+
+
+class SqliteStorage(Storage):
+    """One SQLite file in WAL mode, for kiosks and single-machine deployments.
+
+    Documents are stored as JSON next to the columns the lookups filter on.
+    WAL lets readers run alongside the single writer, and with
+    synchronous=NORMAL a commit is only an append to the WAL file.
+    Several worker processes on one machine can share the file. Writes
+    that must be atomic (seat counts, holds) run in BEGIN IMMEDIATE
+    transactions. Connections are borrowed from a small pool rather than
+    kept per thread, because the Flask server starts a thread per request.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path: Optional[str] = None, busy_timeout_ms: Optional[int] = None,
+                 synchronous: Optional[str] = None, pool_size: Optional[int] = None):
+        self.path = path or os.getenv('SQLITE_PATH', 'museum.sqlite3')
+        self.busy_timeout_ms = busy_timeout_ms or int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+        self.synchronous = (synchronous or os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+        self.pool_size = pool_size or int(os.getenv('SQLITE_POOL_SIZE', 16))
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._opened_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly by _transaction()
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        with self._opened_lock:
+            self._opened += 1
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if self._idle.qsize() < self.pool_size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+                with self._opened_lock:
+                    self._opened -= 1
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """Run one autocommitted statement; the cursor still carries rowcount and lastrowid."""
+        with self._connection() as conn:
+            return conn.execute(sql, params)
+
+    def _fetchone(self, sql: str, params=()):
+        with self._connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params=()) -> list:
+        with self._connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _document(self, row, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        document = json.loads(row[1])
+        document['_id'] = str(row[0])
+        return project(document, fields)
+
+    def _insert(self, table: str, document: Dict[str, Any], columns: Dict[str, Any],
+                on_ack: Optional[Callable] = None) -> str:
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        cursor = self._execute(
+            f"INSERT INTO {table} ({names}, document) VALUES ({placeholders}, ?)",
+            (*columns.values(), json.dumps(document, default=_encode))
+        )
+        document['_id'] = str(cursor.lastrowid)
+        if on_ack is not None:
+            on_ack(document)
+        return document['_id']
+
+    def save_booking(self, booking_data: Dict[str, Any], on_ack: Optional[Callable] = None) -> bool:
+        try:
+            booking_data['created_at'] = datetime.now().isoformat()
+            booking_data.pop('_id', None)
+            return bool(self._insert('bookings', booking_data, {
+                'booking_ref': booking_data.get('booking_ref'),
+                'email': booking_data.get('email'),
+                'phone': booking_data.get('phone'),
+                'created_at': booking_data['created_at']
+            }, on_ack))
+        except sqlite3.IntegrityError:
+            logger.error(f"Booking {booking_data.get('booking_ref')} already exists")
+            return False
+        except Exception as e:
+            logger.error(f"Error saving booking: {e}")
+            return False
+
+    def get_booking(self, booking_ref: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        try:
+            row = self._fetchone(
+                "SELECT id, document FROM bookings WHERE booking_ref = ?", (booking_ref,)
+            )
+            return self._document(row, fields)
+        except Exception as e:
+            logger.error(f"Error fetching booking: {e}")
+            return None
+
+    def get_bookings(self, booking_refs: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        try:
+            bookings = []
+            for start in range(0, len(booking_refs), IN_BATCH_SIZE):
+                batch = booking_refs[start:start + IN_BATCH_SIZE]
+                rows = self._fetchall(
+                    f"SELECT id, document FROM bookings WHERE booking_ref IN ({', '.join('?' for _ in batch)})",
+                    batch
+                )
+                bookings.extend(self._document(row, fields) for row in rows)
+            return bookings
+        except Exception as e:
+            logger.error(f"Error fetching bookings: {e}")
+            return []
+
+    def _museum_info_row(self):
+        return self._fetchone("SELECT version, document FROM museum_info WHERE id = 1")
+
+    def get_museum_info(self) -> Dict[str, Any]:
+        try:
+            row = self._museum_info_row()
+            return None if row is None else json.loads(row[1])
+        except Exception as e:
+            logger.error(f"Error fetching museum info: {e}")
+            return None
+
+    def set_museum_info(self, museum_info: Dict[str, Any]):
+        museum_info = {key: value for key, value in museum_info.items() if key != '_id'}
+        self._execute(
+            "INSERT INTO museum_info (id, version, document) VALUES (1, 1, ?) "
+            "ON CONFLICT (id) DO UPDATE SET version = version + 1, document = excluded.document",
+            (json.dumps(museum_info, default=_encode),)
+        )
+
+    def watch_museum_info(self, on_change: Callable[[], None],
+                          interval: Optional[float] = None) -> Optional[threading.Thread]:
+        """Poll the museum_info version every SQLITE_WATCH_SECONDS, so a change
+        made by another process on this machine is picked up too."""
+        interval = interval or float(os.getenv('SQLITE_WATCH_SECONDS', 5))
+
+        def watch():
+            row = self._museum_info_row()
+            version = row[0] if row else 0
+            while True:
+                time.sleep(interval)
+                try:
+                    row = self._museum_info_row()
+                    if (row[0] if row else 0) != version:
+                        version = row[0] if row else 0
+                        on_change()
+                except Exception as e:
+                    logger.error(f"Museum info watch failed: {e}")
+
+        thread = threading.Thread(target=watch, name='museum-info-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def save_ticket(self, ticket_data: dict, on_ack: Optional[Callable] = None) -> str:
+        ticket_data['created_at'] = datetime.utcnow()
+        return self._insert('tickets', ticket_data, {
+            'booking_ref': ticket_data.get('booking_ref'),
+            'created_at': _timestamp(ticket_data['created_at'])
+        }, on_ack)
+
+    def get_ticket(self, ticket_id: str, fields: Optional[List[str]] = None) -> dict:
+        if not str(ticket_id).isdigit():
+            return None
+        row = self._fetchone("SELECT id, document FROM tickets WHERE id = ?", (int(ticket_id),))
+        return self._document(row, fields)
+
+    def save_transaction(self, transaction_data: dict, on_ack: Optional[Callable] = None) -> str:
+        transaction_data['created_at'] = datetime.utcnow()
+        return self._insert('transactions', transaction_data, {
+            'booking_ref': transaction_data.get('booking_ref'),
+            'created_at': _timestamp(transaction_data['created_at'])
+        }, on_ack)
+
+    def create_inventory(self) -> 'SqliteInventory':
+        return SqliteInventory(self)
+
+    def create_idempotency_store(self) -> IdempotencyStore:
+        # Claims are not shared between processes here; results are still replayed within each worker
+        return IdempotencyStore()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {'backend': self.backend, 'path': self.path, 'open': self._opened, 'idle': self._idle.qsize(),
+                'pool_size': self.pool_size}
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._opened_lock:
+                self._opened -= 1
+
+
+class SqliteInventory(BaseInventory):
+    """Visit-date capacity in the `capacity` and `capacity_holds` tables.
+
+    Every primitive is a single statement or a BEGIN IMMEDIATE transaction.
+    SQLite has one writer at a time, so a check-and-decrement cannot
+    interleave with another, even across processes sharing the file.
+    """
+
+    def __init__(self, storage: SqliteStorage, **kwargs):
+        super().__init__(**kwargs)
+        self.storage = storage
+
+    def _create(self, key: str, capacity: int):
+        self.storage._execute(
+            "INSERT OR IGNORE INTO capacity (key, capacity, remaining) VALUES (?, ?, ?)", (key, capacity, capacity)
+        )
+
+    def _take(self, key: str, count: int) -> Optional[int]:
+        with self.storage._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE capacity SET remaining = remaining - ? WHERE key = ? AND remaining >= ?", (count, key, count)
+            ).rowcount
+            if not updated:
+                return None
+            return conn.execute("SELECT remaining FROM capacity WHERE key = ?", (key,)).fetchone()[0]
+
+    def _add_remaining(self, key: str, count: int):
+        self.storage._execute(
+            "UPDATE capacity SET remaining = remaining + ? WHERE key = ?", (count, key)
+        )
+
+    def _read(self, key: str) -> Optional[Dict[str, int]]:
+        row = self.storage._fetchone(
+            "SELECT capacity, remaining FROM capacity WHERE key = ?", (key,)
+        )
+        return None if row is None else {'capacity': row[0], 'remaining': row[1]}
+
+    def _get_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        row = self.storage._fetchone("SELECT key, count FROM capacity_holds WHERE booking_ref = ?", (booking_ref,))
+        return None if row is None else {'key': row[0], 'count': row[1]}
+
+    def _swap_hold(self, booking_ref: str, key: str, count: int, expires_at: datetime,
+                   expected: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with self.storage._transaction() as conn:
+            row = conn.execute(
+                "SELECT key, count FROM capacity_holds WHERE booking_ref = ?", (booking_ref,)
+            ).fetchone()
+            if expected is not None and (row is None or tuple(row) != (expected['key'], expected['count'])):
+                return False, None
+            conn.execute(
+                "INSERT OR REPLACE INTO capacity_holds (booking_ref, key, count, status, expires_at) "
+                "VALUES (?, ?, ?, 'held', ?)", (booking_ref, key, count, _timestamp(expires_at))
+            )
+            return True, None if row is None else {'key': row[0], 'count': row[1]}
+
+    def _mark_confirmed(self, booking_ref: str) -> bool:
+        return bool(self.storage._execute(
+            "UPDATE capacity_holds SET status = 'confirmed', expires_at = NULL "
+            "WHERE booking_ref = ? AND status = 'held'", (booking_ref,)
+        ).rowcount)
+
+    def _is_confirmed(self, booking_ref: str) -> bool:
+        return self.storage._fetchone(
+            "SELECT 1 FROM capacity_holds WHERE booking_ref = ? AND status = 'confirmed'", (booking_ref,)
+        ) is not None
+
+    def _pop(self, conn, row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        conn.execute("DELETE FROM capacity_holds WHERE booking_ref = ?", (row[0],))
+        return {'key': row[1], 'count': row[2]}
+
+    def _pop_hold(self, booking_ref: str) -> Optional[Dict[str, Any]]:
+        with self.storage._transaction() as conn:
+            return self._pop(conn, conn.execute(
+                "SELECT booking_ref, key, count FROM capacity_holds WHERE booking_ref = ?", (booking_ref,)
+            ).fetchone())
+
+    def _pop_expired(self, key: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        query = "SELECT booking_ref, key, count FROM capacity_holds WHERE status = 'held' AND expires_at <= ?"
+        params = [_timestamp(now)]
+        if key is not None:
+            query += " AND key = ?"
+            params.append(key)
+        with self.storage._transaction() as conn:
+            return self._pop(conn, conn.execute(query + " LIMIT 1", params).fetchone())
+
+    def _change_capacity(self, key: str, capacity: int):
+        # Both right-hand sides see the old capacity, so remaining moves by the difference
+        self.storage._execute(
+            "UPDATE capacity SET remaining = remaining + (? - capacity), capacity = ? WHERE key = ?",
+            (capacity, capacity, key)
+        )
+
+
+class SqliteSessionBackend:
+    """Shared conversation state for several workers on one machine; see
+    sessions.SharedSessionStore for the load/save contract."""
+
+    name = 'sqlite'
+
+    def __init__(self, storage: SqliteStorage):
+        self.storage = storage
+        self._created = 0
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        row = self.storage._fetchone(
+            "SELECT version, data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+        )
+        return None if row is None else (row[0], row[1])
+
+    def save(self, session_id: str, data: bytes, expected_version: Optional[int], ttl: float) -> Optional[int]:
+        now = time.time()
+        if expected_version is None:
+            with self.storage._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO sessions (id, version, data, expires_at) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET version = version + 1, data = excluded.data, "
+                    "expires_at = excluded.expires_at", (session_id, data, now + ttl)
+                )
+                return conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+        if expected_version == 0:
+            self._created += 1
+            if self._created % SESSION_SWEEP_EVERY == 0:
+                self.storage._execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            # Only an expired row may be replaced by a new session of the same id
+            written = self.storage._execute(
+                "INSERT INTO sessions (id, version, data, expires_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET version = 1, data = excluded.data, expires_at = excluded.expires_at "
+                "WHERE sessions.expires_at <= ?", (session_id, data, now + ttl, now)
+            ).rowcount
+            return 1 if written else None
+        written = self.storage._execute(
+            "UPDATE sessions SET version = version + 1, data = ?, expires_at = ? WHERE id = ? AND version = ?",
+            (data, now + ttl, session_id, expected_version)
+        ).rowcount
+        return expected_version + 1 if written else None
+
+    def delete(self, session_id: str):
+        self.storage._execute("DELETE FROM sessions WHERE id = ?", (session_id,))
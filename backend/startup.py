@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Import this module first in an entrypoint so the clock starts with the process
+_started = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+_phases_lock = threading.Lock()
+_ready_at = None
+
+# Heavy optional modules worth calling out in the report when they are loaded
+WATCHED_MODULES = ('ollama', 'httpx', 'reportlab', 'pymongo')
+
+
+def record_phase(name: str, seconds: float):
+    with _phases_lock:
+        _phases.append((name, seconds))
+
+
+@contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def mark_ready():
+    global _ready_at
+    if _ready_at is None:
+        _ready_at = time.perf_counter()
+
+
+def startup_report() -> Dict[str, Any]:
+    with _phases_lock:
+        phases = {name: round(seconds * 1000, 2) for name, seconds in _phases}
+    return {
+        'phases_ms': phases,
+        'ready_ms': round((_ready_at - _started) * 1000, 2) if _ready_at is not None else None,
+        'loaded_modules': [name for name in WATCHED_MODULES if name in sys.modules]
+    }
+
+
+def log_startup_report():
+    mark_ready()
+    report = startup_report()
+    phases = ', '.join(f"{name} {ms}ms" for name, ms in report['phases_ms'].items())
+    logger.info(f"Startup ready in {report['ready_ms']}ms ({phases}); "
+                f"loaded: {', '.join(report['loaded_modules']) or 'none'}")
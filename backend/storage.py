@@ -0,0 +1,167 @@
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
+import functools
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ('mongo', 'memory', 'sqlite')
+
+
+def storage_backend() -> str:
+    return os.getenv('STORAGE_BACKEND', 'mongo').lower()
+
+
+def project(document: Optional[Dict[str, Any]], fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Copy a stored document the way a Mongo projection would: only `fields`
+    when given, and _id only when asked for."""
+    if document is None:
+        return None
+    if fields:
+        return {key: copy.deepcopy(value) for key, value in document.items() if key in fields}
+    return {key: copy.deepcopy(value) for key, value in document.items() if key != '_id'}
+
+
+class Storage:
+    """What the chatbot and the HTTP apps need from persistence.
+
+    DatabaseHandler (Mongo) is the production backend. MemoryStorage keeps
+    everything in process and needs no service at all. SqliteStorage is a
+    single WAL-mode file for kiosks and other single-machine deployments.
+    STORAGE_BACKEND picks one; get_storage() returns the shared instance.
+
+    Lookups return plain dicts shaped like Mongo documents: no _id unless
+    it is listed in `fields`. Saves call on_ack(document) once the write is
+    durable, or later when the backend batches writes.
+    """
+
+    backend = 'base'
+
+    def ensure_indexes(self) -> bool:
+        return True
+
+    def save_booking(self, booking_data: Dict[str, Any], on_ack: Optional[Callable] = None) -> bool:
+        raise NotImplementedError
+
+    def get_booking(self, booking_ref: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_bookings(self, booking_refs: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_museum_info(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def set_museum_info(self, museum_info: Dict[str, Any]):
+        raise NotImplementedError
+
+    def watch_museum_info(self, on_change: Callable[[], None]) -> Optional[threading.Thread]:
+        """Call on_change whenever museum info changes; returns the watcher thread, if one is needed."""
+        raise NotImplementedError
+
+    def save_ticket(self, ticket_data: dict, on_ack: Optional[Callable] = None) -> str:
+        raise NotImplementedError
+
+    def get_ticket(self, ticket_id: str, fields: Optional[List[str]] = None) -> dict:
+        raise NotImplementedError
+
+    def save_transaction(self, transaction_data: dict, on_ack: Optional[Callable] = None) -> str:
+        raise NotImplementedError
+
+    def create_inventory(self):
+        """A new visit-date capacity inventory kept in this backend."""
+        raise NotImplementedError
+
+    def create_idempotency_store(self):
+        """A new idempotency store persisted by this backend (in-process only where it cannot be shared)."""
+        raise NotImplementedError
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {'backend': self.backend}
+
+    def close(self):
+        pass
+
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    backend = backend or storage_backend()
+    # Imported here so a memory or sqlite deployment never builds a Mongo client
+    if backend == 'mongo':
+        from database import DatabaseHandler
+        return DatabaseHandler()
+    if backend == 'memory':
+        from memory_storage import MemoryStorage
+        return MemoryStorage()
+    if backend == 'sqlite':
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected one of {', '.join(STORAGE_BACKENDS)}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """Return the process-wide storage picked by STORAGE_BACKEND (mongo, memory or sqlite)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+                logger.info(f"Using {_storage.backend} storage")
+    return _storage
+
+
+class AsyncStorage:
+    """Awaitable facade over a Storage for the FastAPI app.
+
+    Every backend is blocking, so each call is pushed onto a dedicated thread
+    pool and the event loop stays free while a round-trip is in flight.
+    """
+
+    def __init__(self, handler: Optional[Storage] = None, max_workers: Optional[int] = None):
+        self.sync = handler or get_storage()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('MONGODB_EXECUTOR_WORKERS', 16)),
+            thread_name_prefix='storage'
+        )
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def save_booking(self, booking_data: Dict[str, Any], on_ack: Optional[Callable] = None) -> bool:
+        return await self.run(self.sync.save_booking, booking_data, on_ack)
+
+    async def ensure_indexes(self) -> bool:
+        return await self.run(self.sync.ensure_indexes)
+
+    async def get_booking(self, booking_ref: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        return await self.run(self.sync.get_booking, booking_ref, fields)
+
+    async def get_bookings(self, booking_refs: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self.run(self.sync.get_bookings, booking_refs, fields)
+
+    async def get_museum_info(self) -> Dict[str, Any]:
+        return await self.run(self.sync.get_museum_info)
+
+    def watch_museum_info(self, on_change: Callable[[], None]) -> Optional[threading.Thread]:
+        return self.sync.watch_museum_info(on_change)
+
+    async def save_ticket(self, ticket_data: dict, on_ack: Optional[Callable] = None) -> str:
+        return await self.run(self.sync.save_ticket, ticket_data, on_ack)
+
+    async def get_ticket(self, ticket_id: str, fields: Optional[List[str]] = None) -> dict:
+        return await self.run(self.sync.get_ticket, ticket_id, fields)
+
+    async def save_transaction(self, transaction_data: dict, on_ack: Optional[Callable] = None) -> str:
+        return await self.run(self.sync.save_transaction, transaction_data, on_ack)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.sync.close()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.fake_ollama import FakeOllamaServer  # noqa: E402
+
+
+@pytest.fixture
+def ollama_server(monkeypatch):
+    """A fake Ollama server of its own, with the llm module's client pointed at it."""
+    import llm
+    server = FakeOllamaServer(latency=0.05).start()
+    monkeypatch.setenv('OLLAMA_HOST', server.url)
+    monkeypatch.setenv('LLM_MODEL', 'fake-model')
+    monkeypatch.setattr(llm, '_client', None)
+    yield server
+    server.stop()
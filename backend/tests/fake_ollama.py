@@ -0,0 +1,93 @@
+"""A local HTTP server that speaks enough of Ollama's /api/chat for the
+ollama client, sleeping `latency` seconds per call the way a small local
+model would. Answers are "<think>reasoning</think>Answer to: <question>";
+streamed answers arrive as NDJSON chunks spread over the same latency.
+
+Each server keeps its own latency and call count, so tests and benchmarks
+can run several without sharing state.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server: 'FakeOllamaServer'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.record_call()
+        question = body['messages'][-1]['content']
+        if body.get('stream'):
+            return self.stream_answer(body['model'], question)
+        time.sleep(self.server.latency)
+        payload = json.dumps({
+            'model': body['model'],
+            'created_at': '2025-01-01T00:00:00Z',
+            'message': {'role': 'assistant', 'content': f"<think>reasoning</think>Answer to: {question}"},
+            'done': True
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        try:
+            self.end_headers()
+            self.wfile.write(payload)
+        except BrokenPipeError:
+            pass  # the client gave up (timeout)
+
+    def stream_answer(self, model, question):
+        # NDJSON chunks spread over the same latency, like a model generating tokens
+        pieces = ['<think>', 'reasoning', '</think>'] + f"Answer to: {question}".split(' ')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                time.sleep(self.server.latency / len(pieces))
+                text = piece if i < 3 else (' ' if i > 3 else '') + piece
+                chunk = {'model': model, 'created_at': '2025-01-01T00:00:00Z',
+                         'message': {'role': 'assistant', 'content': text}, 'done': False}
+                self.wfile.write(json.dumps(chunk).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            self.wfile.write(json.dumps({'model': model, 'created_at': '2025-01-01T00:00:00Z',
+                                         'message': {'role': 'assistant', 'content': ''},
+                                         'done': True}).encode('utf-8') + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.5):
+        super().__init__(('127.0.0.1', 0), FakeOllamaHandler)
+        self.latency = latency
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def calls(self) -> int:
+        """Requests received so far."""
+        with self._lock:
+            return self._calls
+
+    def record_call(self):
+        with self._lock:
+            self._calls += 1
+
+    def start(self) -> 'FakeOllamaServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
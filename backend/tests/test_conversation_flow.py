@@ -0,0 +1,268 @@
+"""CompiledFlow.dispatch driven turn by turn, the way ChatbotService does it.
+
+The service here is in-memory: a local session store, MemoryInventory for
+seat holds, a collection-less IdempotencyStore and a database that records
+what it is asked to save. Each turn starts from the state the previous
+reply returned, as the clients send it back.
+"""
+import itertools
+from datetime import date, timedelta
+
+import pytest
+
+from conversation_flow import BOOKING_FLOW, CompiledFlow, TurnContext
+from idempotency import IdempotencyStore
+from inventory import MemoryInventory
+from sessions import SessionStore
+from validation import normalize_command
+
+PRICES = {'adult': 500, 'student': 250, 'child': 0}
+VISIT_DATE = (date.today() + timedelta(days=30)).isoformat()
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.saved = []
+
+    def save_booking(self, booking, on_ack=None):
+        self.saved.append(booking)
+        return True
+
+
+class FlowService:
+    def __init__(self, capacity=5):
+        self.sessions = SessionStore()
+        self.inventory = MemoryInventory(daily_capacity=capacity)
+        self.idempotency = IdempotencyStore()
+        self.db = RecordingDatabase()
+        self.flow = CompiledFlow(BOOKING_FLOW, PRICES)
+        self._refs = itertools.count(1)
+
+    def generate_booking_ref(self):
+        return f"MSMTEST{next(self._refs):06d}"
+
+    def _booking_persisted(self, booking):
+        pass
+
+
+class Conversation:
+    def __init__(self, service):
+        self.service = service
+        self.session_id, self.session = service.sessions.get(None)
+
+    @property
+    def booking(self):
+        return self.session.booking
+
+    def send(self, message):
+        ctx = TurnContext(self.service, self.session_id, self.session, normalize_command(message), message.strip())
+        response = self.service.flow.dispatch(ctx)
+        self.session = ctx.session
+        self.session.current_step = response['state']
+        return response
+
+    def send_all(self, *messages):
+        for message in messages:
+            response = self.send(message)
+        return response
+
+
+@pytest.fixture
+def service():
+    return FlowService()
+
+
+@pytest.fixture
+def chat(service):
+    return Conversation(service)
+
+
+def start_booking(chat):
+    return chat.send_all('hi', 'book', 'Asha Rao', 'asha@example.com', '98765 43210')
+
+
+def test_booking_path_to_payment(chat, service):
+    assert chat.send('hi')['state'] == 'initial_options'
+    assert chat.send('Book')['state'] == 'asking_name'
+    assert chat.send('  Asha   Rao ')['state'] == 'asking_email'
+    assert chat.send('asha@Example.COM')['state'] == 'asking_phone'
+    assert chat.send('098765-43210')['state'] == 'asking_adult_tickets'
+    assert chat.send('2')['state'] == 'asking_student_tickets'
+    assert chat.send('1')['state'] == 'asking_child_tickets'
+    assert chat.send('1')['state'] == 'asking_date'
+
+    summary = chat.send(VISIT_DATE)
+    assert summary['state'] == 'confirm_booking'
+    assert 'Total Amount: ₹1250' in summary['response']
+    assert summary['booking_info'] == {
+        'name': 'Asha Rao', 'email': 'asha@example.com', 'phone': '+919876543210',
+        'adult_tickets': 2, 'student_tickets': 1, 'child_tickets': 1, 'total_amount': 1250,
+        'visit_date': VISIT_DATE, 'booking_ref': 'MSMTEST000001'
+    }
+    assert service.inventory.availability(VISIT_DATE)['remaining'] == 1
+
+    assert chat.send('confirm')['state'] == 'payment'
+    completed = chat.send('payment_completed')
+    assert completed['state'] == 'booking_completed'
+    assert completed['ticket_data']['booking_ref'] == 'MSMTEST000001'
+    assert completed['ticket_data']['total_amount'] == 1250
+    assert [booking['status'] for booking in service.db.saved] == ['paid']
+
+
+def test_repeated_payment_completion_saves_once(chat, service):
+    start_booking(chat)
+    chat.send_all('1', '0', '0', VISIT_DATE, 'confirm')
+    chat.send('payment_completed')
+    chat.session.current_step = 'payment'
+
+    again = chat.send('payment_completed')
+
+    assert again['state'] == 'booking_completed'
+    assert len(service.db.saved) == 1
+
+
+def test_cancel_releases_the_hold_and_edit_reserves_again(chat, service):
+    start_booking(chat)
+    chat.send_all('2', '0', '0', VISIT_DATE)
+    assert service.inventory.availability(VISIT_DATE)['remaining'] == 3
+
+    assert chat.send('cancel')['state'] == 'after_cancellation'
+    assert service.inventory.availability(VISIT_DATE)['remaining'] == 5
+
+    assert chat.send('edit_info')['state'] == 'asking_adult_tickets'
+    summary = chat.send_all('1', '0', '0', VISIT_DATE)
+    assert summary['state'] == 'confirm_booking'
+    assert summary['booking_info']['booking_ref'] == 'MSMTEST000001'
+    assert service.inventory.availability(VISIT_DATE)['remaining'] == 4
+
+
+def test_student_only_booking_skips_child_tickets(chat):
+    start_booking(chat)
+    assert 'At least one adult or student ticket' in chat.send('0')['response']
+    assert chat.send('3')['state'] == 'asking_date'
+    assert chat.booking.child_tickets == 0
+    assert chat.booking.total_amount == 750
+
+
+def test_no_tickets_at_all_starts_over(chat):
+    start_booking(chat)
+    chat.send('0')
+    response = chat.send('0')
+    assert response['state'] == 'initial_options'
+    assert 'at least one ticket' in response['response']
+
+
+@pytest.mark.parametrize('message, reply', [
+    ('-3', "Please enter a valid number (0 or more) for adult tickets."),
+    ('-0', "Please enter a valid number (0 or more) for adult tickets."),
+    ('+3', "Please enter a valid number for adult tickets."),
+    ('two', "Please enter a valid number for adult tickets."),
+    ('1.5', "Please enter a valid number for adult tickets."),
+    ('٣', "Please enter a valid number for adult tickets."),
+    ('-', "Please enter a valid number for adult tickets."),
+])
+def test_invalid_adult_counts(chat, message, reply):
+    start_booking(chat)
+    response = chat.send(message)
+    assert response['state'] == 'asking_adult_tickets'
+    assert response['response'] == reply
+    assert chat.booking.adult_tickets is None
+
+
+def test_negative_student_count(chat):
+    start_booking(chat)
+    chat.send('1')
+    response = chat.send('-2')
+    assert response['state'] == 'asking_student_tickets'
+    assert response['response'] == "Please enter a valid number (0 or more) for student tickets."
+
+
+@pytest.mark.parametrize('message', ['-1', '+1', 'one'])
+def test_invalid_child_counts(chat, message):
+    start_booking(chat)
+    chat.send_all('1', '0')
+    response = chat.send(message)
+    assert response['state'] == 'asking_child_tickets'
+    assert response['response'] == "Please enter a valid number for children's tickets."
+    assert chat.booking.child_tickets is None
+
+
+@pytest.mark.parametrize('phone, stored', [
+    ('9876543210', '+919876543210'),
+    ('+91 98765 43210', '+919876543210'),
+    ('09876543210', '+919876543210'),
+    ('(987) 654-3210', '+919876543210'),
+    ('+44 20 7946 0958', '+442079460958'),
+])
+def test_phone_numbers_are_stored_in_e164(chat, phone, stored):
+    chat.send_all('hi', 'book', 'Asha', 'asha@example.com')
+    assert chat.send(phone)['state'] == 'asking_adult_tickets'
+    assert chat.booking.phone == stored
+
+
+@pytest.mark.parametrize('phone', ['12345', '+0123456789', '98765x43210', '+1234567890123456'])
+def test_invalid_phone_numbers(chat, phone):
+    chat.send_all('hi', 'book', 'Asha', 'asha@example.com')
+    response = chat.send(phone)
+    assert response['state'] == 'asking_phone'
+    assert chat.booking.phone is None
+
+
+def test_invalid_email(chat):
+    chat.send_all('hi', 'book', 'Asha')
+    assert chat.send('not-an-email')['state'] == 'asking_email'
+    assert chat.booking.email is None
+
+
+def test_past_and_invalid_visit_dates(chat, service):
+    start_booking(chat)
+    chat.send_all('1', '0', '0')
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+
+    past = chat.send(yesterday)
+    assert past['state'] == 'asking_date'
+    assert past['response'].startswith('That date has already passed')
+    invalid = chat.send('someday')
+    assert invalid['response'] == "Please select a valid visit date."
+    assert chat.booking.visit_date is None
+
+
+def test_sold_out_date(chat, service):
+    service.inventory.set_capacity(VISIT_DATE, 1)
+    start_booking(chat)
+    response = chat.send_all('2', '0', '0', VISIT_DATE)
+    assert response['state'] == 'asking_date'
+    assert response['response'] == f"Sorry, {VISIT_DATE} is fully booked for 2 ticket(s). Please select another date."
+
+
+def test_payment_after_the_hold_expired_on_a_full_date(chat, service):
+    start_booking(chat)
+    chat.send_all('2', '0', '0', VISIT_DATE, 'confirm')
+    service.inventory.release(chat.booking.booking_ref)
+    service.inventory.set_capacity(VISIT_DATE, 0)
+
+    response = chat.send('payment_completed')
+
+    assert response['state'] == 'asking_date'
+    assert response['response'].startswith(f"Sorry, your reservation for {VISIT_DATE} expired")
+    assert service.db.saved == []
+
+
+def test_ended_conversation_only_restarts(chat):
+    chat.send_all('hi', 'info')
+    assert chat.send('end')['state'] == 'ended'
+    assert chat.send('book')['state'] == 'ended'
+    assert chat.send('start_new')['state'] == 'initial_options'
+    assert chat.send('book')['state'] == 'asking_name'
+
+
+def test_unmatched_text_uses_the_answer_function():
+    service = FlowService()
+    service.flow = CompiledFlow(BOOKING_FLOW, PRICES, answer=lambda question, on_token: f"About: {question}")
+    chat = Conversation(service)
+    chat.send('hi')
+
+    response = chat.send('Is there parking?')
+
+    assert response['response'] == 'About: Is there parking?'
+    assert response['state'] == 'initial_options'
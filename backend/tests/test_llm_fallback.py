@@ -0,0 +1,125 @@
+"""LLMFallback against the fake Ollama server in tests/fake_ollama.py.
+
+Every test goes through the real ollama client over HTTP, so
+ollama_server.calls counts calls that actually reached the (fake) model.
+"""
+import threading
+import time
+
+import llm
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+def test_answers_are_cached_by_normalised_question(ollama_server):
+    fallback = llm.LLMFallback()
+
+    first = fallback.answer('What time does the museum open?')
+    assert ollama_server.calls == 1
+    again = fallback.answer('what time does the museum open')
+
+    assert first == 'Answer to: What time does the museum open?'
+    assert again == first
+    stats = fallback.stats()
+    assert stats['model_calls'] == 1
+    assert stats['cache_hits'] == 1
+    assert stats['cached'] == 1
+    assert ollama_server.calls == 1
+
+
+def test_concurrent_identical_questions_share_one_model_call(ollama_server):
+    ollama_server.latency = 0.5
+    fallback = llm.LLMFallback()
+    callers = 8
+    answers = []
+    barrier = threading.Barrier(callers)
+
+    def ask():
+        barrier.wait()
+        answers.append(fallback.answer('Can I take photos inside?'))
+
+    threads = [threading.Thread(target=ask) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert answers == ['Answer to: Can I take photos inside?'] * callers
+    stats = fallback.stats()
+    assert stats['model_calls'] == 1
+    assert stats['coalesced'] == callers - 1
+    assert stats['in_flight'] == 0
+    assert ollama_server.calls == 1
+
+
+def test_slow_model_times_out_and_is_not_cached(ollama_server, monkeypatch):
+    ollama_server.latency = 1.0
+    monkeypatch.setattr(llm, 'LLM_TIMEOUT', 0.2)
+    fallback = llm.LLMFallback()
+
+    assert fallback.answer('Is there parking near the museum?') is None
+    assert fallback.stats()['timeouts'] == 1
+    assert ollama_server.calls == 1
+    # The abandoned call ends at the client's own timeout and leaves nothing cached
+    wait_for(lambda: not fallback.stats()['in_flight'])
+    assert fallback.stats()['cached'] == 0
+
+    ollama_server.latency = 0.05
+    monkeypatch.setattr(llm, '_client', None)
+    monkeypatch.setattr(llm, 'LLM_TIMEOUT', 5)
+    assert fallback.answer('Is there parking near the museum?') == 'Answer to: Is there parking near the museum?'
+    stats = fallback.stats()
+    assert stats['model_calls'] == 2
+    assert stats['cache_hits'] == 0
+    assert ollama_server.calls == 2
+
+
+def test_coalesced_caller_gives_up_after_its_timeout(ollama_server):
+    ollama_server.latency = 1.0
+    fallback = llm.LLMFallback(timeout=0.2)
+    leader = threading.Thread(target=fallback.answer, args=('Can I bring food?',))
+    leader.start()
+    wait_for(lambda: fallback.stats()['in_flight'])
+
+    assert fallback.answer('can i bring food') is None
+    leader.join()
+    stats = fallback.stats()
+    assert stats['coalesced'] == 1
+    # The leader is bound by the same deadline
+    assert stats['timeouts'] == 2
+    assert stats['model_calls'] == 1
+
+
+def test_calls_beyond_the_concurrency_cap_are_rejected(ollama_server):
+    ollama_server.latency = 1.0
+    fallback = llm.LLMFallback(timeout=0.2, max_concurrency=1)
+    leader = threading.Thread(target=fallback.answer, args=('Where is the museum located?',))
+    leader.start()
+    wait_for(lambda: fallback.stats()['model_calls'])
+
+    assert fallback.answer('Do you have wheelchair access?') is None
+    leader.join()
+    stats = fallback.stats()
+    assert stats['rejected'] == 1
+    assert stats['model_calls'] == 1
+    assert ollama_server.calls == 1
+
+
+def test_streamed_answer_stops_at_the_overall_deadline(ollama_server):
+    # Every chunk arrives well within the client's read timeout; only the total is too long
+    ollama_server.latency = 3.0
+    fallback = llm.LLMFallback(timeout=0.5)
+    tokens = []
+
+    start = time.monotonic()
+    assert fallback.answer('What time does the museum open?', tokens.append) is None
+    assert time.monotonic() - start < 1.0
+    wait_for(lambda: not fallback.stats()['in_flight'], timeout=1.5)
+    assert time.monotonic() - start < 2.0
+    assert fallback.stats()['timeouts'] == 1
+    assert fallback.stats()['cached'] == 0
@@ -0,0 +1,120 @@
+from typing import Any, Callable, Dict, Optional
+from collections import OrderedDict
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import logging
+from cache import BytesLRUCache
+from ticket_generator import TICKET_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SAFE_REF_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def ticket_cache_key(ticket_data: Dict[str, Any]) -> str:
+    # Only the fields the renderer reads; anything else in the payload does not change the PDF
+    fields = {field: ticket_data.get(field) for field in TICKET_FIELDS}
+    body = json.dumps(fields, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class TicketCache:
+    """Content-addressed cache of rendered ticket PDFs.
+
+    PDFs are keyed by a hash of the ticket fields, so the same booking is
+    rendered once no matter how often it is downloaded. A size-bounded LRU
+    holds hot tickets in memory; when cache_dir is set, tickets are also
+    written there and survive restarts. A booking_ref -> key index lets
+    tickets be fetched by reference alone.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, cache_dir: Optional[str] = None,
+                 max_refs: int = 100000):
+        self.memory = BytesLRUCache(max_bytes or int(os.getenv('TICKET_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv('TICKET_CACHE_DIR')
+        self.max_refs = max_refs
+        self._refs: "OrderedDict[str, str]" = OrderedDict()
+        self._refs_lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _remember_ref(self, booking_ref: str, key: str):
+        with self._refs_lock:
+            self._refs[booking_ref] = key
+            self._refs.move_to_end(booking_ref)
+            while len(self._refs) > self.max_refs:
+                self._refs.popitem(last=False)
+
+    def _read_disk(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Error reading ticket cache file {name}: {e}")
+            return None
+
+    def _write_disk(self, name: str, data: bytes):
+        # Write then rename so readers never see a partial file; the temp name
+        # is unique, so threads writing the same entry never share one
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=f"{name}.", suffix='.tmp',
+                                             delete=False) as f:
+                tmp_path = f.name
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except OSError as e:
+            logger.error(f"Error writing ticket cache file {name}: {e}")
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+    def get_by_key(self, key: str) -> Optional[bytes]:
+        pdf_bytes = self.memory.get(key)
+        if pdf_bytes is None and self.cache_dir:
+            pdf_bytes = self._read_disk(f"{key}.pdf")
+            if pdf_bytes is not None:
+                self.memory.set(key, pdf_bytes)
+        return pdf_bytes
+
+    def get(self, ticket_data: Dict[str, Any]) -> Optional[bytes]:
+        return self.get_by_key(ticket_cache_key(ticket_data))
+
+    def get_by_ref(self, booking_ref: str) -> Optional[bytes]:
+        with self._refs_lock:
+            key = self._refs.get(booking_ref)
+        if key is None and self.cache_dir and SAFE_REF_RE.match(booking_ref):
+            ref_data = self._read_disk(f"{booking_ref}.ref")
+            key = ref_data.decode('ascii') if ref_data else None
+        return self.get_by_key(key) if key else None
+
+    def put(self, ticket_data: Dict[str, Any], pdf_bytes: bytes) -> str:
+        key = ticket_cache_key(ticket_data)
+        booking_ref = str(ticket_data['booking_ref'])
+        self.memory.set(key, pdf_bytes)
+        self._remember_ref(booking_ref, key)
+        if self.cache_dir:
+            self._write_disk(f"{key}.pdf", pdf_bytes)
+            if SAFE_REF_RE.match(booking_ref):
+                self._write_disk(f"{booking_ref}.ref", key.encode('ascii'))
+        return key
+
+    def get_or_render(self, ticket_data: Dict[str, Any], render: Callable[[Dict[str, Any]], bytes]) -> bytes:
+        pdf_bytes = self.get(ticket_data)
+        if pdf_bytes is None:
+            pdf_bytes = render(ticket_data)
+            self.put(ticket_data, pdf_bytes)
+        return pdf_bytes
+
+
+ticket_cache = TicketCache()
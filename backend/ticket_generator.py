@@ -4,53 +4,136 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase.pdfmetrics import registerFont, Font
+import io
 import os
-from datetime import datetime
+import re
+import zipfile
 
-def generate_ticket_pdf(ticket_data):
-    if not os.path.exists('tickets'):
-        os.makedirs('tickets')
-        
-    filename = f"tickets/museum-ticket-{ticket_data['booking_ref']}.pdf"
-    
-    c = canvas.Canvas(filename, pagesize=A4)
-    width, height = A4
-
-    # Theme colors
-    primary_color = colors.Color(0.29, 0.22, 0.16)  # Dark brown
-    secondary_color = colors.Color(0.77, 0.64, 0.52)  # Gold
-    
-    # Use Rs. instead of ₹ symbol for better compatibility
-    try:
-        # Register a font that supports rupee symbol
-        font_path = os.path.join(os.path.dirname(__file__), 'fonts', 'NotoSans-Regular.ttf')
-        pdfmetrics.registerFont(TTFont('NotoSans', font_path))
-        use_rupee_symbol = True
-    except:
-        use_rupee_symbol = False
-    
-    rupee = "₹" if use_rupee_symbol else "Rs."
-    
+TICKETS_DIR = os.getenv('TICKETS_DIR', 'tickets')
+# Rendered tickets are only written to TICKETS_DIR when this is enabled
+PERSIST_TICKETS = os.getenv('PERSIST_TICKETS', 'false').lower() == 'true'
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+
+# Theme colors
+PRIMARY_COLOR = colors.Color(0.29, 0.22, 0.16)  # Dark brown
+SECONDARY_COLOR = colors.Color(0.77, 0.64, 0.52)  # Gold
+
+RUPEE_FONT_PATH = os.path.join(os.path.dirname(__file__), 'fonts', 'NotoSans-Regular.ttf')
+
+# Form XObjects holding the constant parts of a ticket, drawn once per multi-page document
+PAGE_FORM = 'ticket_page'
+INSTRUCTIONS_FORM = 'ticket_instructions'
+
+# Every field the renderer reads from a ticket payload
+TICKET_FIELDS = (
+    'booking_ref', 'visit_date', 'name', 'email', 'phone',
+    'adult_tickets', 'student_tickets', 'child_tickets'
+)
+
+INSTRUCTIONS = (
+    "• Please arrive 15 minutes before your scheduled visit time",
+    "• Present this ticket at the entrance (digital or printed)",
+    "• Photography is allowed without flash",
+    "• No food and beverages allowed inside",
+    "• Please maintain silence in the museum premises"
+)
+
+# The instructions hang below their origin: heading at y=0, then one line every 0.3in
+INSTRUCTIONS_BBOX = (0, -(len(INSTRUCTIONS) * 0.3 + 0.2) * inch, PAGE_WIDTH, 0.5 * inch)
+
+_rupee_font_available = None
+
+# Inline batch tickets carry client-supplied refs; keep them to one plain path component
+UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def ticket_filename(booking_ref):
+    return f"museum-ticket-{UNSAFE_FILENAME_CHARS.sub('_', str(booking_ref))}.pdf"
+
+def save_ticket_file(booking_ref, pdf_bytes):
+    os.makedirs(TICKETS_DIR, exist_ok=True)
+    path = os.path.join(TICKETS_DIR, ticket_filename(booking_ref))
+    with open(path, 'wb') as f:
+        f.write(pdf_bytes)
+    return path
+
+def use_rupee_symbol():
+    # Register a font that supports the rupee symbol once per process; fall back to "Rs."
+    global _rupee_font_available
+    if _rupee_font_available is None:
+        try:
+            pdfmetrics.registerFont(TTFont('NotoSans', RUPEE_FONT_PATH))
+            _rupee_font_available = True
+        except Exception:
+            _rupee_font_available = False
+    return _rupee_font_available
+
+def _draw_page_layer(c):
     # Header
-    c.setFillColor(primary_color)
+    c.setFillColor(PRIMARY_COLOR)
     c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width/2, height-1.5*inch, "NATIONAL MUSEUM OF INDIA")
-    
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT-1.5*inch, "NATIONAL MUSEUM OF INDIA")
+
     c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(width/2, height-2*inch, "ENTRY TICKET")
-    
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT-2*inch, "ENTRY TICKET")
+
     # Decorative line
-    c.setStrokeColor(secondary_color)
+    c.setStrokeColor(SECONDARY_COLOR)
     c.setLineWidth(2)
-    c.line(2*inch, height-2.5*inch, width-2*inch, height-2.5*inch)
-    
-    # Ticket details
-    y = height-3*inch
+    c.line(2*inch, PAGE_HEIGHT-2.5*inch, PAGE_WIDTH-2*inch, PAGE_HEIGHT-2.5*inch)
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(1*inch, PAGE_HEIGHT-3*inch, "BOOKING DETAILS")
+
+    # Footer
+    c.setFont("Helvetica", 10)
+    c.drawCentredString(PAGE_WIDTH/2, 0.5*inch, "Thank you for visiting National Museum of India")
+
+def _draw_instructions_layer(c, top=0):
+    # Drawn from top downwards; top=0 inside the form, which is placed below
+    # the variable-height details at render time
+    c.setFillColor(PRIMARY_COLOR)
     c.setFont("Helvetica-Bold", 14)
-    c.drawString(1*inch, y, "BOOKING DETAILS")
-    y -= 0.5*inch
-    
+    c.drawString(1*inch, top, "IMPORTANT INSTRUCTIONS")
+
+    y = top - 0.4*inch
+    c.setFont("Helvetica", 11)
+    for instruction in INSTRUCTIONS:
+        c.drawString(1*inch, y, instruction)
+        y -= 0.3*inch
+
+def define_template_forms(c):
+    """Draw the constant parts of a ticket into form XObjects, once per document;
+    every page then references them with doForm instead of drawing them again.
+    Only worth it for multi-page documents: a single page pays for the extra
+    streams without reusing them."""
+    if c.hasForm(PAGE_FORM):
+        return
+    c.beginForm(PAGE_FORM)
+    _draw_page_layer(c)
+    c.endForm()
+    c.beginForm(INSTRUCTIONS_FORM, *INSTRUCTIONS_BBOX)
+    _draw_instructions_layer(c)
+    c.endForm()
+
+def new_ticket_canvas(buffer):
+    return canvas.Canvas(buffer, pagesize=A4)
+
+def draw_ticket_page(c, ticket_data, forms=False):
+    rupee_font = use_rupee_symbol()
+    rupee = "₹" if rupee_font else "Rs."
+
+    if forms:
+        # Forms run in their own graphics state, so their fonts and colours do not leak
+        define_template_forms(c)
+        c.doForm(PAGE_FORM)
+    else:
+        _draw_page_layer(c)
+    c.setFillColor(PRIMARY_COLOR)
+
+    # Ticket details
+    y = PAGE_HEIGHT-3.5*inch
     c.setFont("Helvetica", 12)
     details = [
         f"Booking Reference: {ticket_data['booking_ref']}",
@@ -59,7 +142,7 @@ def generate_ticket_pdf(ticket_data):
         f"Email: {ticket_data['email']}",
         f"Phone: {ticket_data['phone']}"
     ]
-    
+
     # Add ticket quantities and calculate price breakdown
     ticket_counts = []
     price_breakdown = []
@@ -79,60 +162,94 @@ def generate_ticket_pdf(ticket_data):
 
     if ticket_data.get('child_tickets', 0) > 0 and ticket_data['adult_tickets'] > 0:
         ticket_counts.append(f"Child Tickets: {ticket_data['child_tickets']} (Free)")
-    
+
     # Add booking details
     for line in details:
         c.drawString(1*inch, y, line)
         y -= 0.3*inch
-    
+
     # Add ticket information
     y -= 0.2*inch
     c.setFont("Helvetica-Bold", 12)
     c.drawString(1*inch, y, "TICKET DETAILS")
     y -= 0.3*inch
-    
+
     c.setFont("Helvetica", 12)
     for count in ticket_counts:
         c.drawString(1*inch, y, count)
         y -= 0.3*inch
-    
+
     # Add price breakdown
     y -= 0.2*inch
     c.setFont("Helvetica-Bold", 12)
     c.drawString(1*inch, y, "PRICE BREAKDOWN")
     y -= 0.3*inch
-    
-    c.setFont("NotoSans" if use_rupee_symbol else "Helvetica", 12)
+
+    c.setFont("NotoSans" if rupee_font else "Helvetica", 12)
     for price in price_breakdown:
         c.drawString(1*inch, y, price)
         y -= 0.3*inch
-    
+
     y -= 0.2*inch
     c.setFont("Helvetica-Bold", 12)
     c.drawString(1*inch, y, f"Total Amount: {rupee}{total_amount}")
-    
+
     # Instructions section
-    y -= 0.6*inch
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(1*inch, y, "IMPORTANT INSTRUCTIONS")
-    y -= 0.4*inch
-    
-    c.setFont("Helvetica", 11)
-    instructions = [
-        "• Please arrive 15 minutes before your scheduled visit time",
-        "• Present this ticket at the entrance (digital or printed)",
-        "• Photography is allowed without flash",
-        "• No food and beverages allowed inside",
-        "• Please maintain silence in the museum premises"
-    ]
-    
-    for instruction in instructions:
-        c.drawString(1*inch, y, instruction)
-        y -= 0.3*inch
-    
-    # Footer
-    c.setFont("Helvetica", 10)  # Changed from Helvetica-Italic to Helvetica
-    c.drawCentredString(width/2, 0.5*inch, "Thank you for visiting National Museum of India")
-    
+    if forms:
+        c.saveState()
+        c.translate(0, y - 0.6*inch)
+        c.doForm(INSTRUCTIONS_FORM)
+        c.restoreState()
+    else:
+        _draw_instructions_layer(c, y - 0.6*inch)
+
+def generate_ticket_pdf(ticket_data):
+    # Path-based API kept for callers that need a file on disk
+    pdf_bytes = render_ticket_pdf(ticket_data, persist=False)
+    return save_ticket_file(ticket_data['booking_ref'], pdf_bytes)
+
+def render_ticket_pdf(ticket_data, persist=None):
+    buffer = io.BytesIO()
+    c = new_ticket_canvas(buffer)
+    draw_ticket_page(c, ticket_data)
     c.save()
-    return filename
+    pdf_bytes = buffer.getvalue()
+
+    if PERSIST_TICKETS if persist is None else persist:
+        save_ticket_file(ticket_data['booking_ref'], pdf_bytes)
+    return pdf_bytes
+
+def ticket_data_from_booking(booking):
+    ticket_data = {field: booking.get(field) for field in TICKET_FIELDS}
+    for field in ('adult_tickets', 'student_tickets', 'child_tickets'):
+        ticket_data[field] = ticket_data[field] or 0
+    return ticket_data
+
+def render_ticket_batch(tickets):
+    return [render_ticket_pdf(ticket_data, persist=False) for ticket_data in tickets]
+
+def render_tickets_pdf(tickets):
+    """Render all tickets into one multi-page PDF, one ticket per page."""
+    buffer = io.BytesIO()
+    c = new_ticket_canvas(buffer)
+    for ticket_data in tickets:
+        draw_ticket_page(c, ticket_data, forms=True)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+def build_ticket_zip(tickets, pdfs):
+    buffer = io.BytesIO()
+    # PDF page streams are already compressed, so store entries as-is
+    names = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for ticket_data, pdf_bytes in zip(tickets, pdfs):
+            name = ticket_filename(ticket_data['booking_ref'])
+            # A repeated ref gets numbered copies rather than duplicate entries
+            stem, copy = name[:-len('.pdf')], 1
+            while name in names:
+                copy += 1
+                name = f"{stem}-{copy}.pdf"
+            names.add(name)
+            archive.writestr(name, pdf_bytes)
+    return buffer.getvalue()
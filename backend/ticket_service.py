@@ -0,0 +1,131 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+import asyncio
+import os
+import threading
+import time
+import uuid
+from cache import TTLCache
+from metrics import TICKET_RENDER_FAILURES, TICKET_RENDER_SECONDS
+from ticket_generator import render_ticket_pdf, render_ticket_batch, render_tickets_pdf
+
+
+class TicketQueueFull(Exception):
+    pass
+
+
+class TicketRenderService:
+    """Renders ticket PDFs on a process pool with a bounded number of pending jobs.
+
+    ReportLab rendering is CPU bound, so it runs in worker processes rather
+    than on the event loop. Once max_pending jobs are queued or running,
+    submit() raises TicketQueueFull and callers are expected to back off.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 job_ttl_seconds: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv('TICKET_RENDER_WORKERS', os.cpu_count() or 1))
+        self.max_pending = max_pending or int(os.getenv('TICKET_RENDER_MAX_PENDING', 100))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._jobs = TTLCache(
+            ttl_seconds=job_ttl_seconds or int(os.getenv('TICKET_JOB_TTL_SECONDS', 600)),
+            max_entries=10 * self.max_pending
+        )
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, ticket_data: Dict[str, Any]) -> str:
+        job_id, _ = self._submit(ticket_data)
+        return job_id
+
+    def _reserve(self, slots: int):
+        acquired = 0
+        while acquired < slots and self._slots.acquire(blocking=False):
+            acquired += 1
+        if acquired < slots:
+            for _ in range(acquired):
+                self._slots.release()
+            raise TicketQueueFull(f"{self.max_pending} tickets already pending")
+
+    def _run(self, func: Callable, *args, reserved: bool = False) -> Future:
+        if not reserved:
+            self._reserve(1)
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        start = time.perf_counter()
+        future.add_done_callback(lambda done: self._finished(done, start))
+        return future
+
+    def _finished(self, future: Future, start: float):
+        self._slots.release()
+        TICKET_RENDER_SECONDS.observe(time.perf_counter() - start, 'pool')
+        if not future.cancelled() and future.exception() is not None:
+            TICKET_RENDER_FAILURES.inc('pool')
+
+    def _submit(self, ticket_data: Dict[str, Any]) -> Tuple[str, Future]:
+        future = self._run(render_ticket_pdf, ticket_data)
+        job_id = uuid.uuid4().hex
+        self._jobs.set(job_id, future)
+        return job_id, future
+
+    def get_job(self, job_id: str) -> Optional[Future]:
+        return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        future = self.get_job(job_id)
+        if future is None:
+            return None
+        if not future.done():
+            return {'job_id': job_id, 'status': 'pending'}
+        error = future.exception()
+        if error is not None:
+            return {'job_id': job_id, 'status': 'failed', 'error': str(error)}
+        return {'job_id': job_id, 'status': 'done'}
+
+    def render_sync(self, ticket_data: Dict[str, Any]) -> bytes:
+        # For callers already on a worker thread; blocks until the PDF is rendered
+        return self._submit(ticket_data)[1].result()
+
+    async def render(self, ticket_data: Dict[str, Any]) -> bytes:
+        _, future = self._submit(ticket_data)
+        return await asyncio.wrap_future(future)
+
+    async def render_batch(self, tickets: List[Dict[str, Any]]) -> List[bytes]:
+        """Render one PDF per ticket, spreading chunks across every worker."""
+        chunk_size = max(1, min(50, -(-len(tickets) // self.max_workers)))
+        chunks = [tickets[i:i + chunk_size] for i in range(0, len(tickets), chunk_size)]
+        # Take all slots up front so a large batch is rejected as a whole
+        self._reserve(len(chunks))
+        futures = []
+        try:
+            for chunk in chunks:
+                futures.append(self._run(render_ticket_batch, chunk, reserved=True))
+        except Exception:
+            # _run gave back the failed chunk's slot; chunks never submitted give back theirs
+            for _ in range(len(chunks) - len(futures) - 1):
+                self._slots.release()
+            for future in futures:
+                future.cancel()
+            raise
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        return [pdf_bytes for chunk in results for pdf_bytes in chunk]
+
+    async def render_combined(self, tickets: List[Dict[str, Any]]) -> bytes:
+        return await asyncio.wrap_future(self._run(render_tickets_pdf, tickets))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+ticket_render_service = TicketRenderService()
@@ -0,0 +1,147 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import os
+import re
+
+# Built once at import rather than per call
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PHONE_SEPARATORS = (' ', '-', '(', ')', '.', '\t')
+
+DEFAULT_COUNTRY_CODE = os.getenv('PHONE_DEFAULT_COUNTRY_CODE', '91')
+NATIONAL_NUMBER_LENGTH = 10
+
+Normalizer = Callable[[Any], Optional[Any]]
+
+
+def normalize_command(message: str) -> str:
+    # Button values and keywords compare case-insensitively; free text keeps its case
+    return message.strip().lower()
+
+
+def normalize_name(value: str) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    return ' '.join(value.split())
+
+
+def normalize_email(value: str) -> Optional[str]:
+    """Return the address with its domain lowercased, or None if it is not valid.
+
+    The local part is left alone; mailbox names can be case-sensitive.
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not EMAIL_PATTERN.match(value):
+        return None
+    local, _, domain = value.rpartition('@')
+    return f"{local}@{domain.lower()}"
+
+
+def normalize_phone(value: str, country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """Return the number in E.164 form (+<country><number>), or None if it is not valid.
+
+    Accepts a 10-digit national number with optional separators, a leading 0
+    trunk prefix or the country code, and any other number written with a
+    leading + and 8 to 15 digits.
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    international = value.startswith('+')
+    digits = value[international:] if international else value
+    if not digits.isdigit():
+        # str.replace beats both a regex and str.translate for a handful of separators
+        for separator in PHONE_SEPARATORS:
+            digits = digits.replace(separator, '')
+        if not digits.isdigit():
+            return None
+    if not digits.isascii():
+        return None
+
+    national = None
+    if len(digits) == NATIONAL_NUMBER_LENGTH and not international:
+        national = digits
+    elif len(digits) == NATIONAL_NUMBER_LENGTH + 1 and digits[0] == '0' and not international:
+        national = digits[1:]
+    elif len(digits) == len(country_code) + NATIONAL_NUMBER_LENGTH and digits.startswith(country_code):
+        national = digits[len(country_code):]
+    if national is not None:
+        return f"+{country_code}{national}"
+
+    if international and 8 <= len(digits) <= 15 and digits[0] != '0':
+        return f"+{digits}"
+    return None
+
+
+def normalize_count(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isascii() or not value.isdigit():
+            return None
+        return int(value)
+    if isinstance(value, int) and value >= 0:
+        return value
+    return None
+
+
+def normalize_visit_date(value: Any) -> Optional[str]:
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip()
+
+
+FIELD_NORMALIZERS: Dict[str, Normalizer] = {
+    'name': normalize_name,
+    'email': normalize_email,
+    'phone': normalize_phone,
+    'adult_tickets': normalize_count,
+    'student_tickets': normalize_count,
+    'child_tickets': normalize_count,
+    'visit_date': normalize_visit_date
+}
+
+
+def validate_record(record: Dict[str, Any], required: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Normalise every known field of one record.
+
+    Returns the normalised copy and a field -> 'missing' / 'invalid' map,
+    which is empty when the record is valid. Unknown fields pass through.
+    """
+    normalized = dict(record)
+    errors = {}
+    for field in required:
+        if record.get(field) is None:
+            errors[field] = 'missing'
+    for field, value in record.items():
+        normalizer = FIELD_NORMALIZERS.get(field)
+        if normalizer is None or field in errors or value is None:
+            continue
+        result = normalizer(value)
+        if result is None:
+            errors[field] = 'invalid'
+        else:
+            normalized[field] = result
+    return normalized, errors
+
+
+def validate_batch(records: List[Any], required: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, str]]]:
+    """Validate a list of records, e.g. a bulk import or a group ticket request.
+
+    Returns the normalised records and the errors keyed by record index.
+    Records that are not dicts are reported with a '_record' error.
+    """
+    required = tuple(required)
+    normalized = []
+    errors = {}
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors[index] = {'_record': 'invalid'}
+            normalized.append(record)
+            continue
+        result, record_errors = validate_record(record, required)
+        if record_errors:
+            errors[index] = record_errors
+        normalized.append(result)
+    return normalized, errors
@@ -0,0 +1,254 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+import atexit
+import glob
+import os
+import queue
+import threading
+import time
+import logging
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+from metrics import WRITE_BEHIND_DEAD_LETTERS
+from file_lock import try_lock
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+AckCallback = Callable[[Dict[str, Any]], None]
+
+
+def already_inserted(write_error: Dict[str, Any]) -> bool:
+    """True for a duplicate key on _id only; a clash on any other unique index is a real conflict."""
+    if write_error.get('code') != DUPLICATE_KEY_ERROR:
+        return False
+    if 'keyPattern' in write_error:
+        return write_error['keyPattern'] == {'_id': 1}
+    # Servers before 4.4 only name the index in the message
+    return 'index: _id_ ' in write_error.get('errmsg', '')
+
+
+class WriteBehindQueue:
+    """Batches inserts into insert_many calls behind an append-only journal.
+
+    enqueue() appends the document to this process's journal and fsyncs it
+    before returning, so a caller can confirm to the visitor straight away.
+    A background thread drains the queue into insert_many batches, by size
+    or time window, and calls the on_ack hook once Mongo has the document.
+    Every document gets its _id before it is journaled, so replaying a
+    journal after a crash can only produce duplicate-_id errors, which are
+    treated as success. Journals left behind by dead processes are replayed
+    on startup.
+
+    Documents Mongo refuses (a duplicate booking_ref, a failed validation)
+    and batches still failing after WRITE_BEHIND_MAX_ATTEMPTS are appended
+    to dead-letter.jsonl in the journal directory instead of blocking the
+    queue; they are never acked.
+    """
+
+    def __init__(self, db, journal_dir: Optional[str] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, fsync: Optional[bool] = None):
+        self.db = db
+        self.journal_dir = journal_dir or os.getenv('WRITE_BEHIND_JOURNAL_DIR', 'write_behind')
+        self.batch_size = batch_size or int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval or int(os.getenv('WRITE_BEHIND_FLUSH_MS', 200)) / 1000
+        self.fsync = fsync if fsync is not None else os.getenv('WRITE_BEHIND_FSYNC', 'true').lower() == 'true'
+        self.max_attempts = int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', 10))
+        if self.max_attempts < 1:
+            raise ValueError(f"WRITE_BEHIND_MAX_ATTEMPTS must be at least 1, got {self.max_attempts}")
+        self.dead_letter_path = os.path.join(self.journal_dir, 'dead-letter.jsonl')
+
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any], Optional[AckCallback]]]" = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._dead_letter_lock = threading.Lock()
+        self._journaled = 0
+        self._persisted = 0
+        self._flush_failures = 0
+        self._stopping = threading.Event()
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # Start time in the name keeps a reused pid from appending to an orphaned journal
+        self.journal_path = os.path.join(self.journal_dir, f"journal-{os.getpid()}-{time.time_ns()}.jsonl")
+        self._journal = open(self.journal_path, 'ab')
+        if not try_lock(self._journal):
+            raise RuntimeError(f"Write-behind journal {self.journal_path} is locked by another process")
+
+        self.replay_orphaned_journals()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, collection: str, document: Dict[str, Any], on_ack: Optional[AckCallback] = None) -> ObjectId:
+        if not self._thread.is_alive():
+            # Nothing would ever flush it; fail the save instead of confirming it
+            raise RuntimeError("Write-behind writer is not running")
+        document = dict(document)
+        document.setdefault('_id', ObjectId())
+        line = json_util.dumps({'collection': collection, 'document': document}).encode('utf-8') + b'\n'
+        with self._journal_lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._journaled += 1
+        self._queue.put((collection, document, on_ack))
+        return document['_id']
+
+    def pending(self) -> int:
+        return self._journaled - self._persisted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'writer_alive': self._thread.is_alive(),
+            'pending': self.pending(),
+            'flush_failures': self._flush_failures
+        }
+
+    def _take_batch(self) -> List[Tuple[str, Dict[str, Any], Optional[AckCallback]]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, collection: str, documents: List[Dict[str, Any]]) -> Dict[int, str]:
+        """insert_many the documents; returns the error message for each one Mongo refused,
+        by index. Raises for failures worth retrying (network, write concern)."""
+        try:
+            self.db[collection].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            if e.details.get('writeConcernErrors'):
+                raise
+            # Documents replayed from a journal, or from a retried batch, may already be in Mongo
+            return {err['index']: err.get('errmsg', str(err))
+                    for err in e.details.get('writeErrors', []) if not already_inserted(err)}
+        return {}
+
+    def dead_letter(self, collection: str, documents: List[Dict[str, Any]], error: str):
+        lines = b''.join(
+            json_util.dumps({'collection': collection, 'document': document, 'error': error}).encode('utf-8') + b'\n'
+            for document in documents
+        )
+        with self._dead_letter_lock, open(self.dead_letter_path, 'ab') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        WRITE_BEHIND_DEAD_LETTERS.inc(collection, amount=len(documents))
+        logger.error(f"Moved {len(documents)} {collection} document(s) to {self.dead_letter_path}: {error}")
+
+    def _flush(self, batch) -> None:
+        grouped = defaultdict(list)
+        for item in batch:
+            grouped[item[0]].append(item)
+
+        for collection, items in grouped.items():
+            documents = [document for _, document, _ in items]
+            backoff = self.flush_interval
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    refused = self._insert(collection, documents)
+                    break
+                except Exception as e:
+                    if attempt == self.max_attempts:
+                        refused = dict.fromkeys(range(len(documents)), str(e))
+                        break
+                    logger.error(f"Write-behind flush to {collection} failed, retrying: {e}")
+                    if self._stopping.wait(backoff):
+                        return
+                    backoff = min(backoff * 2, 30)
+
+            if refused:
+                first_error = next(iter(refused.values()))
+                self.dead_letter(collection, [documents[index] for index in refused], first_error)
+            for index, (_, document, on_ack) in enumerate(items):
+                if on_ack is not None and index not in refused:
+                    try:
+                        on_ack(document)
+                    except Exception as e:
+                        logger.error(f"Write-behind ack hook failed: {e}")
+
+        with self._journal_lock:
+            self._persisted += len(batch)
+            if self._persisted == self._journaled:
+                # Everything journaled is in Mongo, so the journal can start over
+                self._journal.truncate(0)
+                if self.fsync:
+                    os.fsync(self._journal.fileno())
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # The batch stays in the journal, which is replayed once this process is gone
+                self._flush_failures += 1
+                logger.error(f"Write-behind flush of {len(batch)} document(s) failed; "
+                             f"they stay in {self.journal_path} for replay: {e}")
+
+    def replay_orphaned_journals(self):
+        for path in glob.glob(os.path.join(self.journal_dir, 'journal-*.jsonl')):
+            if path == self.journal_path:
+                continue
+            with open(path, 'r+b') as journal:
+                if not try_lock(journal):
+                    continue  # owned by a live process
+                grouped = defaultdict(list)
+                for raw in journal:
+                    try:
+                        entry = json_util.loads(raw)
+                    except ValueError:
+                        logger.error(f"Skipping torn write-behind journal entry in {path}")
+                        continue
+                    grouped[entry['collection']].append(entry['document'])
+                try:
+                    for collection, documents in grouped.items():
+                        refused = self._insert(collection, documents)
+                        if refused:
+                            self.dead_letter(collection, [documents[index] for index in refused],
+                                             next(iter(refused.values())))
+                except Exception as e:
+                    logger.error(f"Could not replay write-behind journal {path}: {e}")
+                    continue
+            os.remove(path)
+            logger.info(f"Replayed write-behind journal {path}")
+
+    def close(self, timeout: float = 10):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        with self._journal_lock:
+            self._journal.close()
+        if self._persisted == self._journaled:
+            os.remove(self.journal_path)
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def write_behind_enabled() -> bool:
+    return os.getenv('WRITE_BEHIND', 'false').lower() == 'true'
+
+
+def get_write_behind_queue(db) -> WriteBehindQueue:
+    """Return the process-wide write-behind queue; one journal per process."""
+    global _write_behind
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                _write_behind = WriteBehindQueue(db)
+    return _write_behind
@@ -0,0 +1,60 @@
+import axios from 'axios';
+
+const API_URL = 'http://localhost:5000';
+const WS_URL = `${API_URL.replace(/^http/, 'ws')}/chat/ws`;
+
+let socketReady = null;
+let socketUnavailable = false;
+let nextId = 1;
+const pending = new Map();
+
+// One WebSocket for the whole conversation, opened on the first message
+const connect = () => {
+    if (socketReady) return socketReady;
+    socketReady = new Promise((resolve, reject) => {
+        const ws = new WebSocket(WS_URL);
+        ws.onopen = () => resolve(ws);
+        ws.onerror = () => reject(new Error('WebSocket connection failed'));
+        ws.onclose = () => {
+            socketReady = null;
+            pending.forEach(({ reject: fail }) => fail(new Error('WebSocket closed')));
+            pending.clear();
+        };
+        ws.onmessage = (event) => {
+            const frame = JSON.parse(event.data);
+            const request = pending.get(frame.id);
+            if (!request) return;
+            if (frame.type === 'delta') {
+                if (request.onDelta) request.onDelta(frame.text);
+                return;
+            }
+            pending.delete(frame.id);
+            if (frame.type === 'done') {
+                request.resolve({ data: frame.response });
+            } else {
+                request.reject(new Error(frame.detail));
+            }
+        };
+    });
+    return socketReady;
+};
+
+// Sends one chat turn and resolves with { data } like axios. onDelta receives
+// partial reply text as the server streams it. Falls back to a plain POST when
+// the socket cannot be opened (e.g. the Flask backend, which has no /chat/ws).
+export const sendChatMessage = async (payload, onDelta) => {
+    let ws;
+    try {
+        if (socketUnavailable) throw new Error('WebSocket unavailable');
+        ws = await connect();
+    } catch {
+        socketReady = null;
+        socketUnavailable = true;
+        return axios.post(`${API_URL}/chat`, payload);
+    }
+    return new Promise((resolve, reject) => {
+        const id = nextId++;
+        pending.set(id, { resolve, reject, onDelta });
+        ws.send(JSON.stringify({ ...payload, id }));
+    });
+};
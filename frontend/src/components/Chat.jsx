@@ -3,6 +3,7 @@ import { Paper, Box, TextField, Button, Container } from '@mui/material';
 import ChatMessage from './ChatMessage';
 import TicketModal from './TicketModal';
 import axios from 'axios';
+import { sendChatMessage } from '../chatSocket';
 import DatePicker from 'react-datepicker';
 import "react-datepicker/dist/react-datepicker.css";
 
@@ -18,6 +19,7 @@ const Chat = () => {
     }]);
     const [inputMessage, setInputMessage] = useState('');
     const [currentState, setCurrentState] = useState('initial_options');
+    const [sessionId, setSessionId] = useState(null);
     const [bookingData, setBookingData] = useState({});
     const [showPaymentButton, setShowPaymentButton] = useState(false);
     const [isProcessingPayment, setIsProcessingPayment] = useState(false);
@@ -32,6 +34,24 @@ const Chat = () => {
     const [showBookingOption, setShowBookingOption] = useState(false);
     const [disabledMessageIndexes, setDisabledMessageIndexes] = useState(new Set());
 
+    // Streamed reply text fills a placeholder bubble until the full response arrives
+    const appendStreamedText = (text) => {
+        setMessages(prev => {
+            const last = prev[prev.length - 1];
+            if (last && last.streaming) {
+                return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+            }
+            return [...prev, { content: text, isUser: false, type: 'text', streaming: true }];
+        });
+    };
+
+    const addBotMessage = (message) => {
+        setMessages(prev => {
+            const last = prev[prev.length - 1];
+            return [...(last && last.streaming ? prev.slice(0, -1) : prev), message];
+        });
+    };
+
     const handleOptionClick = async (value) => {
         // Disable the clicked options immediately
         setMessages(prev => {
@@ -45,13 +65,15 @@ const Chat = () => {
         });
 
         try {
-            const response = await axios.post('http://localhost:5000/chat', {
+            const response = await sendChatMessage({
                 message: value,
-                currentState: currentState
-            });
+                currentState: currentState,
+                sessionId: sessionId
+            }, appendStreamedText);
 
             if (response.data) {
                 setCurrentState(response.data.state);
+                setSessionId(response.data.session_id);
                 setShowInitialOptions(!!response.data.show_initial_buttons);
                 setShowBookingOption(!!response.data.show_booking_option);
 
@@ -70,18 +92,18 @@ const Chat = () => {
 
                 // Add new message with fresh options
                 if (response.data.options) {
-                    setMessages(prev => [...prev, {
+                    addBotMessage({
                         content: response.data.response,
                         isUser: false,
                         type: 'options',
                         options: response.data.options
-                    }]);
+                    });
                 } else {
-                    setMessages(prev => [...prev, {
+                    addBotMessage({
                         content: response.data.response,
                         isUser: false,
                         type: 'text'
-                    }]);
+                    });
                 }
             }
         } catch (error) {
@@ -110,13 +132,15 @@ const Chat = () => {
 
         try {
             // Direct API call instead of using handleOptionClick
-            const response = await axios.post('http://localhost:5000/chat', {
+            const response = await sendChatMessage({
                 message: userMessageContent,
-                currentState: currentState
-            });
+                currentState: currentState,
+                sessionId: sessionId
+            }, appendStreamedText);
 
             if (response.data) {
                 setCurrentState(response.data.state);
+                setSessionId(response.data.session_id);
 
                 if (response.data.booking_info) {
                     setBookingData(response.data.booking_info);
@@ -133,18 +157,18 @@ const Chat = () => {
 
                 // Add bot response
                 if (response.data.options) {
-                    setMessages(prev => [...prev, {
+                    addBotMessage({
                         content: response.data.response,
                         isUser: false,
                         type: 'options',
                         options: response.data.options
-                    }]);
+                    });
                 } else {
-                    setMessages(prev => [...prev, {
+                    addBotMessage({
                         content: response.data.response,
                         isUser: false,
                         type: 'text'
-                    }]);
+                    });
                 }
             }
         } catch (error) {
@@ -163,24 +187,26 @@ const Chat = () => {
             // Simulate payment processing
             await new Promise(resolve => setTimeout(resolve, 2000));
 
-            const response = await axios.post('http://localhost:5000/chat', {
+            const response = await sendChatMessage({
                 message: 'payment_completed',
-                currentState: currentState
-            });
+                currentState: currentState,
+                sessionId: sessionId
+            }, appendStreamedText);
 
             if (response.data) {
                 setCurrentState(response.data.state);
+                setSessionId(response.data.session_id);
 
                 if (response.data.ticket_data) {
                     setTicketData(response.data.ticket_data);
                 }
 
                 // Add payment success message
-                setMessages(prev => [...prev, {
+                addBotMessage({
                     content: response.data.response,
                     isUser: false,
                     type: 'text'
-                }]);
+                });
 
                 // Show download button
                 setShowDownloadButton(true);
@@ -224,10 +250,14 @@ const Chat = () => {
                 throw new Error('No ticket data available');
             }
 
+            // Repeat clicks for the same booking reuse the first rendered PDF
             const response = await axios.post(
                 'http://localhost:5000/generate-ticket',
                 ticketData,
-                { responseType: 'blob' }
+                {
+                    responseType: 'blob',
+                    headers: { 'Idempotency-Key': `ticket-${ticketData.booking_ref}` }
+                }
             );
 
             const url = window.URL.createObjectURL(new Blob([response.data]));